@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+#author = will nyarko
+#file name = agent_bulk.py
+#description = Fetch many ArchivesSpace agent records per request through the agent listing endpoints (id_set[] and pages)
+"""
+
+import logging
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+
+from src.api.retry import retry_with_backoff
+
+# Agent listing endpoints that accept id_set[]
+AGENT_TYPES = ("people", "corporate_entities", "families")
+
+# IDs per listing request; ArchivesSpace caps listings at its max_page_size (250 by default)
+DEFAULT_CHUNK_SIZE = 100
+
+AGENT_URI_PATTERN = re.compile(r"/agents/(people|corporate_entities|families)/(\d+)/?$")
+
+def split_agent_uri(agent_uri):
+    """Return (agent_type, id) for an agent URI or full agent URL, or None if it isn't one."""
+    match = AGENT_URI_PATTERN.search(str(agent_uri).strip())
+    if not match:
+        return None
+    return match.group(1), int(match.group(2))
+
+def canonical_agent_uri(agent_uri):
+    """Normalize an agent URI or full agent URL to /agents/<type>/<id>, or None if it isn't one."""
+    parsed = split_agent_uri(agent_uri)
+    if parsed is None:
+        return None
+    return f"/agents/{parsed[0]}/{parsed[1]}"
+
+def group_agent_uris(agent_uris):
+    """Group URIs by agent type.
+
+    Returns ({agent_type: {id: [uris]}}, unrecognized_uris). Several spellings of
+    the same agent (full URL vs. path) map to one ID and are all answered.
+    """
+    groups = {agent_type: {} for agent_type in AGENT_TYPES}
+    unrecognized = []
+    for agent_uri in agent_uris:
+        parsed = split_agent_uri(agent_uri)
+        if parsed is None:
+            unrecognized.append(agent_uri)
+            continue
+        agent_type, agent_id = parsed
+        groups[agent_type].setdefault(agent_id, []).append(agent_uri)
+    return groups, unrecognized
+
+@retry_with_backoff(
+    max_retries=3,
+    allowed_exceptions=(requests.exceptions.RequestException, ValueError)
+)
+def get_agent_chunk(client, agent_type, agent_ids):
+    """GET up to one chunk of agents of one type in a single request."""
+    response = client.get(f"/agents/{agent_type}", params={"id_set[]": list(agent_ids)})
+    response.raise_for_status()
+    records = response.json()
+    if not isinstance(records, list):
+        raise ValueError(f"Unexpected id_set response for /agents/{agent_type}: {type(records).__name__}")
+    return records
+
+def fetch_agents_bulk(client, agent_uris, chunk_size=DEFAULT_CHUNK_SIZE, fetch_one=None):
+    """
+    Fetch agent records with one listing request per chunk of IDs of the same type.
+
+    Returns (records, missing): records maps each input URI to its agent JSON and
+    missing lists the input URIs the listings did not return (deleted agents,
+    non-agent URIs, or chunks whose request failed). With fetch_one(client, uri)
+    given, every missing URI is retried with a single GET instead; URIs that still
+    fail stay in missing.
+    """
+    groups, missing = group_agent_uris(agent_uris)
+    records = {}
+
+    for agent_type, ids_to_uris in groups.items():
+        agent_ids = sorted(ids_to_uris)
+        for start in range(0, len(agent_ids), chunk_size):
+            chunk = agent_ids[start:start + chunk_size]
+            try:
+                chunk_records = get_agent_chunk(client, agent_type, chunk)
+            except Exception as e:
+                logging.warning(f"Bulk fetch of {len(chunk)} {agent_type} failed ({str(e)}), "
+                                f"falling back to single requests")
+                chunk_records = []
+
+            returned = set()
+            for record in chunk_records:
+                parsed = split_agent_uri(record.get('uri', ''))
+                if parsed is None or parsed[1] not in ids_to_uris:
+                    continue
+                returned.add(parsed[1])
+                for agent_uri in ids_to_uris[parsed[1]]:
+                    records[agent_uri] = record
+
+            for agent_id in chunk:
+                if agent_id not in returned:
+                    missing.extend(ids_to_uris[agent_id])
+
+    if fetch_one is None or not missing:
+        return records, missing
+
+    still_missing = []
+    for agent_uri in missing:
+        try:
+            records[agent_uri] = fetch_one(client, agent_uri)
+        except Exception as e:
+            logging.error(f"Single fetch of {agent_uri} failed: {str(e)}")
+            still_missing.append(agent_uri)
+    return records, still_missing
+
+# Records per listing page when enumerating every agent
+DEFAULT_PAGE_SIZE = 250
+
+@retry_with_backoff(
+    max_retries=3,
+    allowed_exceptions=(requests.exceptions.RequestException, ValueError)
+)
+def get_agent_page(client, agent_type, page, page_size=DEFAULT_PAGE_SIZE, modified_since=None):
+    """GET one page of an agent listing; returns the paginated response dict.
+    
+    modified_since (seconds since the epoch) limits the listing to agents changed after it.
+    """
+    params = {"page": page, "page_size": page_size}
+    if modified_since is not None:
+        params["modified_since"] = int(modified_since)
+    response = client.get(f"/agents/{agent_type}", params=params)
+    response.raise_for_status()
+    listing = response.json()
+    if not isinstance(listing, dict) or "results" not in listing:
+        raise ValueError(f"Unexpected listing response for /agents/{agent_type} page {page}")
+    return listing
+
+def iter_agent_pages(client, agent_type, page_size=DEFAULT_PAGE_SIZE, num_workers=4, max_pages=None,
+                     modified_since=None):
+    """
+    Yield (page, last_page, records, seconds) for every page of an agent listing.
+
+    The first page is fetched alone to learn last_page; the rest are fetched on
+    num_workers threads and yielded as they complete, so pages arrive out of order.
+    A page that still fails after retries is logged and yielded with records=None.
+    """
+    started = time.monotonic()
+    first = get_agent_page(client, agent_type, 1, page_size, modified_since)
+    last_page = int(first.get("last_page") or 1)
+    if max_pages:
+        last_page = min(last_page, max_pages)
+    yield 1, last_page, first["results"], time.monotonic() - started
+
+    def fetch(page):
+        page_started = time.monotonic()
+        try:
+            records = get_agent_page(client, agent_type, page, page_size, modified_since)["results"]
+        except Exception as e:
+            logging.error(f"Failed to fetch /agents/{agent_type} page {page}: {str(e)}")
+            records = None
+        return page, records, time.monotonic() - page_started
+
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        futures = [executor.submit(fetch, page) for page in range(2, last_page + 1)]
+        for future in as_completed(futures):
+            page, records, seconds = future.result()
+            yield page, last_page, records, seconds
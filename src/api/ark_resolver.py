@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+#author = will nyarko
+#file name = ark_resolver.py
+#description = Offline SNAC ARK resolution: every known ARK mapped to the terminal ARK of its merge chain
+"""
+
+import argparse
+import logging
+import re
+import sys
+import time
+from pathlib import Path
+
+# Add project root to sys.path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from src.api.cache_store import DEFAULT_WRITE_BATCH, BufferedSQLite
+
+# Shared by query_snac.py, finalize_snac_arks.py and the updaters
+ARK_TABLE_PATH = Path("cache/snac_ark_resolution.sqlite")
+
+# Written by earlier SNAC harvests: "MERGED: old=<ark> -> new=<ark>"
+ID_CHANGE_LOG = Path("logs/snac_id_changes.log")
+
+# SNAC's ARK prefix; ARKs are stored as f"{SNAC_ARK_PREFIX}<id>"
+SNAC_ARK_PREFIX = "http://n2t.net/ark:/99166/"
+
+_MERGED_LINE = re.compile(r"MERGED: old=(\S+)\s*-> new=(\S+)")
+
+def canonical_ark(ark):
+    """http://n2t.net/ark:/99166/<id> for any spelling of a SNAC ARK (https, bare id, ...), or None."""
+    if ark is None or not isinstance(ark, str):
+        return None
+    ark_id = ark.strip().rstrip("/").split("/")[-1]
+    return f"{SNAC_ARK_PREFIX}{ark_id}" if ark_id else None
+
+def parse_id_change_log(path=ID_CHANGE_LOG):
+    """Yield (old_ark, new_ark) for every MERGED line of an ID-change log."""
+    path = Path(path)
+    if not path.exists():
+        return
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            match = _MERGED_LINE.search(line)
+            if match:
+                yield match.group(1), match.group(2)
+
+class ArkResolutionTable(BufferedSQLite):
+    """
+    Union-find over SNAC merges, kept in SQLite between runs.
+
+    Each merge old -> new links the root of old's chain under the root of new's,
+    so the root is always the terminal (surviving) ARK, however long the chain
+    (A -> B -> C) and in whatever order its links were learned. Links always
+    point from the merged ARK to the survivor, so there is no union by rank;
+    path compression in resolve() flattens chains instead, and flush() stores
+    every ARK's terminal directly. After loading, a lookup is one dict access.
+    Merges that would close a cycle are ignored. A merge of an ARK that was
+    already merged elsewhere links the two chains' terminals, and that link is
+    stored as an edge of its own so the resolution survives a reload.
+    """
+
+    FIELDS = ("ark", "merged_into", "terminal", "source", "updated_at")
+
+    def __init__(self, db_path=ARK_TABLE_PATH, write_batch=DEFAULT_WRITE_BATCH):
+        super().__init__(
+            db_path,
+            "CREATE TABLE IF NOT EXISTS arks ("
+            "ark TEXT PRIMARY KEY, merged_into TEXT NOT NULL, terminal TEXT NOT NULL, "
+            "source TEXT, updated_at REAL NOT NULL)",
+            "INSERT OR REPLACE INTO arks (ark, merged_into, terminal, source, updated_at) VALUES (?, ?, ?, ?, ?)",
+            write_batch
+        )
+        # ark -> (ark it was merged into, where we learned it)
+        self._edges = {}
+        # Union-find parents; terminals stored last time, to write only what changed
+        self._parent = {}
+        self._stored = {}
+        for ark, merged_into, terminal, source in self._query(
+                "SELECT ark, merged_into, terminal, source FROM arks"):
+            self._edges[ark] = (merged_into, source)
+            self._parent[ark] = terminal
+            self._stored[ark] = terminal
+
+    def _find(self, ark):
+        root = ark
+        while root in self._parent:
+            root = self._parent[root]
+        # Path compression: point everything on the way straight at the root
+        while ark != root:
+            self._parent[ark], ark = root, self._parent[ark]
+        return root
+
+    def resolve(self, ark):
+        """Terminal ARK for ark (ark itself, canonicalized, if it was never merged); None for no ARK."""
+        ark = canonical_ark(ark)
+        if ark is None:
+            return None
+        with self._lock:
+            return self._find(ark)
+
+    def current_ark(self, ark):
+        """The terminal ARK if ark was merged, else ark exactly as given (so unmerged ARKs keep their spelling)."""
+        terminal = self.resolve(ark)
+        return ark if terminal is None or terminal == canonical_ark(ark) else terminal
+
+    def is_merged(self, ark):
+        ark = canonical_ark(ark)
+        return ark is not None and self.resolve(ark) != ark
+
+    def add_merge(self, old_ark, new_ark, source="log"):
+        """Record that old_ark was merged into new_ark; returns False if it was ignored."""
+        old_ark, new_ark = canonical_ark(old_ark), canonical_ark(new_ark)
+        if not old_ark or not new_ark or old_ark == new_ark:
+            return False
+        with self._lock:
+            old_root, new_root = self._find(old_ark), self._find(new_ark)
+            if old_root == new_root:
+                # Already implied by known merges, unless old_ark is the survivor itself
+                if old_ark == old_root:
+                    logging.warning(f"Ignoring merge {old_ark} -> {new_ark}: it would close a cycle")
+                return False
+            if old_ark == old_root:
+                self._edges[old_ark] = (new_ark, source)
+            else:
+                # old_ark already resolved to old_root: old_root's chain now ends in new_root.
+                # Only edges are stored, so the reparent is stored as one too.
+                logging.warning(f"Merge {old_ark} -> {new_ark} conflicts with its known terminal {old_root}; "
+                                f"linking {old_root} -> {new_root}")
+                self._edges[old_root] = (new_root, source)
+            self._parent[old_root] = new_root
+            return True
+
+    def load_id_change_log(self, path=ID_CHANGE_LOG):
+        """Add every MERGED line of an ID-change log; returns the number of new merges."""
+        added = sum(self.add_merge(old_ark, new_ark, "log") for old_ark, new_ark in parse_id_change_log(path))
+        logging.info(f"Loaded {added} new merges from {path}")
+        return added
+
+    def flush(self):
+        """Store the current terminal of every merged ARK whose terminal changed."""
+        with self._lock:
+            now = time.time()
+            for ark, (merged_into, source) in self._edges.items():
+                terminal = self._find(ark)
+                if self._stored.get(ark) != terminal:
+                    self._pending[ark] = (ark, merged_into, terminal, source, now)
+                    self._stored[ark] = terminal
+            super().flush()
+
+    def count(self):
+        """Number of ARKs known to be merged into another."""
+        with self._lock:
+            return len(self._edges)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+def main():
+    """Build the ARK resolution table from the ID-change log, or resolve ARKs with it."""
+    parser = argparse.ArgumentParser(description="Resolve SNAC ARKs to the terminal ARK of their merge chain")
+    parser.add_argument("--table", default=str(ARK_TABLE_PATH), help="ARK resolution table (SQLite)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build = subparsers.add_parser("build", help="Add the merges from an ID-change log to the table")
+    build.add_argument("--log", default=str(ID_CHANGE_LOG), help="Log with 'MERGED: old=... -> new=...' lines")
+    resolve = subparsers.add_parser("resolve", help="Print the terminal ARK of each ARK")
+    resolve.add_argument("arks", nargs="+")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    with ArkResolutionTable(args.table) as table:
+        if args.command == "build":
+            table.load_id_change_log(args.log)
+            logging.info(f"{table.count()} merged ARKs in {args.table}")
+        else:
+            for ark in args.arks:
+                print(f"{ark} -> {table.resolve(ark)}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
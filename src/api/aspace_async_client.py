@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+#author = will nyarko
+#file name = aspace_async_client.py
+#description = asyncio ArchivesSpace API client for high-concurrency read workloads
+"""
+
+import asyncio
+import time
+import aiohttp
+
+from src.api.aspace_client import SESSION_EXPIRED_STATUSES, is_overload_status
+
+# Default cap on simultaneous open connections to the ArchivesSpace host
+DEFAULT_MAX_CONNECTIONS = 100
+
+class AsyncArchivesSpaceClient:
+    """
+    aiohttp counterpart to ArchivesSpaceClient for the async fetch engine.
+
+    Authentication stays on the synchronous client; this class reuses its session
+    token so there is a single login code path, and when a request is rejected as
+    expired it asks that client to refresh the token and replays the request once.
+    Use it as an async context manager so the connector and its keep-alive
+    connections are closed cleanly.
+    """
+
+    def __init__(self, api_url, session_token, max_connections=DEFAULT_MAX_CONNECTIONS, controller=None,
+                 rate_limits=None, auth_client=None, timeout=None):
+        self.api_url = api_url.rstrip('/')
+        self.session_token = session_token
+        self.auth_client = auth_client
+        self.timeout = timeout
+        self.max_connections = max(1, int(max_connections))
+        self.controller = controller
+        self.rate_limits = rate_limits or {}
+        self.session = None
+
+    @classmethod
+    def from_client(cls, client, max_connections=DEFAULT_MAX_CONNECTIONS):
+        """Create an async client sharing the base URL and token of an authenticated ArchivesSpaceClient."""
+        if not client.session_token:
+            raise ValueError("ArchivesSpaceClient must be authenticated before creating an async client")
+        return cls(client.api_url, client.session_token, max_connections=max_connections,
+                   controller=client.controller, rate_limits=client.rate_limits, auth_client=client,
+                   timeout=client.timeout)
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(limit=self.max_connections, limit_per_host=self.max_connections)
+        timeout = None
+        if self.timeout:
+            connect_timeout, read_timeout = self.timeout
+            timeout = aiohttp.ClientTimeout(total=None, sock_connect=connect_timeout, sock_read=read_timeout)
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=timeout,
+            headers={"Accept": "application/json"}
+        )
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, tb):
+        await self.session.close()
+
+    def url_for(self, uri):
+        """Build a full API URL from an ArchivesSpace URI such as /agents/people/123."""
+        uri = uri.strip()
+        if uri.startswith(self.api_url):
+            uri = uri[len(self.api_url):]
+        if not uri.startswith('/'):
+            uri = f"/{uri}"
+        return f"{self.api_url}{uri}"
+
+    async def get_json(self, uri, **kwargs):
+        """GET an ArchivesSpace URI and return the decoded JSON body.
+
+        Raises aiohttp.ClientResponseError for non-2xx responses.
+        """
+        token = self.session_token
+        try:
+            return await self._get_json_limited(uri, **kwargs)
+        except aiohttp.ClientResponseError as e:
+            if e.status not in SESSION_EXPIRED_STATUSES or self.auth_client is None:
+                raise
+        # The login is blocking; run it off the loop. Concurrent callers with the same
+        # stale token are collapsed into one login by the sync client.
+        self.session_token = await asyncio.to_thread(self.auth_client.refresh_token, token)
+        return await self._get_json_limited(uri, **kwargs)
+
+    async def _get_json_limited(self, uri, **kwargs):
+        """Single rate-limited, concurrency-gated GET."""
+        limiter = self.rate_limits.get("GET")
+        if limiter:
+            await limiter.acquire_async()
+
+        if self.controller is None:
+            return await self._get_json(uri, **kwargs)
+
+        async with self.controller.async_slot():
+            started = time.monotonic()
+            try:
+                data = await self._get_json(uri, **kwargs)
+            except aiohttp.ClientResponseError as e:
+                self.controller.record(time.monotonic() - started, failed=is_overload_status(e.status))
+                raise
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                self.controller.record(time.monotonic() - started, failed=True)
+                raise
+            self.controller.record(time.monotonic() - started)
+            return data
+
+    async def _get_json(self, uri, **kwargs):
+        """Single GET with no gating or measurement."""
+        headers = {"X-ArchivesSpace-Session": self.session_token}
+        async with self.session.get(self.url_for(uri), headers=headers, **kwargs) as response:
+            response.raise_for_status()
+            return await response.json(content_type=None)
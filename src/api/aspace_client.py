@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+#author = will nyarko
+#file name = aspace_client.py
+#description = Shared ArchivesSpace API client with a pooled keep-alive session
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from src.api.retry import DeadlineExceeded, deadline_remaining
+
+# Default number of keep-alive connections held open to the ArchivesSpace host.
+# Scripts that run worker threads should size the pool to at least their worker count.
+DEFAULT_POOL_SIZE = 10
+
+# (connect, read) timeouts in seconds for every request; no call may hang forever
+DEFAULT_TIMEOUT = (10, 60)
+
+# ArchivesSpace answers an expired or invalidated session token with one of these
+SESSION_EXPIRED_STATUSES = (401, 403, 412)
+
+# Tokens are reused across script launches until this many seconds after login
+# (ArchivesSpace's default session_expire_after_seconds is 3600)
+DEFAULT_TOKEN_LIFETIME = 3600
+TOKEN_CACHE_PATH = Path("cache/aspace_session_tokens.json")
+
+# A token this fresh is not refreshed again: a rejection is then a real permission
+# error, and logging in for every such response would flood the server with logins
+MIN_RELOGIN_INTERVAL = 30
+
+def is_overload_status(status_code):
+    """True for responses that indicate the server is under pressure."""
+    return status_code >= 500 or status_code == 429
+
+class ArchivesSpaceClient:
+    """
+    Thin wrapper around a requests.Session for the ArchivesSpace API.
+
+    The client owns the base URL, the session token and a connection pool that is
+    sized for the number of threads sharing it, so every GET/POST reuses an open
+    TCP+TLS connection instead of negotiating a new one per agent record.
+
+    The session token is managed here as well: ensure_authenticated() reuses a
+    still-valid token cached on disk by an earlier run, and any request answered
+    with 401/403/412 triggers a single re-login (other threads wait for it) before
+    the request is replayed once.
+
+    Every request carries (connect, read) timeouts, and inside a record_deadline()
+    block the read timeout is shortened so a request never outlives the record's budget.
+
+    An optional AIMDController gates every request and is fed its latency and
+    overload signal (5xx/429, timeouts, connection errors). rate_limits maps an
+    HTTP method to a shared TokenBucket that every request of that method draws from.
+    """
+
+    def __init__(self, api_url, username, password, pool_size=DEFAULT_POOL_SIZE, controller=None,
+                 rate_limits=None, token_lifetime=DEFAULT_TOKEN_LIFETIME, token_cache_path=TOKEN_CACHE_PATH,
+                 timeout=DEFAULT_TIMEOUT):
+        self.api_url = api_url.rstrip('/')
+        self.username = username
+        self.password = password
+        self.pool_size = max(1, int(pool_size))
+        self.timeout = timeout
+        self.session_token = None
+        self.token_lifetime = token_lifetime
+        self.token_cache_path = Path(token_cache_path) if token_cache_path else None
+        self._auth_lock = threading.RLock()
+        self._logged_in_at = 0
+        self.controller = controller
+        self.rate_limits = rate_limits or {}
+
+        self.session = requests.Session()
+        # pool_block=True makes extra threads wait for a free connection rather than
+        # opening throwaway connections that are discarded after a single request
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=self.pool_size,
+            pool_block=True
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"Accept": "application/json"})
+
+    @classmethod
+    def from_config(cls, config, api_url=None, pool_size=DEFAULT_POOL_SIZE, controller=None,
+                    rate_limits=None, timeout=DEFAULT_TIMEOUT):
+        """Create a client from the project config.json structure."""
+        aspace_config = config["credentials"]["archivesspace_api"]
+        return cls(
+            api_url or aspace_config["api_url"],
+            aspace_config["username"],
+            aspace_config["password"],
+            pool_size=pool_size,
+            controller=controller,
+            rate_limits=rate_limits,
+            token_lifetime=aspace_config.get("session_lifetime", DEFAULT_TOKEN_LIFETIME),
+            timeout=timeout
+        )
+
+    def url_for(self, uri):
+        """Build a full API URL from an ArchivesSpace URI such as /agents/people/123."""
+        uri = uri.strip()
+        if uri.startswith(self.api_url):
+            uri = uri[len(self.api_url):]
+        if not uri.startswith('/'):
+            uri = f"/{uri}"
+        return f"{self.api_url}{uri}"
+
+    def _token_cache_key(self):
+        return f"{self.api_url}|{self.username}"
+
+    def _load_cached_token(self):
+        if not self.token_cache_path or not self.token_cache_path.exists():
+            return None
+        try:
+            with open(self.token_cache_path, "r", encoding="utf-8") as f:
+                entry = json.load(f).get(self._token_cache_key())
+        except (OSError, ValueError):
+            return None
+        if entry and entry.get("expires_at", 0) > time.time():
+            return entry.get("token")
+        return None
+
+    def _save_cached_token(self, token):
+        if not self.token_cache_path:
+            return
+        try:
+            tokens = {}
+            if self.token_cache_path.exists():
+                with open(self.token_cache_path, "r", encoding="utf-8") as f:
+                    tokens = json.load(f)
+            tokens[self._token_cache_key()] = {
+                "token": token,
+                "expires_at": time.time() + self.token_lifetime
+            }
+            self.token_cache_path.parent.mkdir(parents=True, exist_ok=True)
+            # Write-then-rename so a concurrent launch never reads a half-written file
+            tmp_path = self.token_cache_path.with_suffix(f".{os.getpid()}.tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(tokens, f)
+            os.chmod(tmp_path, 0o600)
+            os.replace(tmp_path, self.token_cache_path)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Could not cache ArchivesSpace session token: {str(e)}")
+
+    def _set_token(self, token):
+        self.session_token = token
+        self.session.headers.update({"X-ArchivesSpace-Session": token})
+
+    def authenticate(self):
+        """Log in to ArchivesSpace and attach the session token to the pooled session."""
+        with self._auth_lock:
+            login_url = f"{self.api_url}/users/{self.username}/login"
+            response = self.session.post(login_url, params={"password": self.password}, timeout=self.timeout)
+            response.raise_for_status()
+            token = response.json().get("session")
+
+            if not token:
+                raise ValueError("Authentication failed: no session token returned.")
+
+            self._set_token(token)
+            self._save_cached_token(token)
+            self._logged_in_at = time.time()
+            return token
+
+    def ensure_authenticated(self):
+        """Reuse an unexpired token from the on-disk cache, logging in only if there is none."""
+        if self.session_token:
+            return self.session_token
+        token = self._load_cached_token()
+        if token:
+            logging.info("Reusing cached ArchivesSpace session token")
+            self._set_token(token)
+            return token
+        return self.authenticate()
+
+    def refresh_token(self, stale_token):
+        """Re-authenticate after stale_token was rejected.
+
+        Only the first thread to report a given stale token logs in; threads that
+        arrive later see the token has already changed and reuse the new one.
+        """
+        with self._auth_lock:
+            if self.session_token and self.session_token != stale_token:
+                return self.session_token
+            if time.time() - self._logged_in_at < MIN_RELOGIN_INTERVAL:
+                return self.session_token
+            logging.info("ArchivesSpace session expired, re-authenticating")
+            return self.authenticate()
+
+    def request(self, method, uri, **kwargs):
+        """Issue a request, re-authenticating and replaying it once if the session expired."""
+        token = self.session_token
+        response = self._send(method, uri, **kwargs)
+        if response.status_code in SESSION_EXPIRED_STATUSES and self.username:
+            self.refresh_token(token)
+            response = self._send(method, uri, **kwargs)
+        return response
+
+    def _send(self, method, uri, **kwargs):
+        """Single rate-limited, concurrency-gated request."""
+        kwargs.setdefault("timeout", self.timeout)
+        remaining = deadline_remaining()
+        if remaining is not None:
+            if remaining <= 0:
+                raise DeadlineExceeded(f"Record deadline reached before {method} {uri}")
+            # requests also takes a single number (both timeouts) or None (no timeout)
+            timeout = kwargs["timeout"]
+            if timeout is None:
+                timeout = (remaining, remaining)
+            connect_timeout, read_timeout = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+            kwargs["timeout"] = (min(connect_timeout, remaining), min(read_timeout, remaining))
+
+        limiter = self.rate_limits.get(method.upper())
+        if limiter:
+            limiter.acquire()
+
+        if self.controller is None:
+            return self.session.request(method, self.url_for(uri), **kwargs)
+
+        with self.controller.slot():
+            started = time.monotonic()
+            try:
+                response = self.session.request(method, self.url_for(uri), **kwargs)
+            except (requests.exceptions.Timeout, requests.exceptions.ConnectionError):
+                self.controller.record(time.monotonic() - started, failed=True)
+                raise
+            self.controller.record(time.monotonic() - started,
+                                   failed=is_overload_status(response.status_code))
+            return response
+
+    def get(self, uri, **kwargs):
+        """Issue a GET against an ArchivesSpace URI using the pooled session."""
+        return self.request("GET", uri, **kwargs)
+
+    def post(self, uri, **kwargs):
+        """Issue a POST against an ArchivesSpace URI using the pooled session."""
+        return self.request("POST", uri, **kwargs)
+
+    def get_json(self, uri, **kwargs):
+        """GET an ArchivesSpace URI and return the decoded JSON body."""
+        response = self.get(uri, **kwargs)
+        response.raise_for_status()
+        return response.json()
+
+    def close(self):
+        """Close all pooled connections."""
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
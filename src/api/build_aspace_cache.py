@@ -13,6 +13,7 @@ import pandas as pd
 import os
 import sys
 import argparse
+import asyncio
 from datetime import datetime
 from pathlib import Path
 from concurrent.futures import ThreadPoolExecutor, as_completed
@@ -20,6 +21,17 @@ from concurrent.futures import ThreadPoolExecutor, as_completed
 # Add project root to sys.path
 sys.path.insert(0, str(Path(__file__).parent.parent.parent))
 
+from src.api.agent_bulk import (AGENT_TYPES, DEFAULT_PAGE_SIZE, canonical_agent_uri, fetch_agents_bulk,
+                                iter_agent_pages)
+from src.api.aspace_client import ArchivesSpaceClient
+from src.api.cache_store import open_cache_store
+from src.api.cache_sync import carry_pending, fetch_modified_agents, is_current, load_sync_state, save_sync_state
+from src.api.concurrency import AIMDController
+from src.api.rate_limit import aspace_rate_limits
+from src.api.results_stream import ResultsWriter, iter_results, results_to_csv
+from src.api.retry import backoff_delay, record_deadline, sleep_within_deadline
+from src.api.sharding import parse_shard, select_shard, sharded_path, with_source_index
+
 # Configuration paths
 CONFIG_PATH = "config.json"
 CACHE_DIR = Path("cache/aspace_cache")
@@ -64,7 +76,39 @@ def parse_args():
     parser.add_argument("--report-interval", type=int, default=10, help="Report progress every N seconds")
     parser.add_argument("--skip-existing", action="store_true", help="Skip records that already have cache files")
     parser.add_argument("--start-index", type=int, help="Start processing from this index in the CSV")
-    return parser.parse_args()
+    parser.add_argument("--engine", choices=["threads", "async", "bulk"], default="threads",
+                        help="Fetch engine: fixed thread batches, asyncio streaming, or thread batches "
+                             "fetched with one id_set[] request per agent type")
+    parser.add_argument("--max-in-flight", type=int, default=100,
+                        help="Maximum concurrent requests for the async engine")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="Adapt in-flight requests to server latency/errors (AIMD); "
+                             "--workers or --max-in-flight becomes the ceiling")
+    parser.add_argument("--min-concurrency", type=int, default=1,
+                        help="Floor for the adaptive concurrency limit")
+    parser.add_argument("--latency-target", type=float, default=2.0,
+                        help="Mean request latency (seconds) above which adaptive mode backs off")
+    parser.add_argument("--connect-timeout", type=float, default=10,
+                        help="Seconds to wait for a connection to ArchivesSpace")
+    parser.add_argument("--read-timeout", type=float, default=60,
+                        help="Seconds to wait for ArchivesSpace to send a response")
+    parser.add_argument("--record-deadline", type=float, default=300,
+                        help="Overall seconds allowed to fetch one record, retries included")
+    parser.add_argument("--enumerate", action="store_true",
+                        help="Cache every agent by walking the paginated agent listings instead of the source CSV")
+    parser.add_argument("--page-size", type=int, default=DEFAULT_PAGE_SIZE,
+                        help="Agents per listing page in --enumerate mode")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only re-fetch agents modified since the last sync (or not cached yet) "
+                             "and advance the sync watermark")
+    parser.add_argument("--shard", type=parse_shard,
+                        help="Process only shard i of N (e.g. 0/4), partitioned by a stable hash of the agent URI; "
+                             "combine the shard results with sharding.py")
+    args = parser.parse_args()
+    if args.shard and (args.enumerate or args.incremental):
+        # Both track one sync watermark for the whole cache, which shards would overwrite
+        parser.error("--shard can't be combined with --enumerate or --incremental")
+    return args
 
 def load_config(config_path):
     """Load configuration from JSON file."""
@@ -78,43 +122,27 @@ def load_config(config_path):
         logging.error(f"Invalid JSON in configuration file: {config_path}")
         raise
 
-def get_aspace_session(config):
-    """Get an authenticated ArchivesSpace session."""
-    api_url = config["credentials"]["archivesspace_api"]["api_url"]
-    username = config["credentials"]["archivesspace_api"]["username"]
-    password = config["credentials"]["archivesspace_api"]["password"]
-    
-    session = requests.Session()
+def get_aspace_session(config, pool_size=4, controller=None, timeout=(10, 60)):
+    """Get an authenticated ArchivesSpace client with a pooled session."""
+    client = ArchivesSpaceClient.from_config(config, pool_size=pool_size, controller=controller,
+                                             rate_limits=aspace_rate_limits(config),
+                                             timeout=timeout)
     
     try:
         logging.info("Authenticating with ArchivesSpace API")
-        auth_url = f"{api_url}/users/{username}/login"
-        response = session.post(auth_url, params={"password": password})
-        response.raise_for_status()
-        session_token = response.json().get("session")
-        
-        if not session_token:
-            raise ValueError("No session token returned by ArchivesSpace")
-        
-        session.headers.update({
-            "X-ArchivesSpace-Session": session_token,
-            "Accept": "application/json"
-        })
-        
+        client.ensure_authenticated()
         logging.info("Authentication successful")
-        return session, api_url
+        return client
     
     except requests.exceptions.RequestException as e:
         logging.error(f"Authentication failed: {str(e)}")
         raise
 
-def get_agent_record(session, api_url, agent_uri, max_retries=3):
+def get_agent_record(client, agent_uri, max_retries=3):
     """Retrieve agent record from ArchivesSpace with retry logic."""
-    url = f"{api_url}{agent_uri}"
-    
     for attempt in range(max_retries):
         try:
-            response = session.get(url)
+            response = client.get(agent_uri)
             response.raise_for_status()
             return response.json()
         
@@ -126,18 +154,18 @@ def get_agent_record(session, api_url, agent_uri, max_retries=3):
                 logging.error(f"Authentication error for {agent_uri}: {e}")
                 raise
             elif attempt < max_retries - 1:
-                wait_time = 2 ** attempt  # Exponential backoff
-                logging.warning(f"HTTP error {response.status_code} for {agent_uri}, retrying in {wait_time}s...")
-                time.sleep(wait_time)
+                wait_time = backoff_delay(attempt, e)  # Jittered backoff, or the server's Retry-After
+                logging.warning(f"HTTP error {response.status_code} for {agent_uri}, retrying in {wait_time:.1f}s...")
+                sleep_within_deadline(wait_time, e)
             else:
                 logging.error(f"Failed to retrieve {agent_uri} after {max_retries} attempts")
                 raise
         
-        except requests.exceptions.ConnectionError:
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
             if attempt < max_retries - 1:
-                wait_time = 2 ** attempt
-                logging.warning(f"Connection error for {agent_uri}, retrying in {wait_time}s...")
-                time.sleep(wait_time)
+                wait_time = backoff_delay(attempt)
+                logging.warning(f"Connection error for {agent_uri}, retrying in {wait_time:.1f}s...")
+                sleep_within_deadline(wait_time, e)
             else:
                 logging.error(f"Connection error retrieving {agent_uri} after {max_retries} attempts")
                 raise
@@ -182,49 +210,59 @@ def add_snac_ark(agent_data, snac_ark):
     agent_data['agent_record_identifiers'].append(new_identifier)
     return agent_data, "added", "SNAC ARK added"
 
-def save_to_cache(agent_data, cache_dir, agent_uri):
-    """Save agent record to cache with a consistent filename format."""
-    # Create filename from agent URI, replacing slashes with underscores
-    filename = agent_uri.replace("/", "_") + ".json"
-    filepath = cache_dir / filename
+def save_to_cache(agent_data, cache, agent_uri):
+    """Save agent record to the cache store under its URI; returns where it was stored."""
+    return cache.put(agent_uri, agent_data)
+
+def get_row_identifiers(row):
+    """Extract the agent URI and SNAC ARK from a source row.
     
-    cache_dir.mkdir(parents=True, exist_ok=True)
+    Returns (agent_uri, snac_ark, error_result); error_result is a result dict
+    when the row cannot be processed, otherwise None.
+    """
+    # Try the primary URI first, then fallback
+    agent_uri = row['original_agent_uri_old_spreadsheet']
+    if pd.isna(agent_uri) or not agent_uri:
+        agent_uri = row['aspace_agent_uri_final']
+        if pd.isna(agent_uri) or not agent_uri:
+            return None, None, {
+                'agent_uri': None,
+                'agent_name': row['agent_name'],
+                'status': 'error',
+                'message': 'No valid agent URI found'
+            }
     
-    with open(filepath, "w", encoding="utf-8") as f:
-        json.dump(agent_data, f, indent=2)
+    snac_ark = row['snac_ark_final']
+    if pd.isna(snac_ark) or not snac_ark:
+        return agent_uri, None, {
+            'agent_uri': agent_uri,
+            'agent_name': row['agent_name'],
+            'status': 'error',
+            'message': 'No SNAC ARK found'
+        }
     
-    return filepath
+    return agent_uri, snac_ark, None
 
 def process_agent(params):
-    """Process a single agent record for ThreadPoolExecutor."""
-    session, api_url, row, cache_dir = params
+    """Process a single agent record for ThreadPoolExecutor.
+    
+    prefetched maps agent URIs to records already fetched in bulk; anything not
+    in it is fetched with a single GET.
+    """
+    client, row, cache, deadline_seconds, prefetched = params
     
     # Extract data from row
     try:
-        # Try the primary URI first, then fallback
-        agent_uri = row['original_agent_uri_old_spreadsheet']
-        if pd.isna(agent_uri) or not agent_uri:
-            agent_uri = row['aspace_agent_uri_final']
-            if pd.isna(agent_uri) or not agent_uri:
-                return {
-                    'agent_uri': None,
-                    'agent_name': row['agent_name'],
-                    'status': 'error',
-                    'message': 'No valid agent URI found'
-                }
-        
-        snac_ark = row['snac_ark_final']
-        if pd.isna(snac_ark) or not snac_ark:
-            return {
-                'agent_uri': agent_uri,
-                'agent_name': row['agent_name'],
-                'status': 'error',
-                'message': 'No SNAC ARK found'
-            }
+        agent_uri, snac_ark, error_result = get_row_identifiers(row)
+        if error_result:
+            return error_result
         
         # Get the agent record from ArchivesSpace
         try:
-            agent_data = get_agent_record(session, api_url, agent_uri)
+            agent_data = prefetched.get(agent_uri) if prefetched else None
+            if agent_data is None:
+                with record_deadline(deadline_seconds):
+                    agent_data = get_agent_record(client, agent_uri)
         except Exception as e:
             return {
                 'agent_uri': agent_uri,
@@ -237,7 +275,7 @@ def process_agent(params):
         agent_data, ark_status, ark_message = add_snac_ark(agent_data, snac_ark)
         
         # Save to cache
-        cache_path = save_to_cache(agent_data, cache_dir, agent_uri)
+        cache_path = save_to_cache(agent_data, cache, agent_uri)
         
         return {
             'agent_uri': agent_uri,
@@ -258,35 +296,267 @@ def process_agent(params):
             'message': f"Unexpected error: {str(e)}"
         }
 
-def process_batch(session, api_url, df_batch, cache_dir, num_workers=4):
-    """Process a batch of agent records concurrently."""
+def process_batch(client, df_batch, cache, num_workers=4, deadline_seconds=300, bulk=False,
+                  prefetched=None):
+    """Process a batch of agent records concurrently.
+    
+    With bulk=True the batch's records are first fetched with one id_set[] request
+    per agent type; only agents missing from those responses get their own GET.
+    Records already in prefetched (agent URI -> record) are not fetched again.
+    """
     results = []
     
+    if bulk:
+        agent_uris = []
+        for _, row in df_batch.iterrows():
+            agent_uri, _, error_result = get_row_identifiers(row)
+            if not error_result:
+                agent_uris.append(agent_uri)
+        bulk_records, missing = fetch_agents_bulk(client, agent_uris)
+        prefetched = {**(prefetched or {}), **bulk_records}
+        if missing:
+            logging.info(f"Bulk fetch returned {len(bulk_records)} records; {len(missing)} will be fetched individually")
+    
     with ThreadPoolExecutor(max_workers=num_workers) as executor:
-        futures = [
-            executor.submit(process_agent, (session, api_url, row, cache_dir))
+        futures = {
+            executor.submit(process_agent, (client, row, cache, deadline_seconds, prefetched)): row
             for _, row in df_batch.iterrows()
-        ]
+        }
         
         for future in as_completed(futures):
             try:
                 result = future.result()
-                results.append(result)
             except Exception as e:
                 logging.error(f"Unhandled exception in worker thread: {str(e)}")
-                results.append({
+                result = {
                     'agent_uri': None,
                     'agent_name': 'Unknown',
                     'status': 'error',
                     'message': f"Thread exception: {str(e)}"
-                })
+                }
+            # Sharded runs carry the source position so merged results keep the source order
+            results.append(with_source_index(result, futures[future]))
     
     return results
 
-def build_aspace_cache(config, source_df, cache_dir, batch_size=50, num_workers=4, 
-                       test_mode=False, report_interval=10):
-    """Build ArchivesSpace cache with SNAC ARKs."""
-    session, api_url = get_aspace_session(config)
+async def get_agent_record_async(async_client, agent_uri, max_retries=3):
+    """Coroutine version of get_agent_record with the same retry rules."""
+    import aiohttp
+    
+    for attempt in range(max_retries):
+        try:
+            return await async_client.get_json(agent_uri)
+        
+        except aiohttp.ClientResponseError as e:
+            if e.status == 404:
+                logging.error(f"Agent not found: {agent_uri}")
+                raise
+            elif e.status in (401, 403):
+                logging.error(f"Authentication error for {agent_uri}: {e}")
+                raise
+            elif attempt < max_retries - 1:
+                wait_time = backoff_delay(attempt, e)  # Jittered backoff, or the server's Retry-After
+                logging.warning(f"HTTP error {e.status} for {agent_uri}, retrying in {wait_time:.1f}s...")
+                await asyncio.sleep(wait_time)
+            else:
+                logging.error(f"Failed to retrieve {agent_uri} after {max_retries} attempts")
+                raise
+        
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+            if attempt < max_retries - 1:
+                # A read timeout here is per-request; the record deadline is enforced by wait_for
+                wait_time = backoff_delay(attempt)
+                logging.warning(f"Connection error for {agent_uri}, retrying in {wait_time:.1f}s...")
+                await asyncio.sleep(wait_time)
+            else:
+                logging.error(f"Connection error retrieving {agent_uri} after {max_retries} attempts")
+                raise
+
+async def save_to_cache_async(agent_data, cache, agent_uri):
+    """Write to the cache store without blocking the event loop."""
+    return await asyncio.to_thread(save_to_cache, agent_data, cache, agent_uri)
+
+async def process_agent_async(async_client, row, cache, in_flight, deadline_seconds=300):
+    """Coroutine version of process_agent; in_flight is the semaphore capping open requests.
+    
+    The fetch (retries included) is cancelled once it has run for deadline_seconds.
+    """
+    try:
+        agent_uri, snac_ark, error_result = get_row_identifiers(row)
+        if error_result:
+            return error_result
+        
+        # Only the network call counts against the in-flight cap
+        try:
+            async with in_flight:
+                agent_data = await asyncio.wait_for(
+                    get_agent_record_async(async_client, agent_uri), timeout=deadline_seconds or None
+                )
+        except asyncio.TimeoutError:
+            return {
+                'agent_uri': agent_uri,
+                'agent_name': row['agent_name'],
+                'status': 'error',
+                'message': f"Failed to retrieve agent: record deadline of {deadline_seconds}s reached"
+            }
+        except Exception as e:
+            return {
+                'agent_uri': agent_uri,
+                'agent_name': row['agent_name'],
+                'status': 'error',
+                'message': f"Failed to retrieve agent: {str(e)}"
+            }
+        
+        agent_data, ark_status, ark_message = add_snac_ark(agent_data, snac_ark)
+        cache_path = await save_to_cache_async(agent_data, cache, agent_uri)
+        
+        return {
+            'agent_uri': agent_uri,
+            'agent_name': row['agent_name'],
+            'snac_ark': snac_ark,
+            'status': 'success',
+            'ark_status': ark_status,
+            'message': ark_message,
+            'cache_path': str(cache_path)
+        }
+    
+    except Exception as e:
+        agent_name = row.get('agent_name', 'Unknown')
+        return {
+            'agent_uri': agent_uri if 'agent_uri' in locals() else None,
+            'agent_name': agent_name,
+            'status': 'error',
+            'message': f"Unexpected error: {str(e)}"
+        }
+
+def select_incremental_rows(df, cache, modified, pending):
+    """Keep the rows whose agents are uncached, changed on the server, or failed last sync.
+    
+    Returns (filtered df, prefetched) where prefetched maps the rows' agent URIs to
+    the modified records already returned by the listing, so they aren't fetched twice.
+    """
+    keep = []
+    prefetched = {}
+    for idx, row in df.iterrows():
+        agent_uri, _, error_result = get_row_identifiers(row)
+        if error_result:
+            # Let the normal path report unusable rows
+            keep.append(idx)
+            continue
+        
+        canonical_uri = canonical_agent_uri(agent_uri)
+        server_record = modified.get(canonical_uri)
+        
+        if server_record is not None:
+            if is_current(cache, agent_uri, server_record):
+                continue
+            prefetched[agent_uri] = server_record
+            keep.append(idx)
+        elif canonical_uri in pending or agent_uri not in cache:
+            keep.append(idx)
+    
+    return df.loc[keep], prefetched
+
+def record_result(results, result, writer):
+    """Append a single agent result to the results stream and fold it into the running counters."""
+    writer.write(result)
+    
+    if result['status'] == 'success':
+        results['success'] += 1
+        if result.get('ark_status') == 'added':
+            results['arks']['added'] += 1
+        elif result.get('ark_status') == 'skipped':
+            results['arks']['skipped'] += 1
+    else:
+        results['error'] += 1
+
+def log_progress(processed_records, total_records, start_time):
+    """Log throughput and ETA for the run so far."""
+    elapsed = time.time() - start_time
+    records_per_second = processed_records / elapsed if elapsed > 0 else 0
+    percent_complete = processed_records / total_records * 100
+    
+    # Estimate time remaining
+    if records_per_second > 0:
+        remaining_records = total_records - processed_records
+        time_remaining = remaining_records / records_per_second
+        eta = time.strftime("%H:%M:%S", time.gmtime(time_remaining))
+    else:
+        eta = "unknown"
+    
+    logging.info(f"Progress: {processed_records}/{total_records} records ({percent_complete:.1f}%) | "
+                f"Speed: {records_per_second:.2f} records/sec | ETA: {eta}")
+
+async def run_async_engine(client, df, cache, results, writer, max_in_flight=100, report_interval=10,
+                           deadline_seconds=300):
+    """Fetch, patch and cache every row in df as coroutines with at most max_in_flight open requests.
+    
+    There are no batch barriers here: a slow agent only holds its own worker, so
+    throughput is bounded by the server rather than a thread count. Rows are fed
+    through a bounded queue to max_in_flight workers, so only that many
+    coroutines exist at once however large the CSV is.
+    """
+    from src.api.aspace_async_client import AsyncArchivesSpaceClient
+    
+    total_records = len(df)
+    start_time = time.time()
+    progress = {'processed': 0, 'last_report': start_time}
+    in_flight = asyncio.Semaphore(max_in_flight)
+    rows = asyncio.Queue(maxsize=max_in_flight)
+    num_workers = max(1, min(max_in_flight, total_records))
+    
+    async def produce():
+        for _, row in df.iterrows():
+            await rows.put(row)
+        for _ in range(num_workers):
+            await rows.put(None)
+    
+    async def work(async_client):
+        while True:
+            row = await rows.get()
+            if row is None:
+                return
+            try:
+                result = await process_agent_async(async_client, row, cache, in_flight, deadline_seconds)
+            except Exception as e:
+                logging.error(f"Unhandled exception in async task: {str(e)}")
+                result = {
+                    'agent_uri': None,
+                    'agent_name': 'Unknown',
+                    'status': 'error',
+                    'message': f"Task exception: {str(e)}"
+                }
+            
+            record_result(results, with_source_index(result, row), writer)
+            progress['processed'] += 1
+            
+            current_time = time.time()
+            if current_time - progress['last_report'] >= report_interval:
+                log_progress(progress['processed'], total_records, start_time)
+                progress['last_report'] = current_time
+    
+    async with AsyncArchivesSpaceClient.from_client(client, max_connections=max_in_flight) as async_client:
+        await asyncio.gather(produce(), *(work(async_client) for _ in range(num_workers)))
+
+def build_aspace_cache(config, source_df, cache, batch_size=50, num_workers=4, 
+                       test_mode=False, report_interval=10, engine="threads", max_in_flight=100,
+                       adaptive=False, min_concurrency=1, latency_target=2.0, timeout=(10, 60),
+                       record_deadline_seconds=300, incremental=False, results_path=None):
+    """Build ArchivesSpace cache with SNAC ARKs.
+    
+    engine picks how records are fetched ("threads", "bulk" or "async"), adaptive=True
+    lets an AIMDController set the concurrency, and incremental=True skips agents that
+    are cached and unchanged since the last sync. Per-record results go to results_path.
+    """
+    controller = None
+    if adaptive:
+        ceiling = max_in_flight if engine == "async" else num_workers
+        controller = AIMDController(floor=min_concurrency, ceiling=ceiling, latency_target=latency_target)
+        logging.info(f"ADAPTIVE CONCURRENCY: {controller.floor}-{controller.ceiling} requests in flight, "
+                     f"latency target {latency_target}s")
+    
+    # Size the connection pool to the worker count so every thread keeps its own connection
+    client = get_aspace_session(config, pool_size=num_workers, controller=controller, timeout=timeout)
     
     # Initialize results data structure
     results = {
@@ -297,7 +567,7 @@ def build_aspace_cache(config, source_df, cache_dir, batch_size=50, num_workers=
             'added': 0,
             'skipped': 0
         },
-        'details': []
+        'results_file': str(results_path or f"src/data/aspace_cache_build_results_{timestamp}.jsonl")
     }
     
     # If test mode, limit to 100 records
@@ -307,9 +577,33 @@ def build_aspace_cache(config, source_df, cache_dir, batch_size=50, num_workers=
     else:
         df = source_df.copy()
     
+    prefetched = None
+    previous_pending = []
+    sync_started = time.time()
+    if incremental:
+        sync_state = load_sync_state(cache.path)
+        if sync_state is None:
+            logging.info("INCREMENTAL: no sync watermark yet, processing every record")
+        else:
+            modified, failed_pages = fetch_modified_agents(client, sync_state['watermark'], num_workers=num_workers)
+            if failed_pages:
+                raise RuntimeError(f"{failed_pages} modified-agent listing pages failed; "
+                                   f"not trusting the incremental selection")
+            candidate_count = len(df)
+            previous_pending = sync_state['pending']
+            df, prefetched = select_incremental_rows(df, cache, modified, set(previous_pending))
+            logging.info(f"INCREMENTAL: {len(df)} of {candidate_count} records need refreshing")
+    
     total_records = len(df)
     results['total'] = total_records
     
+    if incremental and total_records == 0:
+        logging.info("INCREMENTAL: cache is already current")
+        if not test_mode:
+            # Earlier failures outside this CSV are still owed a refresh
+            save_sync_state(cache.path, sync_started, previous_pending)
+        return results
+    
     logging.info(f"Starting to build ArchivesSpace cache for {total_records} agent records")
     summary_logger.info(f"# ArchivesSpace Cache Build - {timestamp}")
     summary_logger.info(f"\nProcessing {total_records} agent records\n")
@@ -319,55 +613,52 @@ def build_aspace_cache(config, source_df, cache_dir, batch_size=50, num_workers=
     last_report_time = start_time
     processed_records = 0
     
-    # Process in batches
-    for start_idx in range(0, total_records, batch_size):
-        end_idx = min(start_idx + batch_size, total_records)
-        batch_df = df.iloc[start_idx:end_idx]
-        
-        logging.info(f"Processing batch {start_idx//batch_size + 1}: records {start_idx+1}-{end_idx} of {total_records}")
-        
-        # Process the batch
-        batch_results = process_batch(session, api_url, batch_df, cache_dir, num_workers)
-        
-        # Update results
-        for result in batch_results:
-            results['details'].append(result)
-            
-            if result['status'] == 'success':
-                results['success'] += 1
-                if result.get('ark_status') == 'added':
-                    results['arks']['added'] += 1
-                elif result.get('ark_status') == 'skipped':
-                    results['arks']['skipped'] += 1
-            else:
-                results['error'] += 1
-        
-        # Update progress
-        processed_records += len(batch_df)
-        current_time = time.time()
-        elapsed = current_time - start_time
-        
-        # Report progress at regular intervals
-        if current_time - last_report_time >= report_interval:
-            records_per_second = processed_records / elapsed if elapsed > 0 else 0
-            percent_complete = processed_records / total_records * 100
-            
-            # Estimate time remaining
-            if records_per_second > 0:
-                remaining_records = total_records - processed_records
-                time_remaining = remaining_records / records_per_second
-                eta = time.strftime("%H:%M:%S", time.gmtime(time_remaining))
-            else:
-                eta = "unknown"
-            
-            logging.info(f"Progress: {processed_records}/{total_records} records ({percent_complete:.1f}%) | "
-                        f"Speed: {records_per_second:.2f} records/sec | ETA: {eta}")
+    writer = ResultsWriter(results['results_file'])
+    try:
+        if engine == "async":
+            logging.info(f"ASYNC ENGINE: up to {max_in_flight} requests in flight")
+            asyncio.run(run_async_engine(client, df, cache, results, writer, max_in_flight, report_interval,
+                                         record_deadline_seconds))
+        else:
+            if engine == "bulk":
+                logging.info("BULK ENGINE: each batch is fetched with id_set[] requests per agent type")
             
-            last_report_time = current_time
-        
-        # Refresh session every 5 batches to prevent timeouts
-        if (start_idx // batch_size + 1) % 5 == 0:
-            session, api_url = get_aspace_session(config)
+            # Process in batches
+            for start_idx in range(0, total_records, batch_size):
+                end_idx = min(start_idx + batch_size, total_records)
+                batch_df = df.iloc[start_idx:end_idx]
+                
+                logging.info(f"Processing batch {start_idx//batch_size + 1}: records {start_idx+1}-{end_idx} of {total_records}")
+                
+                # Process the batch
+                batch_results = process_batch(client, batch_df, cache, num_workers, record_deadline_seconds,
+                                              bulk=engine == "bulk", prefetched=prefetched)
+                
+                # Update results
+                for result in batch_results:
+                    record_result(results, result, writer)
+                
+                # Update progress
+                processed_records += len(batch_df)
+                current_time = time.time()
+                
+                # Report progress at regular intervals
+                if current_time - last_report_time >= report_interval:
+                    log_progress(processed_records, total_records, start_time)
+                    last_report_time = current_time
+    finally:
+        writer.close()
+    
+    # A test run only looked at 100 rows, so it can't vouch for the rest of the cache
+    if incremental and not test_mode:
+        # Agents that failed are retried on the next run even if they don't change again,
+        # as are earlier failures this run didn't include
+        failed = [canonical_agent_uri(result['agent_uri'])
+                  for result in iter_results(results['results_file'], status='error') if result.get('agent_uri')]
+        attempted = [canonical_agent_uri(agent_uri) for agent_uri, _, _ in
+                     (get_row_identifiers(row) for _, row in df.iterrows()) if agent_uri]
+        save_sync_state(cache.path, sync_started,
+                        [uri for uri in carry_pending(previous_pending, attempted, failed) if uri])
     
     # Calculate final statistics
     total_time = time.time() - start_time
@@ -381,7 +672,10 @@ def build_aspace_cache(config, source_df, cache_dir, batch_size=50, num_workers=
     summary_logger.info(f"- **SNAC ARKs added:** {results['arks']['added']}")
     summary_logger.info(f"- **SNAC ARKs already present:** {results['arks']['skipped']}")
     summary_logger.info(f"- **Processing time:** {time.strftime('%H:%M:%S', time.gmtime(total_time))}")
-    summary_logger.info(f"- **Processing speed:** {records_per_second:.2f} records/sec\n")
+    summary_logger.info(f"- **Processing speed:** {records_per_second:.2f} records/sec")
+    if controller:
+        summary_logger.info(f"- **Final adaptive concurrency limit:** {controller.limit}")
+    summary_logger.info("")
     
     # Log error details if any
     if results['error'] > 0:
@@ -390,19 +684,18 @@ def build_aspace_cache(config, source_df, cache_dir, batch_size=50, num_workers=
         summary_logger.info("|-----------|------------|---------------|")
         
         error_count = 0
-        for result in results['details']:
-            if result['status'] == 'error':
-                error_count += 1
-                agent_uri = result.get('agent_uri', 'N/A')
-                agent_name = result.get('agent_name', 'Unknown').replace('|', '\\|')  # Escape pipe characters
-                message = result.get('message', 'Unknown error').replace('|', '\\|')
-                
-                summary_logger.info(f"| {agent_uri} | {agent_name} | {message} |")
-                
-                # Limit to first 20 errors in the summary
-                if error_count >= 20 and results['error'] > 20:
-                    summary_logger.info(f"\n... and {results['error'] - 20} more errors (see log file for details)")
-                    break
+        for result in iter_results(results['results_file'], status='error'):
+            error_count += 1
+            agent_uri = result.get('agent_uri', 'N/A')
+            agent_name = result.get('agent_name', 'Unknown').replace('|', '\\|')  # Escape pipe characters
+            message = result.get('message', 'Unknown error').replace('|', '\\|')
+            
+            summary_logger.info(f"| {agent_uri} | {agent_name} | {message} |")
+            
+            # Limit to first 20 errors in the summary
+            if error_count >= 20 and results['error'] > 20:
+                summary_logger.info(f"\n... and {results['error'] - 20} more errors (see log file for details)")
+                break
     
     logging.info(f"Cache build complete. Results saved to {SUMMARY_LOG_FILE}")
     logging.info(f"Summary: {results['success']} successes, {results['error']} errors")
@@ -410,23 +703,160 @@ def build_aspace_cache(config, source_df, cache_dir, batch_size=50, num_workers=
     
     return results
 
+def enumerate_aspace_agents(config, cache, num_workers=4, page_size=DEFAULT_PAGE_SIZE,
+                            test_mode=False, timeout=(10, 60), incremental=False, results_path=None):
+    """Cache every agent in ArchivesSpace by walking the paginated listings.
+    
+    Unlike build_aspace_cache this needs no source CSV: all people, corporate
+    entities and families are fetched page by page, num_workers pages at a time,
+    and each agent is cached as-is (there is no SNAC ARK to add without a source
+    row). Throughput is logged for every page.
+    
+    With incremental=True the listings are filtered to agents modified since the
+    last sync watermark, which only advances if every page was fetched.
+    """
+    client = get_aspace_session(config, pool_size=num_workers, timeout=timeout)
+    
+    modified_since = None
+    sync_started = time.time()
+    if incremental:
+        sync_state = load_sync_state(cache.path)
+        if sync_state:
+            modified_since = sync_state['watermark']
+            logging.info(f"INCREMENTAL: only agents modified since "
+                         f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(modified_since))}")
+    
+    results = {
+        'total': 0,
+        'success': 0,
+        'error': 0,
+        'arks': {
+            'added': 0,
+            'skipped': 0
+        },
+        'results_file': str(results_path or f"src/data/aspace_cache_enumerate_results_{timestamp}.jsonl"),
+        'pages': {}
+    }
+    
+    summary_logger.info(f"# ArchivesSpace Agent Enumeration - {timestamp}")
+    if test_mode:
+        logging.info("TEST MODE: Caching only the first page of each agent type")
+    
+    start_time = time.time()
+    writer = ResultsWriter(results['results_file'])
+    try:
+        for agent_type in AGENT_TYPES:
+            type_start = time.time()
+            type_records = 0
+            failed_pages = 0
+            
+            for page, last_page, records, seconds in iter_agent_pages(client, agent_type, page_size, num_workers,
+                                                                       max_pages=1 if test_mode else None,
+                                                                       modified_since=modified_since):
+                if records is None:
+                    failed_pages += 1
+                    record_result(results, {
+                        'agent_uri': f"/agents/{agent_type}?page={page}",
+                        'agent_name': 'Unknown',
+                        'status': 'error',
+                        'message': f"Failed to fetch listing page {page}"
+                    }, writer)
+                    continue
+                
+                for agent_data in records:
+                    agent_uri = agent_data.get('uri')
+                    try:
+                        cache_path = save_to_cache(agent_data, cache, agent_uri)
+                        result = {
+                            'agent_uri': agent_uri,
+                            'agent_name': agent_data.get('title', 'Unknown'),
+                            'status': 'success',
+                            'message': 'Cached from listing',
+                            'cache_path': str(cache_path)
+                        }
+                    except Exception as e:
+                        result = {
+                            'agent_uri': agent_uri,
+                            'agent_name': agent_data.get('title', 'Unknown'),
+                            'status': 'error',
+                            'message': f"Failed to cache agent: {str(e)}"
+                        }
+                    record_result(results, result, writer)
+                
+                type_records += len(records)
+                rate = len(records) / seconds if seconds > 0 else 0
+                logging.info(f"{agent_type} page {page}/{last_page}: {len(records)} agents in {seconds:.2f}s "
+                             f"({rate:.1f} agents/sec) | {type_records} {agent_type} cached so far")
+            
+            type_time = time.time() - type_start
+            results['pages'][agent_type] = {'agents': type_records, 'failed_pages': failed_pages}
+            logging.info(f"Finished {agent_type}: {type_records} agents in "
+                         f"{time.strftime('%H:%M:%S', time.gmtime(type_time))}, {failed_pages} failed pages")
+    finally:
+        writer.close()
+    
+    results['total'] = results['success'] + results['error']
+    total_time = time.time() - start_time
+    
+    if incremental and not test_mode:
+        if any(counts['failed_pages'] for counts in results['pages'].values()):
+            logging.warning("Some listing pages failed; keeping the previous sync watermark")
+        else:
+            # Listings don't retry earlier failures, so they stay pending
+            save_sync_state(cache.path, sync_started, sync_state['pending'] if sync_state else [])
+    records_per_second = results['total'] / total_time if total_time > 0 else 0
+    
+    summary_logger.info("## Results Summary\n")
+    for agent_type, counts in results['pages'].items():
+        summary_logger.info(f"- **{agent_type}:** {counts['agents']} agents cached, {counts['failed_pages']} failed pages")
+    summary_logger.info(f"- **Total agents cached:** {results['success']}")
+    summary_logger.info(f"- **Errors:** {results['error']}")
+    summary_logger.info(f"- **Processing time:** {time.strftime('%H:%M:%S', time.gmtime(total_time))}")
+    summary_logger.info(f"- **Processing speed:** {records_per_second:.2f} records/sec\n")
+    
+    logging.info(f"Enumeration complete: {results['success']} agents cached, {results['error']} errors")
+    return results
+
 def main():
     """Main function to build ArchivesSpace cache with SNAC ARKs."""
     args = parse_args()
+    cache = None
     
     try:
         # Log start time
         start_time = time.time()
         logging.info(f"Starting ArchivesSpace cache build at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
         
+        # Load configuration
+        config = load_config(CONFIG_PATH)
+        
+        # Records go to cache/aspace_cache or cache/aspace_cache.sqlite, per config["settings"]["cache_backend"]
+        cache = open_cache_store(CACHE_DIR, config=config)
+        
         # Check existing cache files if needed
         if args.skip_existing:
-            existing_files = list(CACHE_DIR.glob("*.json"))
-            existing_count = len(existing_files)
-            logging.info(f"Found {existing_count} existing files in cache directory")
+            # Exact URIs from the cache manifest (file names mangle corporate_entities)
+            existing_uris = {canonical_agent_uri(key) or key for key in cache.keys()}
+            existing_count = len(existing_uris)
+            logging.info(f"Found {existing_count} existing records in the {cache.backend} cache")
         
-        # Load configuration
-        config = load_config(CONFIG_PATH)
+        # Phase 4: cache every agent, whether or not it appears in the source CSV
+        if args.enumerate:
+            results = enumerate_aspace_agents(
+                config=config,
+                cache=cache,
+                num_workers=args.workers,
+                page_size=args.page_size,
+                test_mode=args.test,
+                timeout=(args.connect_timeout, args.read_timeout),
+                incremental=args.incremental
+            )
+            
+            results_file = f"src/data/aspace_cache_enumerate_results_{timestamp}.csv"
+            results_to_csv(results['results_file'], results_file)
+            logging.info(f"Results saved to {results_file}")
+            logging.info(f"Total runtime: {time.strftime('%H:%M:%S', time.gmtime(time.time() - start_time))}")
+            return 0
         
         # Load source CSV
         logging.info(f"Loading source data from {SOURCE_CSV_PATH}")
@@ -434,6 +864,11 @@ def main():
         total_records = len(df)
         logging.info(f"Loaded {total_records} records from source CSV")
         
+        # Keep only this shard's rows; every shard sees the same partition of the source
+        if args.shard:
+            df = select_shard(df, args.shard, ['original_agent_uri_old_spreadsheet', 'aspace_agent_uri_final'])
+            total_records = len(df)
+        
         # Apply start index if specified
         if args.start_index is not None:
             if args.start_index < total_records:
@@ -446,22 +881,20 @@ def main():
         # Filter out records that already have cache files if requested
         if args.skip_existing and existing_count > 0:
             logging.info("Filtering out records that already have cache files")
-            # Extract agent URIs from existing filenames
-            existing_uris = []
-            for filepath in existing_files:
-                uri = "/" + filepath.stem.replace("_", "/")
-                existing_uris.append(uri)
-            
             # Filter dataframe
             original_count = len(df)
             
+            # Compare normalized URIs so full URLs and missing slashes still match
+            def is_cached(uri):
+                return pd.notna(uri) and (canonical_agent_uri(uri) or uri) in existing_uris
+            
             # Filter by primary URI column
             if 'original_agent_uri_old_spreadsheet' in df.columns:
-                df = df[~df['original_agent_uri_old_spreadsheet'].isin(existing_uris)]
+                df = df[~df['original_agent_uri_old_spreadsheet'].map(is_cached)]
             
             # Also filter by alternative URI column
             if 'aspace_agent_uri_final' in df.columns and len(df) > 0:
-                df = df[~df['aspace_agent_uri_final'].isin(existing_uris)]
+                df = df[~df['aspace_agent_uri_final'].map(is_cached)]
                 
             remaining_count = len(df)
             skipped_count = original_count - remaining_count
@@ -473,17 +906,25 @@ def main():
             results = build_aspace_cache(
                 config=config,
                 source_df=df,
-                cache_dir=CACHE_DIR,
+                cache=cache,
                 batch_size=args.batch_size,
                 num_workers=args.workers,
                 test_mode=args.test,
-                report_interval=args.report_interval
+                report_interval=args.report_interval,
+                engine=args.engine,
+                max_in_flight=args.max_in_flight,
+                adaptive=args.adaptive,
+                min_concurrency=args.min_concurrency,
+                latency_target=args.latency_target,
+                timeout=(args.connect_timeout, args.read_timeout),
+                record_deadline_seconds=args.record_deadline,
+                incremental=args.incremental,
+                results_path=sharded_path(f"src/data/aspace_cache_build_results_{timestamp}.jsonl", args.shard)
             )
             
             # Save results to a CSV for further analysis
-            results_df = pd.DataFrame(results['details'])
-            results_file = f"src/data/aspace_cache_build_results_{timestamp}.csv"
-            results_df.to_csv(results_file, index=False)
+            results_file = sharded_path(f"src/data/aspace_cache_build_results_{timestamp}.csv", args.shard)
+            results_to_csv(results['results_file'], results_file)
             logging.info(f"Results saved to {results_file}")
             
             # Calculate total runtime
@@ -498,6 +939,11 @@ def main():
     except Exception as e:
         logging.error(f"Unhandled exception in main: {str(e)}", exc_info=True)
         return 1
+    
+    finally:
+        # Flushes any records still buffered by the SQLite backend
+        if cache is not None:
+            cache.close()
 
 if __name__ == "__main__":
     sys.exit(main())
\ No newline at end of file
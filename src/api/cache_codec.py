@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+#author = will nyarko
+#file name = cache_codec.py
+#description = Encodings for cached records (pretty JSON, compact JSON, gzip, zstd) with a format-detecting loader
+"""
+
+import argparse
+import gzip
+import json
+import logging
+import sys
+import time
+from pathlib import Path
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional; gzip is always available
+    zstandard = None
+
+# Add project root to sys.path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+# "json" is the original indent=2 layout; the others are compact JSON, optionally compressed
+CODECS = ("json", "compact", "gzip", "zstd")
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+def available_codecs():
+    """Codecs usable in this environment (zstd needs the zstandard package)."""
+    return [codec for codec in CODECS if codec != "zstd" or zstandard is not None]
+
+def check_codec(codec):
+    if codec not in CODECS:
+        raise ValueError(f"Unknown cache codec {codec!r}; expected one of {', '.join(CODECS)}")
+    if codec == "zstd" and zstandard is None:
+        raise ValueError("The zstd cache codec needs the zstandard package (pip install zstandard)")
+    return codec
+
+def configured_codec(config):
+    """Codec from config["settings"]["cache_codec"], or None for the store's default."""
+    codec = (config or {}).get("settings", {}).get("cache_codec")
+    return check_codec(codec) if codec else None
+
+def encode(record, codec="compact"):
+    """Serialize a record to bytes in the given codec."""
+    if codec == "json":
+        return json.dumps(record, indent=2).encode("utf-8")
+    data = json.dumps(record, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    if codec == "compact":
+        return data
+    if codec == "gzip":
+        # mtime=0 keeps the output identical for identical records
+        return gzip.compress(data, compresslevel=6, mtime=0)
+    if codec == "zstd":
+        check_codec(codec)
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    raise ValueError(f"Unknown cache codec {codec!r}")
+
+def detect_codec(data):
+    """Name of the codec that produced data, judged from its first bytes."""
+    if isinstance(data, str):
+        return "compact"
+    if data[:2] == GZIP_MAGIC:
+        return "gzip"
+    if data[:4] == ZSTD_MAGIC:
+        return "zstd"
+    return "compact"
+
+def decode(data):
+    """Load a record written in any codec (bytes or text), detecting the format."""
+    if isinstance(data, str):
+        return json.loads(data)
+    codec = detect_codec(data)
+    if codec == "gzip":
+        data = gzip.decompress(data)
+    elif codec == "zstd":
+        check_codec(codec)
+        data = zstandard.ZstdDecompressor().decompress(data)
+    return json.loads(data)
+
+def convert_store(store, codec):
+    """Rewrite every record of an open cache store in another codec; returns the number converted."""
+    check_codec(codec)
+    store.codec = codec
+    converted = 0
+    for key, record in list(store.items()):
+        store.put(key, record)
+        converted += 1
+        if converted % 5000 == 0:
+            logging.info(f"Converted {converted} records")
+    store.flush()
+    return converted
+
+def benchmark(records, codecs=None, repeat=3):
+    """
+    Bytes on disk and encode/decode time of each codec for a list of records.
+
+    Returns {codec: {"bytes": int, "encode_seconds": float, "decode_seconds": float}}
+    with times as the best of `repeat` runs over the whole sample.
+    """
+    stats = {}
+    for codec in codecs or available_codecs():
+        encoded = [encode(record, codec) for record in records]
+        encode_times = []
+        decode_times = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            for record in records:
+                encode(record, codec)
+            encode_times.append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            for data in encoded:
+                decode(data)
+            decode_times.append(time.perf_counter() - started)
+        stats[codec] = {
+            "bytes": sum(len(data) for data in encoded),
+            "encode_seconds": min(encode_times),
+            "decode_seconds": min(decode_times)
+        }
+    return stats
+
+def main():
+    """Convert a cache to another codec, or benchmark the codecs on a sample of its records."""
+    from src.api.cache_store import open_cache_store
+
+    parser = argparse.ArgumentParser(description="Convert or benchmark cache encodings")
+    parser.add_argument("command", choices=["convert", "benchmark"])
+    parser.add_argument("cache_dir", help="Cache directory, e.g. cache/snac_cache")
+    parser.add_argument("--codec", choices=CODECS, help="Target codec for convert")
+    parser.add_argument("--sample", type=int, default=1000, help="Records to benchmark")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+
+    with open_cache_store(args.cache_dir) as store:
+        if args.command == "convert":
+            if not args.codec:
+                parser.error("convert needs --codec")
+            converted = convert_store(store, args.codec)
+            logging.info(f"Converted {converted} records in {store.path} to {args.codec}")
+            return 0
+
+        records = []
+        for _, record in store.items():
+            records.append(record)
+            if len(records) >= args.sample:
+                break
+
+    if not records:
+        logging.error(f"No records found in {args.cache_dir}")
+        return 1
+
+    stats = benchmark(records)
+    baseline = stats["json"]["bytes"]
+    print(f"{len(records)} records from {args.cache_dir}")
+    print(f"{'codec':<8} {'bytes':>12} {'vs json':>8} {'encode ms':>10} {'decode ms':>10}")
+    for codec, result in stats.items():
+        print(f"{codec:<8} {result['bytes']:>12,} {result['bytes'] / baseline:>7.0%} "
+              f"{result['encode_seconds'] * 1000:>10.1f} {result['decode_seconds'] * 1000:>10.1f}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
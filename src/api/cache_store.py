@@ -0,0 +1,550 @@
+#!/usr/bin/env python3
+"""
+#author = will nyarko
+#file name = cache_store.py
+#description = Pluggable record caches (JSON files or one SQLite file) with a manifest index
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import queue
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+
+# Add project root to sys.path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from src.api.cache_codec import CODECS, check_codec, configured_codec, decode, encode
+
+# Backends selectable with config["settings"]["cache_backend"]
+CACHE_BACKENDS = ("files", "sqlite")
+
+# Records buffered by SQLiteCacheStore before they are written in one transaction
+DEFAULT_WRITE_BATCH = 100
+
+def content_hash(record):
+    """SHA-256 of the record's canonical JSON (sorted keys, no whitespace)."""
+    canonical = json.dumps(record, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+def snac_ark_of(record):
+    """The SNAC ARK among an agent record's identifiers, or None."""
+    for identifier in (record or {}).get("agent_record_identifiers") or []:
+        if identifier.get("source") == "snac":
+            return identifier.get("record_identifier")
+    return None
+
+class BufferedSQLite:
+    """
+    One SQLite file shared by all threads behind a lock, with writes buffered per key
+    and committed in one transaction every write_batch rows (and on flush/close).
+    WAL mode lets other scripts read while this one writes.
+    """
+
+    def __init__(self, db_path, schema, upsert_sql, write_batch=DEFAULT_WRITE_BATCH):
+        self.path = Path(db_path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.write_batch = max(1, int(write_batch))
+        self._upsert_sql = upsert_sql
+        self._pending = {}
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(schema)
+        self._conn.commit()
+
+    def _queue(self, key, row):
+        with self._lock:
+            self._pending[key] = row
+            if len(self._pending) >= self.write_batch:
+                self.flush()
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def flush(self):
+        """Write all buffered rows in a single transaction."""
+        with self._lock:
+            if not self._pending:
+                return
+            with self._conn:
+                self._conn.executemany(self._upsert_sql, list(self._pending.values()))
+            self._pending.clear()
+
+    def close(self):
+        with self._lock:
+            if self._conn is None:
+                return
+            self.flush()
+            self._conn.close()
+            self._conn = None
+
+class CacheManifest(BufferedSQLite):
+    """
+    Index of everything in a cache: exact key and URI, lock_version, system_mtime,
+    a canonical content hash and the SNAC ARK (if any) of each record.
+
+    Kept next to the cache, one per backend (see manifest_path_for), and updated on
+    every put, so skip checks, freshness checks and comparisons are single lookups
+    that never open a record. A manifest only counts as complete once a full
+    rebuild has finished; open_cache_store() rebuilds any that isn't.
+    """
+
+    FIELDS = ("key", "uri", "lock_version", "system_mtime", "content_hash", "snac_ark", "updated_at")
+
+    def __init__(self, db_path, write_batch=DEFAULT_WRITE_BATCH):
+        super().__init__(
+            db_path,
+            "CREATE TABLE IF NOT EXISTS manifest ("
+            "key TEXT PRIMARY KEY, uri TEXT, lock_version INTEGER, system_mtime TEXT, "
+            "content_hash TEXT NOT NULL, snac_ark TEXT, updated_at REAL NOT NULL)",
+            "INSERT OR REPLACE INTO manifest (key, uri, lock_version, system_mtime, content_hash, snac_ark, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            write_batch
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS manifest_meta (name TEXT PRIMARY KEY, value TEXT)")
+        self._conn.commit()
+
+    def record(self, key, record):
+        """Index a record that was just written under key."""
+        record = record if isinstance(record, dict) else {}
+        self._queue(key, (key, record.get("uri"), record.get("lock_version"), record.get("system_mtime"),
+                          content_hash(record), snac_ark_of(record), time.time()))
+
+    def get(self, key):
+        """Manifest entry for key as a dict (has_snac included), or None."""
+        with self._lock:
+            row = self._pending.get(key)
+        if row is None:
+            rows = self._query(f"SELECT {', '.join(self.FIELDS)} FROM manifest WHERE key = ?", (key,))
+            row = rows[0] if rows else None
+        if row is None:
+            return None
+        entry = dict(zip(self.FIELDS, row))
+        entry["has_snac"] = entry["snac_ark"] is not None
+        return entry
+
+    def __contains__(self, key):
+        with self._lock:
+            if key in self._pending:
+                return True
+        return bool(self._query("SELECT 1 FROM manifest WHERE key = ?", (key,)))
+
+    def keys(self):
+        self.flush()
+        return [key for (key,) in self._query("SELECT key FROM manifest")]
+
+    def count(self):
+        self.flush()
+        return self._query("SELECT COUNT(*) FROM manifest")[0][0]
+
+    def is_complete(self):
+        """Whether a full rebuild has finished since the manifest was last cleared."""
+        return bool(self._query("SELECT 1 FROM manifest_meta WHERE name = 'complete' AND value = '1'"))
+
+    def mark_complete(self, complete=True):
+        with self._lock:
+            self.flush()
+            with self._conn:
+                self._conn.execute("INSERT OR REPLACE INTO manifest_meta (name, value) VALUES ('complete', ?)",
+                                   ("1" if complete else "0",))
+
+    def clear(self):
+        """Drop every entry (and the complete marker) ahead of a full rebuild."""
+        with self._lock:
+            self._pending.clear()
+            with self._conn:
+                self._conn.execute("DELETE FROM manifest")
+                self._conn.execute("INSERT OR REPLACE INTO manifest_meta (name, value) VALUES ('complete', '0')")
+
+def manifest_path_for(cache_path):
+    """
+    Each store gets its own manifest, named after the store itself:
+    cache/aspace_cache -> cache/aspace_cache_manifest.sqlite,
+    cache/aspace_cache.sqlite -> cache/aspace_cache_sqlite_manifest.sqlite
+    """
+    cache_path = Path(cache_path)
+    return cache_path.parent / f"{cache_path.name.replace('.', '_')}_manifest.sqlite"
+
+def sqlite_path_for(cache_dir):
+    """cache/aspace_cache -> cache/aspace_cache.sqlite"""
+    cache_dir = Path(cache_dir)
+    return cache_dir.parent / f"{cache_dir.name}.sqlite"
+
+class FileCacheStore:
+    """
+    The original layout: one file per record in a flat directory, named after its
+    key with slashes replaced by underscores
+    (/agents/people/1 -> _agents_people_1.json, snac_123 -> snac_123.json).
+
+    Records are written in `codec` (pretty-printed JSON by default, see cache_codec)
+    and read in whatever format each file turns out to be, so a directory can be
+    converted, or switched to a new codec, without rewriting everything at once.
+
+    File names can't be turned back into keys reliably (corporate_entities has an
+    underscore), so keys come from the manifest, which open_cache_store() builds
+    from the records' own URIs the first time an existing directory is opened.
+    """
+
+    backend = "files"
+
+    def __init__(self, cache_dir, codec="json"):
+        self.path = Path(cache_dir)
+        self.codec = check_codec(codec)
+        self.manifest = CacheManifest(manifest_path_for(self.path))
+
+    def path_for(self, key):
+        return self.path / (key.replace("/", "_") + ".json")
+
+    def location(self, key):
+        """Human-readable location of a record, for results and logs."""
+        return str(self.path_for(key))
+
+    def get(self, key):
+        """Return the cached record for key, or None."""
+        try:
+            return decode(self.path_for(key).read_bytes())
+        except FileNotFoundError:
+            return None
+
+    def __contains__(self, key):
+        return self.path_for(key).exists()
+
+    def put(self, key, record):
+        """Write a record, index it in the manifest and return its location."""
+        self.path.mkdir(parents=True, exist_ok=True)
+        path = self.path_for(key)
+        path.write_bytes(encode(record, self.codec))
+        self.manifest.record(key, record)
+        return str(path)
+
+    def items(self):
+        """(key, record) for every file, with keys recovered from the records themselves."""
+        for path in sorted(self.path.glob("*.json")):
+            try:
+                record = decode(path.read_bytes())
+            except (OSError, ValueError, EOFError) as e:
+                logging.error(f"Skipping unreadable cache file {path}: {str(e)}")
+                continue
+            yield key_for_file(path, record), record
+
+    def unindexed_items(self):
+        """(key, record) for the files the manifest has no entry for; only those files are read."""
+        indexed = {self.path_for(key).name for key in self.manifest.keys()}
+        for path in sorted(self.path.glob("*.json")):
+            if path.name in indexed:
+                continue
+            try:
+                record = decode(path.read_bytes())
+            except (OSError, ValueError, EOFError) as e:
+                logging.error(f"Skipping unreadable cache file {path}: {str(e)}")
+                continue
+            yield key_for_file(path, record), record
+
+    def keys(self):
+        return self.manifest.keys()
+
+    def count(self):
+        return sum(1 for _ in self.path.glob("*.json")) if self.path.exists() else 0
+
+    def flush(self):
+        self.manifest.flush()
+
+    def close(self):
+        self.manifest.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+class SQLiteCacheStore(BufferedSQLite):
+    """
+    All records in one SQLite file with the key (agent URI or snac_<id>) as primary key.
+
+    Records are stored in `codec` (compact JSON text by default; gzip and zstd are
+    stored as blobs) and rows in any codec are readable. put() buffers records and writes them in one
+    transaction every write_batch records (and on flush/close); get() sees buffered
+    records too.
+    """
+
+    backend = "sqlite"
+
+    def __init__(self, db_path, write_batch=DEFAULT_WRITE_BATCH, codec="compact"):
+        self.codec = check_codec(codec)
+        super().__init__(
+            db_path,
+            "CREATE TABLE IF NOT EXISTS records ("
+            "key TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)",
+            "INSERT OR REPLACE INTO records (key, data, updated_at) VALUES (?, ?, ?)",
+            write_batch
+        )
+        self.manifest = CacheManifest(manifest_path_for(self.path), write_batch)
+
+    def location(self, key):
+        return f"{self.path}#{key}"
+
+    def get(self, key):
+        with self._lock:
+            row = self._pending.get(key)
+        if row is None:
+            rows = self._query("SELECT key, data FROM records WHERE key = ?", (key,))
+            row = rows[0] if rows else None
+        return decode(row[1]) if row is not None else None
+
+    def __contains__(self, key):
+        with self._lock:
+            if key in self._pending:
+                return True
+        return bool(self._query("SELECT 1 FROM records WHERE key = ?", (key,)))
+
+    def put(self, key, record):
+        data = encode(record, self.codec)
+        if self.codec in ("json", "compact"):
+            # Keep plain JSON as TEXT so the table stays readable with the sqlite3 shell
+            data = data.decode("utf-8")
+        self._queue(key, (key, data, time.time()))
+        self.manifest.record(key, record)
+        return self.location(key)
+
+    def items(self):
+        self.flush()
+        for key, data in self._query("SELECT key, data FROM records"):
+            yield key, decode(data)
+
+    def unindexed_items(self):
+        """(key, record) for the records the manifest has no entry for."""
+        self.flush()
+        indexed = set(self.manifest.keys())
+        for (key,) in self._query("SELECT key FROM records"):
+            if key not in indexed:
+                yield key, self.get(key)
+
+    def keys(self):
+        return self.manifest.keys()
+
+    def count(self):
+        self.flush()
+        return self._query("SELECT COUNT(*) FROM records")[0][0]
+
+    def flush(self):
+        super().flush()
+        self.manifest.flush()
+
+    def close(self):
+        super().close()
+        self.manifest.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+class WriteBehindCache:
+    """
+    Commits records to a cache store on one background writer thread, so the
+    threads producing them never wait on disk.
+
+    put() queues the record and returns its eventual location at once (it only
+    blocks when max_pending records are already waiting); get() sees queued
+    records. Records are written in the order they were queued. flush() waits
+    until everything queued so far is in the store; close() also stops the
+    thread but leaves the store itself open. Keys whose last write failed are
+    reported by write_failed(), so callers can keep them from counting as done.
+    """
+
+    def __init__(self, store, max_pending=1000):
+        self.store = store
+        self.failed = 0
+        self._failed_keys = set()
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="cache-write-behind", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            entry = self._queue.get()
+            try:
+                if entry is None:
+                    return
+                key, record = entry
+                try:
+                    self.store.put(key, record)
+                    failed = False
+                except Exception as e:
+                    failed = True
+                    logging.error(f"Write-behind cache write of {key} failed: {str(e)}")
+                with self._lock:
+                    if failed:
+                        self.failed += 1
+                        self._failed_keys.add(key)
+                    else:
+                        self._failed_keys.discard(key)
+                    # A newer put of the same key may still be queued behind this one
+                    if self._pending.get(key) is record:
+                        del self._pending[key]
+            finally:
+                self._queue.task_done()
+
+    def put(self, key, record):
+        with self._lock:
+            self._pending[key] = record
+        self._queue.put((key, record))
+        return self.store.location(key)
+
+    def get(self, key):
+        with self._lock:
+            if key in self._pending:
+                return self._pending[key]
+        return self.store.get(key)
+
+    def location(self, key):
+        return self.store.location(key)
+
+    def write_failed(self, key):
+        """Whether the last write of key failed (after flush(), for every key queued before it)."""
+        with self._lock:
+            return key in self._failed_keys
+
+    def flush(self):
+        self._queue.join()
+        self.store.flush()
+
+    def close(self):
+        if not self._thread.is_alive():
+            return
+        self._queue.put(None)
+        self._thread.join()
+        self.store.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+def rebuild_manifest(store):
+    """Re-index every record in a store from scratch; returns the number indexed."""
+    logging.info(f"Rebuilding cache manifest {store.manifest.path}")
+    store.flush()
+    store.manifest.clear()
+    indexed = 0
+    for key, record in store.items():
+        store.manifest.record(key, record)
+        indexed += 1
+    # Only now is the manifest whole; an interrupted rebuild is redone on the next open
+    store.manifest.mark_complete()
+    logging.info(f"Indexed {indexed} records")
+    return indexed
+
+def repair_manifest(store):
+    """Index only the records missing from a complete manifest; returns the number added."""
+    added = 0
+    for key, record in store.unindexed_items():
+        store.manifest.record(key, record)
+        added += 1
+    store.manifest.flush()
+    if added:
+        logging.info(f"Added {added} missing records to cache manifest {store.manifest.path}")
+    return added
+
+def configured_backend(config):
+    """Cache backend from config["settings"]["cache_backend"], or None to auto-detect."""
+    backend = (config or {}).get("settings", {}).get("cache_backend")
+    if backend and backend not in CACHE_BACKENDS:
+        raise ValueError(f"Unknown cache_backend {backend!r}; expected one of {', '.join(CACHE_BACKENDS)}")
+    return backend
+
+def open_cache_store(cache_dir, backend=None, config=None, codec=None):
+    """
+    Open the cache that lives at cache_dir.
+
+    backend (or config["settings"]["cache_backend"]) picks "files" or "sqlite";
+    when neither is set the SQLite file is used if it exists, else the directory.
+    codec (or config["settings"]["cache_codec"]) sets how new records are written;
+    existing records are read whatever their codec.
+    """
+    backend = backend or configured_backend(config)
+    codec = codec or configured_codec(config)
+    if backend is None:
+        backend = "sqlite" if sqlite_path_for(cache_dir).exists() else "files"
+    if backend == "sqlite":
+        store = SQLiteCacheStore(sqlite_path_for(cache_dir), codec=codec or "compact")
+    else:
+        store = FileCacheStore(cache_dir, codec=codec or "json")
+
+    # Caches written before the manifest existed and manifests cut short by an interrupted
+    # rebuild are re-indexed in full. A complete manifest that is behind the store (a
+    # crash between a record write and its manifest entry, or another process's
+    # unflushed entries) only gets the missing keys, so concurrent shards opening the
+    # same cache never clear it under each other
+    manifest = store.manifest
+    if not manifest.is_complete():
+        rebuild_manifest(store)
+    elif manifest.count() < store.count():
+        repair_manifest(store)
+    return store
+
+def key_for_file(path, record):
+    """Recover the exact cache key for a legacy JSON file, using the record's own URI when possible."""
+    stem = path.stem
+    if stem.startswith("snac_"):
+        return stem
+    uri = record.get("uri") if isinstance(record, dict) else None
+    if uri:
+        # Agent records, their patches (record_patch.py) and legacy "_updated" copies
+        for suffix in ("", "_patch", "_updated"):
+            if stem == uri.replace("/", "_") + suffix:
+                return f"{uri}{suffix}"
+    logging.warning(f"Guessing cache key from file name: {path.name}")
+    return "/" + stem.lstrip("_").replace("_", "/")
+
+def import_directory(cache_dir, store):
+    """Copy every file in a cache directory into store; returns the number copied."""
+    source = FileCacheStore(cache_dir)
+    copied = 0
+    try:
+        for key, record in source.items():
+            store.put(key, record)
+            copied += 1
+            if copied % 5000 == 0:
+                logging.info(f"Imported {copied} records")
+    finally:
+        source.close()
+    store.flush()
+    return copied
+
+def main():
+    """Import a directory of JSON cache files into its SQLite cache, or rebuild a cache's manifest."""
+    parser = argparse.ArgumentParser(description="Manage record caches")
+    parser.add_argument("cache_dir", help="Cache directory, e.g. cache/aspace_cache")
+    parser.add_argument("--rebuild-manifest", action="store_true",
+                        help="Re-index the cache's manifest instead of importing into SQLite")
+    parser.add_argument("--codec", choices=CODECS, default="compact", help="Codec for records imported into SQLite")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    cache_dir = Path(args.cache_dir)
+    if args.rebuild_manifest:
+        with open_cache_store(cache_dir) as store:
+            rebuild_manifest(store)
+        return 0
+
+    with SQLiteCacheStore(sqlite_path_for(cache_dir), codec=args.codec) as store:
+        copied = import_directory(cache_dir, store)
+        logging.info(f"Imported {copied} records from {cache_dir} into {store.path}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
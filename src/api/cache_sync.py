@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+#author = will nyarko
+#file name = cache_sync.py
+#description = Sync watermarks and lock_version checks for incremental ArchivesSpace cache refreshes
+"""
+
+import json
+import logging
+import os
+import time
+from pathlib import Path
+
+from src.api.agent_bulk import AGENT_TYPES, DEFAULT_PAGE_SIZE, canonical_agent_uri, iter_agent_pages
+
+# Subtracted from each sync's start time before it becomes the next watermark,
+# so clock skew between us and the server can't hide an edit
+SYNC_MARGIN = 300
+
+def sync_state_path(cache_path):
+    """Sync state lives next to the cache (cache/aspace_cache[.sqlite] -> cache/aspace_cache_sync.json)."""
+    cache_path = Path(cache_path)
+    return cache_path.parent / f"{cache_path.stem}_sync.json"
+
+def load_sync_state(cache_path):
+    """Return {'watermark': epoch seconds, 'pending': [uris]} or None if the cache was never synced."""
+    path = sync_state_path(cache_path)
+    if not path.exists():
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        logging.warning(f"Ignoring unreadable sync state {path}: {str(e)}")
+        return None
+    state.setdefault("pending", [])
+    return state
+
+def save_sync_state(cache_path, sync_started, pending=()):
+    """Record a finished sync. pending lists URIs that failed and must be refreshed next time."""
+    path = sync_state_path(cache_path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    watermark = sync_started - SYNC_MARGIN
+    state = {
+        "watermark": watermark,
+        "watermark_utc": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(watermark)),
+        "pending": sorted(set(pending))
+    }
+    temp_path = path.with_suffix(".tmp")
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(temp_path, path)
+    logging.info(f"Sync watermark saved: {state['watermark_utc']} ({len(state['pending'])} URIs pending)")
+
+def carry_pending(previous, attempted, failed):
+    """Pending URIs for the next sync: this run's failures plus earlier ones it did not retry."""
+    return (set(previous) - set(attempted)) | set(failed)
+
+def fetch_modified_agents(client, since, page_size=DEFAULT_PAGE_SIZE, num_workers=4):
+    """
+    Return ({canonical agent URI: record} for every agent changed since `since`, failed_pages).
+
+    Uses the modified_since filter on the agent listings, so the cost scales with
+    the number of changed agents rather than the size of the repository.
+    """
+    modified = {}
+    failed_pages = 0
+    for agent_type in AGENT_TYPES:
+        for _, _, records, _ in iter_agent_pages(client, agent_type, page_size, num_workers,
+                                                 modified_since=since):
+            if records is None:
+                failed_pages += 1
+                continue
+            for record in records:
+                agent_uri = canonical_agent_uri(record.get("uri", ""))
+                if agent_uri:
+                    modified[agent_uri] = record
+    logging.info(f"{len(modified)} agents modified since "
+                 f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(since))}")
+    return modified, failed_pages
+
+def cached_version(cache, key):
+    """(lock_version, system_mtime) of a cached record from the cache manifest, or None if it isn't cached."""
+    entry = cache.manifest.get(key)
+    if entry is None:
+        return None
+    return entry["lock_version"], entry["system_mtime"]
+
+def is_current(cache, key, server_record):
+    """True if the cached copy has the same lock_version and system_mtime as server_record."""
+    version = cached_version(cache, key)
+    if version is None:
+        return False
+    return version == (server_record.get("lock_version"), server_record.get("system_mtime"))
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+#author = will nyarko
+#file name = checkpoint_journal.py
+#description = Append-only journal of completed records, used to resume a run exactly where it stopped
+"""
+
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+from pathlib import Path
+
+# Statuses that count as done on resume; errors and no-update (dry run) records are processed again
+DONE_STATUSES = ("success",)
+
+class CheckpointJournal:
+    """
+    One JSON line per completed record ({"uri", "status", "at"}) in an append-only file.
+
+    record() only buffers the line, so checkpointing costs the same per record no
+    matter how far the run has got; flush() appends everything buffered and fsyncs
+    it. Callers flush after whatever must be durable before a record counts as
+    done (e.g. its cache writes). On resume, done_uris() replays the journal (the
+    last status of each URI wins; a torn final line is ignored) and the caller
+    skips those URIs, so it doesn't matter in what order records finished.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._buffer = []
+        self._lock = threading.Lock()
+
+    def record(self, uri, status):
+        entry = {"uri": uri, "status": status, "at": datetime.now().isoformat(timespec="seconds")}
+        with self._lock:
+            self._buffer.append(json.dumps(entry, separators=(",", ":")) + "\n")
+
+    def flush(self):
+        with self._lock:
+            if not self._buffer:
+                return
+            with open(self.path, "a+b") as f:
+                # Don't glue new lines onto a line torn by an earlier crash
+                if f.tell() > 0:
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b"\n":
+                        f.write(b"\n")
+                f.write("".join(self._buffer).encode("utf-8"))
+                f.flush()
+                os.fsync(f.fileno())
+            self._buffer.clear()
+
+    def statuses(self):
+        """Last journaled status of every URI."""
+        statuses = {}
+        if not self.path.exists():
+            return statuses
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line_number, line in enumerate(f, 1):
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # Only the last line can be torn by a crash mid-append
+                    logging.warning(f"Ignoring unreadable line {line_number} of {self.path}")
+                    continue
+                statuses[entry["uri"]] = entry["status"]
+        return statuses
+
+    def done_uris(self, done_statuses=DONE_STATUSES):
+        """URIs whose last journaled status means they need no more work."""
+        return {uri for uri, status in self.statuses().items() if status in done_statuses}
+
+    def rotate(self):
+        """Move an existing journal aside (journal.jsonl -> journal_<timestamp>.jsonl) to start afresh."""
+        self.flush()
+        if not self.path.exists():
+            return None
+        rotated = self.path.with_name(f"{self.path.stem}_{datetime.now().strftime('%Y%m%d_%H%M%S')}{self.path.suffix}")
+        os.replace(self.path, rotated)
+        return rotated
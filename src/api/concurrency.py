@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+#author = will nyarko
+#file name = concurrency.py
+#description = AIMD adaptive concurrency controller driven by ArchivesSpace latency and error rates
+"""
+
+import asyncio
+import logging
+import threading
+from contextlib import asynccontextmanager, contextmanager
+
+class AIMDController:
+    """
+    Additive-increase / multiplicative-decrease limit on in-flight requests.
+
+    The HTTP clients call record() after every request with its latency and whether
+    it failed under load (5xx, 429, timeout or connection error). Every `window`
+    samples the controller looks at the window: if the error rate is above
+    error_threshold or the mean latency is above latency_target the limit is
+    multiplied by decrease_factor, otherwise it grows by `increase`. The limit
+    always stays within [floor, ceiling].
+
+    Callers gate requests with slot() (threads) or async_slot() (asyncio), so the
+    number of concurrent requests follows the limit even when more workers exist.
+    """
+
+    def __init__(self, floor=1, ceiling=16, initial=None, increase=1, decrease_factor=0.5,
+                 latency_target=2.0, error_threshold=0.05, window=20):
+        self.floor = max(1, int(floor))
+        self.ceiling = max(self.floor, int(ceiling))
+        self.increase = increase
+        self.decrease_factor = decrease_factor
+        self.latency_target = latency_target
+        self.error_threshold = error_threshold
+        self.window = max(1, int(window))
+
+        start = self.floor if initial is None else initial
+        self._limit = min(self.ceiling, max(self.floor, int(start)))
+        self._in_flight = 0
+        self._cond = threading.Condition()
+
+        # Samples for the current evaluation window
+        self._latencies = []
+        self._failures = 0
+
+    @property
+    def limit(self):
+        """Current number of requests allowed in flight."""
+        return self._limit
+
+    @property
+    def in_flight(self):
+        """Number of requests currently holding a slot."""
+        return self._in_flight
+
+    def _try_acquire(self):
+        with self._cond:
+            if self._in_flight < self._limit:
+                self._in_flight += 1
+                return True
+            return False
+
+    def _release(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify()
+
+    @contextmanager
+    def slot(self):
+        """Block the calling thread until a request slot is free."""
+        with self._cond:
+            while self._in_flight >= self._limit:
+                self._cond.wait()
+            self._in_flight += 1
+        try:
+            yield
+        finally:
+            self._release()
+
+    @asynccontextmanager
+    async def async_slot(self, poll_interval=0.1):
+        """Wait (without blocking the event loop) until a request slot is free.
+
+        Coroutines poll while the limit is saturated, so callers should also cap
+        the number of waiting coroutines at the ceiling (e.g. with a semaphore).
+        """
+        while not self._try_acquire():
+            await asyncio.sleep(poll_interval)
+        try:
+            yield
+        finally:
+            self._release()
+
+    def record(self, latency, failed=False):
+        """Record one completed request and adjust the limit at the end of each window."""
+        with self._cond:
+            self._latencies.append(latency)
+            if failed:
+                self._failures += 1
+
+            if len(self._latencies) < self.window:
+                return
+
+            samples = len(self._latencies)
+            error_rate = self._failures / samples
+            mean_latency = sum(self._latencies) / samples
+            self._latencies = []
+            self._failures = 0
+
+            old_limit = self._limit
+            overloaded = error_rate > self.error_threshold or (
+                self.latency_target is not None and mean_latency > self.latency_target
+            )
+
+            if overloaded:
+                self._limit = max(self.floor, int(self._limit * self.decrease_factor))
+            else:
+                self._limit = min(self.ceiling, self._limit + self.increase)
+
+            if self._limit > old_limit:
+                # New capacity: wake as many blocked threads as there are new slots
+                self._cond.notify(self._limit - old_limit)
+
+        if self._limit != old_limit:
+            logging.info(f"Concurrency limit {old_limit} -> {self._limit} "
+                         f"(error rate {error_rate:.1%}, mean latency {mean_latency:.2f}s)")
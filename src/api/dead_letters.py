@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+#author = will nyarko
+#file name = dead_letters.py
+#description = Persistent store of records that failed for good, kept with their error class for a later replay
+"""
+
+import json
+import sys
+import time
+from pathlib import Path
+
+# Add project root to sys.path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from src.api.cache_store import DEFAULT_WRITE_BATCH, BufferedSQLite
+
+# Shared by every run of update_aspace_prod.py
+DEAD_LETTER_PATH = Path("cache/dead_letters.sqlite")
+
+class DeadLetterStore(BufferedSQLite):
+    """
+    One row per (environment, record key) whose last attempt failed: the source
+    row it came from, the error class and message, and how many attempts it got.
+
+    A record that later succeeds is resolved, i.e. removed, so the store always
+    holds exactly what --replay-dead-letters still has to retry. Record keys are
+    the job table's (canonical agent URI, or the row itself without one).
+    """
+
+    FIELDS = ("environment", "key", "payload", "error_class", "message", "attempts", "failed_at")
+
+    def __init__(self, db_path=DEAD_LETTER_PATH, write_batch=DEFAULT_WRITE_BATCH):
+        super().__init__(
+            db_path,
+            "CREATE TABLE IF NOT EXISTS dead_letters ("
+            "environment TEXT NOT NULL, key TEXT NOT NULL, payload TEXT NOT NULL, error_class TEXT NOT NULL, "
+            "message TEXT, attempts INTEGER NOT NULL, failed_at REAL NOT NULL, PRIMARY KEY (environment, key))",
+            "INSERT OR REPLACE INTO dead_letters (environment, key, payload, error_class, message, attempts, failed_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            write_batch
+        )
+        self._resolved = set()
+
+    def add(self, environment, key, payload, error_class, message, attempts):
+        with self._lock:
+            self._resolved.discard((environment, key))
+        self._queue((environment, key), (environment, key, json.dumps(payload), error_class or "Unknown",
+                                         message, attempts, time.time()))
+
+    def resolve(self, environment, key):
+        """Drop a record that has now succeeded (a no-op if it was never dead-lettered)."""
+        with self._lock:
+            self._pending.pop((environment, key), None)
+            self._resolved.add((environment, key))
+
+    def flush(self):
+        with self._lock:
+            super().flush()
+            if self._resolved:
+                with self._conn:
+                    self._conn.executemany("DELETE FROM dead_letters WHERE environment = ? AND key = ?",
+                                           list(self._resolved))
+                self._resolved.clear()
+
+    def entries(self, environment, error_class=None):
+        """Dead letters of an environment (optionally one error class) as dicts, oldest first."""
+        self.flush()
+        sql = f"SELECT {', '.join(self.FIELDS)} FROM dead_letters WHERE environment = ?"
+        params = (environment,)
+        if error_class:
+            sql += " AND error_class = ?"
+            params += (error_class,)
+        entries = []
+        for row in self._query(sql + " ORDER BY failed_at", params):
+            entry = dict(zip(self.FIELDS, row))
+            entry["payload"] = json.loads(entry["payload"])
+            entries.append(entry)
+        return entries
+
+    def error_classes(self, environment=None):
+        """Dead-letter counts per (environment, error class)."""
+        self.flush()
+        if environment is None:
+            return self._query("SELECT environment, error_class, COUNT(*) FROM dead_letters "
+                               "GROUP BY environment, error_class ORDER BY environment, COUNT(*) DESC")
+        return self._query("SELECT environment, error_class, COUNT(*) FROM dead_letters WHERE environment = ? "
+                           "GROUP BY error_class ORDER BY COUNT(*) DESC", (environment,))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+def main():
+    """Show how many dead letters each environment holds per error class."""
+    path = sys.argv[1] if len(sys.argv) > 1 else DEAD_LETTER_PATH
+    with DeadLetterStore(path) as store:
+        for environment, error_class, count in store.error_classes():
+            print(f"{environment}  {error_class}: {count}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
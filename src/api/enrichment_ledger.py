@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+#author = will nyarko
+#file name = enrichment_ledger.py
+#description = Cross-run ledger of agents that already carry their SNAC ARK, so reruns can skip them without a GET
+"""
+
+import logging
+import time
+from pathlib import Path
+
+from src.api.agent_bulk import DEFAULT_CHUNK_SIZE, canonical_agent_uri, fetch_agents_bulk
+from src.api.cache_store import DEFAULT_WRITE_BATCH, BufferedSQLite
+
+# Shared by update_aspace.py and update_aspace_prod.py
+LEDGER_PATH = Path("cache/enrichment_ledger.sqlite")
+
+class EnrichmentLedger(BufferedSQLite):
+    """
+    One row per (environment, agent URI) that is known to carry a SNAC ARK: the
+    ARK, the agent's lock_version at that point, and whether we added the ARK
+    ("added") or found it already there ("present").
+
+    The environment is the ArchivesSpace API base URL, so test and production
+    entries never mix. Agent URIs are stored in canonical /agents/<type>/<id> form.
+    """
+
+    FIELDS = ("environment", "uri", "snac_ark", "lock_version", "status", "updated_at")
+
+    def __init__(self, db_path=LEDGER_PATH, write_batch=DEFAULT_WRITE_BATCH):
+        super().__init__(
+            db_path,
+            "CREATE TABLE IF NOT EXISTS ledger ("
+            "environment TEXT NOT NULL, uri TEXT NOT NULL, snac_ark TEXT NOT NULL, lock_version INTEGER, "
+            "status TEXT NOT NULL, updated_at REAL NOT NULL, PRIMARY KEY (environment, uri))",
+            "INSERT OR REPLACE INTO ledger (environment, uri, snac_ark, lock_version, status, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            write_batch
+        )
+
+    @staticmethod
+    def _key(environment, agent_uri):
+        return environment, canonical_agent_uri(agent_uri) or agent_uri
+
+    def record(self, environment, agent_uri, snac_ark, lock_version, status):
+        """Note that agent_uri carries snac_ark as of lock_version."""
+        key = self._key(environment, agent_uri)
+        self._queue(key, key + (snac_ark, lock_version, status, time.time()))
+
+    def get(self, environment, agent_uri):
+        """Ledger entry for an agent as a dict, or None."""
+        key = self._key(environment, agent_uri)
+        with self._lock:
+            row = self._pending.get(key)
+        if row is None:
+            rows = self._query(f"SELECT {', '.join(self.FIELDS)} FROM ledger WHERE environment = ? AND uri = ?", key)
+            row = rows[0] if rows else None
+        return dict(zip(self.FIELDS, row)) if row is not None else None
+
+    def is_enriched(self, environment, agent_uri):
+        """True if the ledger says this agent already carries a SNAC ARK (the updaters' has_snac_ark rule)."""
+        return self.get(environment, agent_uri) is not None
+
+    def forget(self, environment, agent_uri):
+        """Drop an entry that turned out to be stale."""
+        key = self._key(environment, agent_uri)
+        with self._lock:
+            self.flush()
+            with self._conn:
+                self._conn.execute("DELETE FROM ledger WHERE environment = ? AND uri = ?", key)
+
+    def count(self, environment=None):
+        self.flush()
+        if environment is None:
+            return self._query("SELECT COUNT(*) FROM ledger")[0][0]
+        return self._query("SELECT COUNT(*) FROM ledger WHERE environment = ?", (environment,))[0][0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+def stale_ledger_entries(client, ledger, agent_uris, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Check ledger entries against the server by lock_version alone.
+
+    Agents are fetched through the id_set[] listings (one request per chunk_size
+    agents); an agent whose lock_version moved on, or that no longer exists, is
+    forgotten so it gets processed normally. Returns the set of stale URIs.
+    """
+    environment = client.api_url
+    records, missing = fetch_agents_bulk(client, list(agent_uris), chunk_size=chunk_size)
+    stale = set(missing)
+    for agent_uri, record in records.items():
+        entry = ledger.get(environment, agent_uri)
+        if entry is None or entry["lock_version"] != record.get("lock_version"):
+            stale.add(agent_uri)
+    for agent_uri in stale:
+        ledger.forget(environment, agent_uri)
+    logging.info(f"Ledger verification: {len(stale)} of {len(records) + len(missing)} entries were stale")
+    return stale
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+#author = will nyarko
+#file name = job_queue.py
+#description = SQLite job table that several worker processes pull records from under time-limited leases
+"""
+
+import json
+import logging
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+# Add project root to sys.path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from src.api.retry import retry_delay
+
+# Job states
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+# Seconds a worker may hold a job before it is handed to someone else
+DEFAULT_LEASE_SECONDS = 1800
+
+# Attempts per job (retries and abandoned leases alike) before it is given up on
+DEFAULT_MAX_ATTEMPTS = 3
+
+def default_worker_id():
+    """host:pid, unique across the machines and processes sharing a job table."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+class JobTable:
+    """
+    One row per record to process, shared by any number of worker processes.
+
+    Workers claim() a few pending jobs at a time; a claim is a lease that expires
+    after lease_seconds, so jobs held by a worker that crashed or hung are
+    claimed again by the others. complete() only counts while the worker still
+    holds the lease. Claims run in BEGIN IMMEDIATE transactions, so two workers
+    never get the same job, and workers can join or leave at any point.
+
+    A job that failed transiently goes back with retry(): it is pending again but
+    not claimable before its next-attempt time, so no worker waits on it.
+
+    Within a process the table is shared by threads (leased_jobs claims on the
+    pipeline's producer thread while results are completed on the main one), so
+    every use of the single connection goes through one lock.
+    """
+
+    def __init__(self, db_path, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        self.path = Path(db_path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_attempts = max_attempts
+        self._lock = threading.RLock()
+        # Autocommit mode so transactions are opened explicitly with BEGIN IMMEDIATE
+        self._conn = sqlite3.connect(str(self.path), timeout=60, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id INTEGER PRIMARY KEY, key TEXT UNIQUE NOT NULL, payload TEXT NOT NULL, "
+            "status TEXT NOT NULL DEFAULT 'pending', worker TEXT, lease_expires REAL, "
+            "attempts INTEGER NOT NULL DEFAULT 0, result_status TEXT, updated_at REAL, available_at REAL)"
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        if "available_at" not in columns:
+            # Tables created before delayed retries existed
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN available_at REAL")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, lease_expires)")
+
+    @contextmanager
+    def _transaction(self):
+        # Transactions belong to the connection, so only one thread may hold one at a time
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def add(self, jobs):
+        """Add (key, payload) pairs; keys already in the table are left alone. Returns the number added."""
+        now = time.time()
+        with self._transaction() as conn:
+            before = conn.execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+            conn.executemany(
+                "INSERT OR IGNORE INTO jobs (key, payload, updated_at) VALUES (?, ?, ?)",
+                ((key, json.dumps(payload), now) for key, payload in jobs)
+            )
+            return conn.execute("SELECT COUNT(*) FROM jobs").fetchone()[0] - before
+
+    def claim(self, worker_id, limit=1, lease_seconds=DEFAULT_LEASE_SECONDS):
+        """
+        Lease up to limit jobs that are pending (and due) or whose lease has expired.
+
+        Returns [(job_id, key, payload)]. Expired jobs that already used up
+        max_attempts are marked failed instead of being handed out again.
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, result_status = 'abandoned', updated_at = ? "
+                "WHERE status = ? AND lease_expires < ? AND attempts >= ?",
+                (FAILED, now, LEASED, now, self.max_attempts)
+            )
+            rows = conn.execute(
+                "SELECT id, key, payload FROM jobs "
+                "WHERE (status = ? AND (available_at IS NULL OR available_at <= ?)) "
+                "OR (status = ? AND lease_expires < ?) ORDER BY id LIMIT ?",
+                (PENDING, now, LEASED, now, limit)
+            ).fetchall()
+            conn.executemany(
+                "UPDATE jobs SET status = ?, worker = ?, lease_expires = ?, attempts = attempts + 1, "
+                "updated_at = ? WHERE id = ?",
+                ((LEASED, worker_id, now + lease_seconds, now, job_id) for job_id, _, _ in rows)
+            )
+        return [(job_id, key, json.loads(payload)) for job_id, key, payload in rows]
+
+    def complete(self, worker_id, outcomes):
+        """
+        Finish jobs this worker holds, from (job_id, result_status, failed) triples.
+
+        Returns the job ids whose lease had already passed to another worker;
+        those are left for that worker to finish.
+        """
+        lost = []
+        now = time.time()
+        with self._transaction() as conn:
+            for job_id, result_status, failed in outcomes:
+                cursor = conn.execute(
+                    "UPDATE jobs SET status = ?, result_status = ?, lease_expires = NULL, updated_at = ? "
+                    "WHERE id = ? AND worker = ? AND status = ?",
+                    (FAILED if failed else DONE, result_status, now, job_id, worker_id, LEASED)
+                )
+                if cursor.rowcount != 1:
+                    lost.append(job_id)
+        return lost
+
+    def retry(self, worker_id, job_id, retry_after=None):
+        """
+        Put a job this worker holds back as pending, claimable again after a
+        backoff (retry_after from the server if given). Returns the delay, or None
+        if the job used up max_attempts (or the lease was lost) and was not requeued.
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute("SELECT attempts FROM jobs WHERE id = ? AND worker = ? AND status = ?",
+                               (job_id, worker_id, LEASED)).fetchone()
+            if row is None or row[0] >= self.max_attempts:
+                return None
+            delay = retry_delay(row[0] - 1, retry_after)
+            conn.execute(
+                "UPDATE jobs SET status = ?, worker = NULL, lease_expires = NULL, available_at = ?, "
+                "result_status = 'retry', updated_at = ? WHERE id = ?",
+                (PENDING, now + delay, now, job_id)
+            )
+            return delay
+
+    def attempts(self, job_id):
+        """Times a job has been claimed so far."""
+        rows = self._query("SELECT attempts FROM jobs WHERE id = ?", (job_id,))
+        return rows[0][0] if rows else 0
+
+    def release(self, worker_id):
+        """Hand every job this worker still holds back to the queue (on a clean shutdown)."""
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, worker = NULL, lease_expires = NULL, attempts = MAX(attempts - 1, 0), "
+                "updated_at = ? WHERE worker = ? AND status = ?",
+                (PENDING, time.time(), worker_id, LEASED)
+            )
+            return cursor.rowcount
+
+    def counts(self):
+        """Number of jobs in each state."""
+        rows = self._query("SELECT status, COUNT(*) FROM jobs GROUP BY status")
+        counts = {PENDING: 0, LEASED: 0, DONE: 0, FAILED: 0}
+        counts.update(dict(rows))
+        return counts
+
+    def next_wakeup(self, worker_id=None):
+        """
+        Earliest time a job may become claimable (another worker's lease expiring or
+        a delayed retry coming due), or None when nothing is leased or waiting.
+        """
+        return self._query(
+            "SELECT MIN(CASE WHEN status = ? THEN lease_expires ELSE available_at END) FROM jobs "
+            "WHERE (status = ? AND worker IS NOT ?) OR (status = ? AND available_at IS NOT NULL)",
+            (LEASED, LEASED, worker_id, PENDING)
+        )[0][0]
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+def leased_jobs(jobs, worker_id, batch_size=5, lease_seconds=DEFAULT_LEASE_SECONDS, poll_seconds=5, busy=None,
+                on_claim=None):
+    """
+    Yield (job_id, payload) as this worker claims them, batch_size at a time.
+
+    Claims happen only as fast as the consumer pulls, so a worker never sits on
+    more jobs than it can start. When nothing is claimable but other workers hold
+    leases or jobs are waiting to be retried, it polls so it can pick them up when
+    they come due. busy() should say whether this worker still has claimed jobs in
+    progress (they may come back as retries); once it is not busy and nothing is
+    leased elsewhere or waiting, it stops. on_claim(payloads) runs on each claimed
+    batch before its jobs are yielded, e.g. to prefetch them together.
+    """
+    while True:
+        claimed = jobs.claim(worker_id, batch_size, lease_seconds)
+        if claimed:
+            if on_claim is not None:
+                on_claim([payload for _, _, payload in claimed])
+            for job_id, _, payload in claimed:
+                yield job_id, payload
+            continue
+
+        wakeup = jobs.next_wakeup(worker_id)
+        if wakeup is None:
+            if busy is None or not busy():
+                return
+            time.sleep(min(poll_seconds, 1.0))
+            continue
+        time.sleep(min(poll_seconds, max(0.0, wakeup - time.time()) + 0.1))
+
+def main():
+    """Show how many jobs of a job table are in each state."""
+    if len(sys.argv) != 2:
+        print("Usage: python job_queue.py <jobs.sqlite>")
+        return 1
+    with JobTable(sys.argv[1]) as jobs:
+        for status, count in jobs.counts().items():
+            print(f"{status}: {count}")
+    return 0
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
@@ -7,7 +7,6 @@
 
 import json
 import time
-import requests
 import logging
 import pandas as pd
 import os
@@ -17,6 +16,12 @@ from pathlib import Path
 # Add project root to sys.path
 sys.path.insert(0, str(Path(__file__).parent.parent.parent))
 
+from src.api.agent_bulk import canonical_agent_uri
+from src.api.aspace_client import ArchivesSpaceClient
+from src.api.cache_store import open_cache_store
+from src.api.cache_sync import carry_pending, fetch_modified_agents, is_current, load_sync_state, save_sync_state
+from src.api.rate_limit import aspace_rate_limits
+
 # Configuration paths
 CONFIG_PATH = "config.json"
 MASTER_CSV_PATH = "src/data/master_spreadsheet.csv"
@@ -44,52 +49,38 @@ def load_config(config_path):
     with open(config_path, "r", encoding="utf-8") as f:
         return json.load(f)
 
-def authenticate(api_url, username, password):
-    """Authenticate with the ArchivesSpace API and return session token."""
-    login_endpoint = f"{api_url}/users/{username}/login"
-    
-    try:
-        response = requests.post(login_endpoint, data={"password": password})
-        response.raise_for_status()
-        token = response.json().get("session")
-        if token:
-            return token
-        raise ValueError("Authentication failed: no session token returned.")
-    except Exception as e:
-        logging.error(f"Authentication failed: {str(e)}")
-        raise
-
-def get_agent_record(api_url, agent_uri, session_token):
+def get_agent_record(client, agent_uri):
     """Retrieve the agent record from ArchivesSpace."""
-    headers = {
-        "X-ArchivesSpace-Session": session_token,
-        "Accept": "application/json"
-    }
-    url = f"{api_url}{agent_uri}"
-    
     try:
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-        return response.json()
+        return client.get_json(agent_uri)
     except Exception as e:
         logging.error(f"Error retrieving {agent_uri}: {str(e)}")
         raise
 
-def cache_agent_record(agent_data, cache_dir, agent_uri):
-    """Cache agent record as JSON file."""
-    # Replace slashes with underscores in agent URI for filename
-    filename = agent_uri.replace("/", "_") + ".json"
-    filepath = cache_dir / filename
-    
-    with open(filepath, "w", encoding="utf-8") as f:
-        json.dump(agent_data, f, indent=2)
-    
-    return filepath
+def cache_agent_record(agent_data, cache, agent_uri):
+    """Cache agent record in the cache store under its URI."""
+    return cache.put(agent_uri, agent_data)
 
-def query_and_cache_agents(api_url, session_token, df, cache_dir, batch_size=50):
-    """Query ArchivesSpace API for agent records and cache them."""
-    # Create cache directory if it doesn't exist
-    cache_dir.mkdir(parents=True, exist_ok=True)
+def query_and_cache_agents(client, df, cache, batch_size=50):
+    """Query ArchivesSpace API for agent records and cache them.
+    
+    Cached records are reused unless ArchivesSpace reports them modified since the
+    last sync watermark (or they failed last time); modified records come straight
+    from the listing, so only uncached agents need their own GET. Without a
+    watermark cached records can't be checked, so none is written either;
+    build_aspace_cache.py --incremental establishes the first one.
+    """
+    sync_started = time.time()
+    modified = {}
+    pending = set()
+    sync_state = load_sync_state(cache.path)
+    if sync_state:
+        modified, failed_pages = fetch_modified_agents(client, sync_state['watermark'], num_workers=1)
+        if failed_pages:
+            raise RuntimeError(f"{failed_pages} modified-agent listing pages failed; cache freshness unknown")
+        pending = set(sync_state['pending'])
+    failed_uris = []
+    attempted_uris = set()
     
     total_records = len(df)
     success_count = 0
@@ -112,39 +103,47 @@ def query_and_cache_agents(api_url, session_token, df, cache_dir, batch_size=50)
             agent_uri = row['aspace_uri']
             agent_name = row['agent_name']
             
-            # Skip if the record is already cached
-            cache_filename = agent_uri.replace("/", "_") + ".json"
-            if (cache_dir / cache_filename).exists():
+            # Skip if the cached record is still current
+            canonical_uri = canonical_agent_uri(agent_uri)
+            server_record = modified.get(canonical_uri)
+            attempted_uris.add(canonical_uri)
+            if agent_uri in cache and canonical_uri not in pending and (
+                server_record is None or is_current(cache, agent_uri, server_record)
+            ):
                 logging.info(f"Record already cached: {agent_name} ({agent_uri})")
-                df.at[idx, 'aspace_cache_path'] = str(cache_dir / cache_filename)
+                df.at[idx, 'aspace_cache_path'] = cache.location(agent_uri)
                 success_count += 1
                 continue
             
             try:
-                logging.info(f"Querying ArchivesSpace for {agent_name} ({agent_uri})")
-                
-                # Get agent record from ArchivesSpace
-                agent_data = get_agent_record(api_url, agent_uri, session_token)
+                # Get agent record from ArchivesSpace, unless the modified listing already returned it
+                if server_record is not None:
+                    logging.info(f"Refreshing modified record: {agent_name} ({agent_uri})")
+                    agent_data = server_record
+                else:
+                    logging.info(f"Querying ArchivesSpace for {agent_name} ({agent_uri})")
+                    agent_data = get_agent_record(client, agent_uri)
                 
                 # Cache agent record
-                cache_path = cache_agent_record(agent_data, cache_dir, agent_uri)
+                cache_path = cache_agent_record(agent_data, cache, agent_uri)
                 
                 # Update dataframe with cache path
                 df.at[idx, 'aspace_cache_path'] = str(cache_path)
                 
                 success_count += 1
                 
-                # Add a short delay to avoid overwhelming the API
-                time.sleep(0.1)
-                
             except Exception as e:
                 logging.error(f"Error processing {agent_name} ({agent_uri}): {str(e)}")
                 df.at[idx, 'aspace_error'] = True
                 error_count += 1
-        
-        # Refresh session token every batch to avoid timeouts
-        session_token = authenticate(api_url, username, password)
+                if canonical_uri:
+                    failed_uris.append(canonical_uri)
     
+    cache.flush()
+    if sync_state:
+        save_sync_state(cache.path, sync_started, carry_pending(pending, attempted_uris, failed_uris))
+    else:
+        logging.info("No sync watermark yet: cached records were reused unchecked, so none is saved")
     logging.info(f"ArchivesSpace query complete: {success_count} successes, {error_count} errors")
     return df
 
@@ -152,10 +151,6 @@ def main():
     """Main function to query ArchivesSpace for agent records."""
     # Load configuration
     config = load_config(CONFIG_PATH)
-    aspace_creds = config["credentials"]["archivesspace_api"]
-    api_url = aspace_creds["api_url"]
-    username = aspace_creds["username"]
-    password = aspace_creds["password"]
     csv_encoding = config["settings"].get("csv_encoding", "utf-8")
     
     # Load master spreadsheet
@@ -170,7 +165,11 @@ def main():
     # Authenticate with ArchivesSpace API
     try:
         logging.info("Authenticating with ArchivesSpace API")
-        session_token = authenticate(api_url, username, password)
+        # GETs share the ArchivesSpace budget of every running script (rate_limit.DEFAULT_RATES unless configured)
+        client = ArchivesSpaceClient.from_config(
+            config, pool_size=1, rate_limits=aspace_rate_limits(config)
+        )
+        client.ensure_authenticated()
         logging.info("Authentication successful")
     except Exception as e:
         logging.error(f"Authentication failed: {str(e)}")
@@ -178,7 +177,8 @@ def main():
     
     # Query and cache agent records
     try:
-        updated_df = query_and_cache_agents(api_url, session_token, df, CACHE_DIR)
+        with open_cache_store(CACHE_DIR, config=config) as cache:
+            updated_df = query_and_cache_agents(client, df, cache)
         
         # Save updated dataframe with status information
         logging.info(f"Saving updated master spreadsheet")
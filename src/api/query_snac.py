@@ -6,17 +6,30 @@
 """
 
 import json
-import time
 import requests
 import logging
 import pandas as pd
 import os
 import sys
+import argparse
 from pathlib import Path
+from requests.adapters import HTTPAdapter
 
 # Add project root to sys.path
 sys.path.insert(0, str(Path(__file__).parent.parent.parent))
 
+from src.api.ark_resolver import ArkResolutionTable
+from src.api.cache_store import open_cache_store
+from src.api.rate_limit import SNAC, get_rate_limiter
+from src.api.sharding import parse_shard, select_shard, sharded_path
+from src.api.work_queue import stream_process
+
+# (connect, read) timeouts in seconds for SNAC requests
+SNAC_TIMEOUT = (10, 60)
+
+# Columns query_and_cache_snac fills in for every row
+SNAC_STATUS_COLUMNS = ['snac_error', 'snac_cache_path', 'snac_ark_merged', 'snac_ark_new']
+
 # Configuration paths
 CONFIG_PATH = "config.json"
 MASTER_CSV_PATH = "src/data/master_spreadsheet.csv"
@@ -39,13 +52,36 @@ console = logging.StreamHandler()
 console.setLevel(logging.INFO)
 logging.getLogger('').addHandler(console)
 
+def parse_args():
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(description="Query SNAC for constellation records and cache them")
+    parser.add_argument("--shard", type=parse_shard,
+                        help="Process only shard i of N (e.g. 0/4), partitioned by a stable hash of the SNAC ARK; "
+                             "writes the shard's rows to its own CSV for sharding.py to merge")
+    parser.add_argument("--workers", type=int, default=4,
+                        help="Constellations fetched in parallel (each on its own pooled connection)")
+    parser.add_argument("--rate", type=float,
+                        help="Max SNAC requests/second across all workers (default: config, else 5); "
+                             "processes sharing the budget run at the lowest rate any of them asks for")
+    return parser.parse_args()
+
 def load_config(config_path):
     """Load configuration from JSON file."""
     with open(config_path, "r", encoding="utf-8") as f:
         return json.load(f)
 
-def get_snac_constellation(snac_api_url, snac_ark):
-    """Query the SNAC API for a constellation record."""
+def snac_session(pool_size=4):
+    """requests.Session keeping up to pool_size connections to SNAC open for reuse."""
+    session = requests.Session()
+    # pool_block=True makes extra threads wait for a free connection instead of opening throwaway ones
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, int(pool_size)), pool_block=True)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({"Accept": "application/json"})
+    return session
+
+def get_snac_constellation(snac_api_url, snac_ark, rate_limiter=None, session=None):
+    """Query the SNAC API for a constellation record (through session, if given)."""
     # Build the API URL for the GET constellation command
     api_url = f"{snac_api_url}/rest/read/constellation"
     
@@ -59,8 +95,12 @@ def get_snac_constellation(snac_api_url, snac_ark):
     }
     
     try:
+        # Wait for the shared SNAC request budget
+        if rate_limiter:
+            rate_limiter.acquire()
+        
         # Make the API request
-        response = requests.get(api_url, params=params)
+        response = (session or requests).get(api_url, params=params, timeout=SNAC_TIMEOUT)
         response.raise_for_status()
         
         # Check if we got a redirect (indicating a merged record)
@@ -82,106 +122,143 @@ def get_snac_constellation(snac_api_url, snac_ark):
         logging.error(f"Error retrieving SNAC constellation for {snac_ark}: {str(e)}")
         raise
 
-def cache_snac_record(constellation_data, cache_dir, snac_ark):
-    """Cache SNAC constellation record as JSON file."""
-    # Extract ARK ID for filename
-    ark_id = snac_ark.split("/")[-1]
-    
-    # Create filename
-    filename = f"snac_{ark_id}.json"
-    filepath = cache_dir / filename
-    
-    with open(filepath, "w", encoding="utf-8") as f:
-        json.dump(constellation_data, f, indent=2)
-    
-    return filepath
+def snac_cache_key(snac_ark):
+    """Cache key for a SNAC constellation (snac_<ark id>, also the legacy file name)."""
+    return f"snac_{snac_ark.split('/')[-1]}"
+
+def cache_snac_record(constellation_data, cache, snac_ark):
+    """Cache SNAC constellation record in the cache store."""
+    return cache.put(snac_cache_key(snac_ark), constellation_data)
 
-def query_and_cache_snac(snac_api_url, df, cache_dir, batch_size=50):
-    """Query SNAC API for constellation records and cache them."""
-    # Create cache directory if it doesn't exist
-    cache_dir.mkdir(parents=True, exist_ok=True)
+def row_snac_ark(row):
+    """The SNAC ARK to use for a row: final first, then the others; None if it has none."""
+    for col in ['snac_ark_final', 'snac_ark', 'snac_ark_old']:
+        if col in row and pd.notna(row[col]) and row[col]:
+            return row[col]
+    return None
+
+def query_and_cache_snac(snac_api_url, df, cache, batch_size=50, rate_limiter=None, workers=4, session=None,
+                         ark_table=None):
+    """Query SNAC API for constellation records and cache them.
+    
+    Rows whose constellation is already cached are settled without a request. The
+    rest are fetched by `workers` threads sharing one pooled session (and the
+    rate_limiter budget), and each constellation is cached by the calling thread
+    as it arrives. Rows sharing an ARK share one fetch, whose outcome is applied
+    to each of them. Progress is logged every batch_size records. The status
+    columns (SNAC_STATUS_COLUMNS) are filled in for all rows at once at the end.
     
+    With an ArkResolutionTable, ARKs it knows were merged are looked up (and
+    cached) under their terminal ARK directly, and merges seen as redirects are
+    added to it.
+    """
     total_records = len(df)
     success_count = 0
     error_count = 0
     merge_count = 0
     
-    # Add columns to track SNAC API query status
-    df['snac_error'] = False
-    df['snac_cache_path'] = None
-    df['snac_ark_merged'] = False
-    df['snac_ark_new'] = None
+    # Status per row index: (snac_error, snac_cache_path, snac_ark_merged, snac_ark_new)
+    outcomes = {}
+    # cache key -> (ARK to fetch, [(row index, agent name, known merge)]), one fetch per constellation
+    pending = {}
     
     logging.info(f"Starting SNAC query for {total_records} constellation records")
     
-    # Process in batches to avoid overloading the API
-    for start_idx in range(0, total_records, batch_size):
-        end_idx = min(start_idx + batch_size, total_records)
-        batch_df = df.iloc[start_idx:end_idx].copy()
+    for idx, row in df.iterrows():
+        snac_ark = row_snac_ark(row)
+        if not snac_ark:
+            logging.warning(f"No SNAC ARK found for record at index {idx}")
+            outcomes[idx] = (True, None, False, None)
+            error_count += 1
+            continue
         
-        logging.info(f"Processing batch {start_idx//batch_size + 1}: records {start_idx+1}-{end_idx} of {total_records}")
+        # Known merges need no redirect to discover
+        current_ark = ark_table.current_ark(snac_ark) if ark_table is not None else snac_ark
+        known_merge = current_ark if current_ark != snac_ark else None
+        if known_merge:
+            merge_count += 1
         
-        for idx, row in batch_df.iterrows():
-            # Find the SNAC ARK to use - check final first, then others
-            snac_ark = None
-            for col in ['snac_ark_final', 'snac_ark', 'snac_ark_old']:
-                if col in row and pd.notna(row[col]) and row[col]:
-                    snac_ark = row[col]
-                    break
-            
-            if not snac_ark:
-                logging.warning(f"No SNAC ARK found for record at index {idx}")
-                df.at[idx, 'snac_error'] = True
-                error_count += 1
-                continue
-            
-            agent_name = row['agent_name']
-            
-            # Extract ARK ID for caching
-            ark_id = snac_ark.split("/")[-1]
-            cache_filename = f"snac_{ark_id}.json"
-            
-            # Skip if the record is already cached
-            if (cache_dir / cache_filename).exists():
-                logging.info(f"Record already cached: {agent_name} ({snac_ark})")
-                df.at[idx, 'snac_cache_path'] = str(cache_dir / cache_filename)
-                success_count += 1
-                continue
-            
-            try:
-                logging.info(f"Querying SNAC for {agent_name} ({snac_ark})")
-                
-                # Get constellation record from SNAC
-                constellation_data, new_ark = get_snac_constellation(snac_api_url, snac_ark)
+        # Skip if the record is already cached
+        cache_key = snac_cache_key(current_ark)
+        if cache_key in cache:
+            logging.debug(f"Record already cached: {row['agent_name']} ({current_ark})")
+            outcomes[idx] = (False, cache.location(cache_key), bool(known_merge), known_merge)
+            success_count += 1
+            continue
+        
+        pending.setdefault(cache_key, (current_ark, []))[1].append((idx, row['agent_name'], known_merge))
+    
+    pending_rows = sum(len(rows) for _, rows in pending.values())
+    logging.info(f"{total_records - pending_rows} records settled from the cache or without an ARK; "
+                 f"fetching {len(pending)} constellations for {pending_rows} records with {workers} workers")
+    
+    own_session = session is None
+    session = session or snac_session(workers)
+    
+    def fetch(item):
+        snac_ark, rows = item
+        logging.debug(f"Querying SNAC for {rows[0][1]} ({snac_ark})")
+        return get_snac_constellation(snac_api_url, snac_ark, rate_limiter, session)
+    
+    def fetch_error(item, e):
+        return e
+    
+    try:
+        fetched = 0
+        for (snac_ark, rows), outcome in stream_process(
+                list(pending.values()), fetch, num_workers=workers, on_error=fetch_error):
+            fetched += 1
+            agent_name = rows[0][1]
+            if isinstance(outcome, Exception):
+                logging.error(f"Error processing {agent_name} ({snac_ark}): {str(outcome)}")
+                for idx, _, known_merge in rows:
+                    outcomes[idx] = (True, None, bool(known_merge), known_merge)
+                error_count += len(rows)
+            else:
+                constellation_data, redirect_ark = outcome
                 
                 # Handle merged ARKs
-                if new_ark:
-                    logging.info(f"ARK merged: {snac_ark} → {new_ark}")
-                    df.at[idx, 'snac_ark_merged'] = True
-                    df.at[idx, 'snac_ark_new'] = new_ark
-                    merge_count += 1
-                
-                # Cache constellation record
-                cache_path = cache_snac_record(constellation_data, cache_dir, new_ark or snac_ark)
-                
-                # Update dataframe with cache path
-                df.at[idx, 'snac_cache_path'] = str(cache_path)
-                
-                success_count += 1
+                if redirect_ark:
+                    logging.info(f"ARK merged: {snac_ark} → {redirect_ark}")
+                    if ark_table is not None:
+                        ark_table.add_merge(snac_ark, redirect_ark, "redirect")
+                    merge_count += sum(1 for _, _, known_merge in rows if not known_merge)
                 
-                # Add a short delay to avoid overwhelming the API
-                time.sleep(0.2)
+                try:
+                    cache_path = cache_snac_record(constellation_data, cache, redirect_ark or snac_ark)
+                    cache_error = None
+                except Exception as e:
+                    logging.error(f"Error caching {agent_name} ({snac_ark}): {str(e)}")
+                    cache_error = e
                 
-            except Exception as e:
-                logging.error(f"Error processing {agent_name} ({snac_ark}): {str(e)}")
-                df.at[idx, 'snac_error'] = True
-                error_count += 1
+                for idx, _, known_merge in rows:
+                    new_ark = redirect_ark or known_merge
+                    if cache_error is None:
+                        outcomes[idx] = (False, str(cache_path), bool(new_ark), new_ark)
+                        success_count += 1
+                    else:
+                        outcomes[idx] = (True, None, bool(new_ark), new_ark)
+                        error_count += 1
+            
+            if fetched % batch_size == 0:
+                logging.info(f"Fetched {fetched}/{len(pending)} constellations "
+                             f"({success_count} successes, {error_count} errors so far)")
+    finally:
+        if own_session:
+            session.close()
+    
+    # One assignment per column instead of one df.at per row and column
+    status = pd.DataFrame.from_dict(outcomes, orient='index', columns=SNAC_STATUS_COLUMNS).reindex(df.index)
+    for column in SNAC_STATUS_COLUMNS:
+        df[column] = status[column]
     
     logging.info(f"SNAC query complete: {success_count} successes, {error_count} errors, {merge_count} merged ARKs")
     return df
 
 def main():
     """Main function to query SNAC for constellation records."""
+    args = parse_args()
+    
     # Load configuration
     config = load_config(CONFIG_PATH)
     snac_api_url = config["apis"]["snac"]["api_url"]
@@ -196,9 +273,20 @@ def main():
         logging.error(f"Error loading master spreadsheet: {str(e)}")
         return 1
     
+    # A shard works on its own slice and leaves the master spreadsheet to the merge
+    output_path = MASTER_CSV_PATH
+    if args.shard:
+        df = select_shard(df, args.shard, ['snac_ark_final', 'snac_ark', 'snac_ark_old'])
+        output_path = sharded_path(MASTER_CSV_PATH, args.shard)
+    
     # Query and cache SNAC records
     try:
-        updated_df = query_and_cache_snac(snac_api_url, df, CACHE_DIR)
+        # All SNAC requests share one budget (--rate, else configured, else the shared default)
+        snac_limiter = get_rate_limiter(config, SNAC, rate=args.rate)
+        with open_cache_store(CACHE_DIR, config=config) as cache, ArkResolutionTable() as ark_table:
+            ark_table.load_id_change_log()
+            updated_df = query_and_cache_snac(snac_api_url, df, cache, rate_limiter=snac_limiter,
+                                              workers=args.workers, ark_table=ark_table)
         
         # Update snac_ark_final column with new ARK if merged
         mask = updated_df['snac_ark_merged'] == True
@@ -217,8 +305,8 @@ def main():
         
         # Save updated dataframe with status information
         logging.info(f"Saving updated master spreadsheet")
-        updated_df.to_csv(MASTER_CSV_PATH, index=False, encoding=csv_encoding)
-        logging.info(f"Updated master spreadsheet saved to {MASTER_CSV_PATH}")
+        updated_df.to_csv(output_path, index=False, encoding=csv_encoding)
+        logging.info(f"Updated master spreadsheet saved to {output_path}")
         
         # Generate summary statistics
         total_records = len(updated_df)
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+#author = will nyarko
+#file name = rate_limit.py
+#description = Process-wide (and cross-process) token-bucket rate limits per API target
+"""
+
+import asyncio
+import re
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows: buckets are shared between threads but not between processes
+    fcntl = None
+
+# Bucket state files live here so concurrently running scripts share one budget
+RATE_LIMIT_DIR = Path("cache/rate_limits")
+
+# Budget names used across the project
+ASPACE_GET = "aspace_get"
+ASPACE_POST = "aspace_post"
+SNAC = "snac"
+
+# Requests/second per budget when config["settings"]["rate_limits"] doesn't set one,
+# the same for every script (None: unlimited)
+DEFAULT_RATES = {ASPACE_GET: 10, ASPACE_POST: None, SNAC: 5}
+
+# A lower rate set by another process holds this long after that process last drew
+RATE_HOLD_SECONDS = 60
+
+# Five doubles: tokens currently available, the wall-clock time they were computed,
+# the rate and capacity the bucket is drawn at, and when that rate was last claimed
+_STATE = struct.Struct("ddddd")
+
+class TokenBucket:
+    """
+    Token bucket allowing `rate` requests per second with bursts up to `burst`.
+
+    Each acquire reserves a token immediately, letting the balance go negative, and
+    the caller sleeps off the deficit. Waiting callers therefore queue up at exactly
+    `rate` per second instead of polling. The balance is kept in a small state file
+    guarded by flock, so every thread in every process using the same bucket name
+    draws from one budget. The file records the rate and burst it is drawn at: when
+    processes sharing a bucket ask for different rates the lowest wins, until the
+    process that asked for it has not drawn for RATE_HOLD_SECONDS.
+    """
+
+    def __init__(self, name, rate, burst=None, state_dir=RATE_LIMIT_DIR):
+        if rate <= 0:
+            raise ValueError(f"Rate for {name} must be positive, got {rate}")
+        self.name = name
+        self.rate = float(rate)
+        self.capacity = float(burst) if burst else max(1.0, self.rate)
+        self.state_path = Path(state_dir) / f"{name}.bucket"
+        self._thread_lock = threading.Lock()
+        self._local_state = None
+
+    @contextmanager
+    def _locked_state_file(self):
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.state_path, "a+b") as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield f
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def _take(self, state, tokens, now):
+        if state is None:
+            available, rate, capacity, rate_claimed = self.capacity, self.rate, self.capacity, now
+        else:
+            available, updated, rate, capacity, rate_claimed = state
+            # max() guards against wall-clock steps backwards
+            available = min(capacity, available + max(0.0, now - updated) * rate)
+            if self.rate <= rate or now - rate_claimed > RATE_HOLD_SECONDS:
+                # Ours is the lowest rate, or whoever set a lower one has gone quiet
+                rate, capacity, rate_claimed = self.rate, self.capacity, now
+                available = min(available, capacity)
+        available -= tokens
+        wait = -available / rate if available < 0 else 0.0
+        return (available, now, rate, capacity, rate_claimed), wait
+
+    def reserve(self, tokens=1):
+        """Take tokens from the bucket and return how many seconds the caller must wait."""
+        with self._thread_lock:
+            now = time.time()
+
+            if fcntl is None:
+                self._local_state, wait = self._take(self._local_state, tokens, now)
+                return wait
+
+            with self._locked_state_file() as f:
+                f.seek(0)
+                raw = f.read(_STATE.size)
+                state = _STATE.unpack(raw) if len(raw) == _STATE.size else None
+                new_state, wait = self._take(state, tokens, now)
+                f.seek(0)
+                f.truncate()
+                f.write(_STATE.pack(*new_state))
+                f.flush()
+            return wait
+
+    def acquire(self, tokens=1):
+        """Block the calling thread until it may make a request."""
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self, tokens=1):
+        """Wait, without blocking the event loop, until the caller may make a request."""
+        # reserve() takes a thread lock and flocks the state file, so keep it off the loop
+        wait = await asyncio.to_thread(self.reserve, tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+def aspace_bucket_name(name, api_url):
+    """Bucket name scoped to one ArchivesSpace instance, so test and production runs keep separate budgets."""
+    target = re.sub(r"^\w+://", "", api_url or "").rstrip("/")
+    target = re.sub(r"[^A-Za-z0-9.-]+", "_", target)
+    return f"{name}-{target}" if target else name
+
+def configured_rate(config, name):
+    """Requests/second for a budget from config["settings"]["rate_limits"], or DEFAULT_RATES."""
+    rate_limits = (config or {}).get("settings", {}).get("rate_limits", {})
+    return rate_limits.get(name, DEFAULT_RATES.get(name))
+
+def get_rate_limiter(config, name, bucket_name=None, rate=None):
+    """TokenBucket for a budget (rate overrides config), or None when the budget is unlimited."""
+    rate = rate or configured_rate(config, name)
+    if not rate:
+        return None
+    return TokenBucket(bucket_name or name, rate)
+
+def aspace_rate_limits(config, api_url=None, get_rate=None, post_rate=None):
+    """
+    Per-method ArchivesSpace buckets for ArchivesSpaceClient(rate_limits=...).
+
+    Buckets are per instance: api_url defaults to the configured ArchivesSpace API URL.
+    get_rate/post_rate override the configured rates for this process.
+    """
+    api_url = api_url or (config or {}).get("credentials", {}).get("archivesspace_api", {}).get("api_url")
+    limits = {}
+    get_limiter = get_rate_limiter(config, ASPACE_GET, aspace_bucket_name(ASPACE_GET, api_url), get_rate)
+    post_limiter = get_rate_limiter(config, ASPACE_POST, aspace_bucket_name(ASPACE_POST, api_url), post_rate)
+    if get_limiter:
+        limits["GET"] = get_limiter
+    if post_limiter:
+        limits["POST"] = post_limiter
+    return limits
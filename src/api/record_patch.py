@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+#author = will nyarko
+#file name = record_patch.py
+#description = Compact, reversible patches describing the change an update applied to an agent record
+"""
+
+import argparse
+import copy
+import json
+import sys
+from datetime import datetime
+from pathlib import Path
+
+# Add project root to sys.path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+# Cache key suffix for the patch stored next to an agent's record
+PATCH_SUFFIX = "_patch"
+
+def patch_key(agent_uri):
+    """/agents/people/1 -> /agents/people/1_patch"""
+    return f"{agent_uri}{PATCH_SUFFIX}"
+
+def make_patch(original, updated, update_response=None):
+    """
+    Describe what an update changed: the identifiers it added and the lock_version
+    it moved the record from and to.
+
+    The new lock_version comes from the POST response envelope
+    ({"status": "Updated", "id": ..., "lock_version": ...}); without one it is
+    assumed to be the old lock_version + 1, which is what ArchivesSpace does.
+    """
+    existing = original.get('agent_record_identifiers') or []
+    added = [identifier for identifier in updated.get('agent_record_identifiers') or []
+             if identifier not in existing]
+
+    base_lock_version = original.get('lock_version')
+    lock_version = (update_response or {}).get('lock_version')
+    if lock_version is None and base_lock_version is not None:
+        lock_version = base_lock_version + 1
+
+    return {
+        'uri': original.get('uri'),
+        'base_lock_version': base_lock_version,
+        'lock_version': lock_version,
+        'added_identifiers': added,
+        'applied_at': datetime.now().isoformat(timespec='seconds')
+    }
+
+def apply_patch(record, patch):
+    """Return the post-update record: a copy of the pre-image with the patch applied."""
+    updated = copy.deepcopy(record)
+    identifiers = updated.setdefault('agent_record_identifiers', [])
+    for identifier in patch['added_identifiers']:
+        if identifier not in identifiers:
+            identifiers.append(copy.deepcopy(identifier))
+    if patch.get('lock_version') is not None:
+        updated['lock_version'] = patch['lock_version']
+    return updated
+
+def revert_patch(record, patch):
+    """Return the pre-update record: a copy of the post-image with the patch undone."""
+    original = copy.deepcopy(record)
+    added = patch['added_identifiers']
+    original['agent_record_identifiers'] = [
+        identifier for identifier in original.get('agent_record_identifiers') or []
+        if identifier not in added
+    ]
+    if patch.get('base_lock_version') is not None:
+        original['lock_version'] = patch['base_lock_version']
+    return original
+
+def updated_record(cache, agent_uri):
+    """
+    The post-update record of an agent from its cached record and patch.
+
+    Works whether the cache holds the pre-image (older runs) or the post-image
+    (written back by the updater), since applying a patch twice changes nothing.
+    Returns None when the agent isn't cached; an agent that was never updated
+    (no patch) comes back as cached.
+    """
+    record = cache.get(agent_uri)
+    if record is None:
+        return None
+    patch = cache.get(patch_key(agent_uri))
+    return apply_patch(record, patch) if patch else record
+
+def original_record(cache, agent_uri):
+    """The pre-update record of an agent, undoing its patch if it has one."""
+    record = cache.get(agent_uri)
+    if record is None:
+        return None
+    patch = cache.get(patch_key(agent_uri))
+    return revert_patch(record, patch) if patch else record
+
+def main():
+    """Print an agent's post-update (or, with --original, pre-update) record from a cache."""
+    from src.api.cache_store import open_cache_store
+
+    parser = argparse.ArgumentParser(description="Rebuild an agent record before or after its update from the cache")
+    parser.add_argument("agent_uri", help="Agent URI, e.g. /agents/people/123")
+    parser.add_argument("--cache-dir", default="cache/aspace_prod_cache", help="Cache holding the record")
+    parser.add_argument("--original", action="store_true", help="Print the record as it was before the update")
+    args = parser.parse_args()
+
+    with open_cache_store(args.cache_dir) as cache:
+        record = original_record(cache, args.agent_uri) if args.original else updated_record(cache, args.agent_uri)
+    if record is None:
+        print(f"{args.agent_uri} is not in {args.cache_dir}", file=sys.stderr)
+        return 1
+    print(json.dumps(record, indent=2))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+#author = will nyarko
+#file name = results_stream.py
+#description = Append per-record results to a JSONL file as they happen and read them back for summaries and CSVs
+"""
+
+import csv
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+class ResultsWriter:
+    """
+    Appends one JSON line per result to `path` so results survive a crash and
+    never pile up in memory.
+
+    Lines are buffered and written once flush_every results are waiting or
+    flush_seconds have passed since the last write (and on flush/close), which
+    bounds both the I/O per record and how much a crash can lose.
+    """
+
+    def __init__(self, path, flush_every=100, flush_seconds=5.0):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.flush_every = max(1, int(flush_every))
+        self.flush_seconds = flush_seconds
+        self.count = 0
+        self._buffer = []
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    def write(self, result):
+        with self._lock:
+            self._buffer.append(json.dumps(result, ensure_ascii=False, default=str) + "\n")
+            self.count += 1
+            if (len(self._buffer) >= self.flush_every
+                    or time.monotonic() - self._last_flush >= self.flush_seconds):
+                self._flush_locked()
+
+    def _flush_locked(self):
+        if self._buffer:
+            self._file.writelines(self._buffer)
+            self._buffer.clear()
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._last_flush = time.monotonic()
+
+    def flush(self):
+        with self._lock:
+            if self._file is not None:
+                self._flush_locked()
+
+    def close(self):
+        with self._lock:
+            if self._file is None:
+                return
+            self._flush_locked()
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+def iter_results(path, status=None):
+    """Yield the results in a stream file in the order they were written, optionally only one status."""
+    path = Path(path)
+    if not path.exists():
+        return
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                # A crash can leave the last line half-written
+                continue
+            if status is None or result.get("status") == status:
+                yield result
+
+def results_to_csv(stream_path, csv_path):
+    """Write a results stream out as CSV (columns in first-seen order); returns the number of rows."""
+    fieldnames = {}
+    for result in iter_results(stream_path):
+        fieldnames.update(dict.fromkeys(result))
+
+    rows = 0
+    with open(csv_path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(fieldnames))
+        writer.writeheader()
+        for result in iter_results(stream_path):
+            writer.writerow(result)
+            rows += 1
+    return rows
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+#author = will nyarko
+#file name = retry.py
+#description = Retry policy with full jitter, Retry-After support, per-record deadlines and a shared circuit breaker
+"""
+
+import functools
+import logging
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+
+# HTTP statuses that will not succeed on retry: validation errors, missing records,
+# permission problems that survived a session refresh, and stale lock_version conflicts
+PERMANENT_STATUSES = (400, 403, 404, 409, 422)
+
+# Stale lock_version: permanent for a resend of the same body, but a retry that
+# starts over from a fresh GET (and so a fresh lock_version) can succeed
+CONFLICT_STATUS = 409
+
+# Backoff ceiling for any single wait, in seconds
+MAX_BACKOFF = 60
+
+class DeadlineExceeded(Exception):
+    """Raised when a record has used up its overall time budget, retries included."""
+
+# Per-thread deadline for the record currently being processed
+_deadline = threading.local()
+
+# Per-thread switch that turns inline retry waits into immediate failures
+_deferred = threading.local()
+
+@contextmanager
+def record_deadline(seconds):
+    """Give everything inside the block (requests and retry waits) at most `seconds` in total."""
+    previous = getattr(_deadline, "at", None)
+    _deadline.at = time.monotonic() + seconds if seconds else None
+    try:
+        yield
+    finally:
+        _deadline.at = previous
+
+def deadline_remaining():
+    """Seconds left before the current thread's record deadline, or None if there is none."""
+    at = getattr(_deadline, "at", None)
+    return None if at is None else at - time.monotonic()
+
+def sleep_within_deadline(wait_time, exception=None):
+    """Sleep before a retry, or raise DeadlineExceeded if the wait would overrun the record deadline."""
+    remaining = deadline_remaining()
+    if remaining is not None and wait_time >= remaining:
+        raise DeadlineExceeded(f"Record deadline reached while retrying: {str(exception)}") from exception
+    time.sleep(wait_time)
+
+@contextmanager
+def deferred_retries():
+    """
+    Inside the block retry_with_backoff makes a single attempt and raises, so the
+    thread never sleeps; the caller reschedules the whole record instead (see
+    work_queue.RetryQueue and job_queue.JobTable.retry).
+    """
+    previous = getattr(_deferred, "on", False)
+    _deferred.on = True
+    try:
+        yield
+    finally:
+        _deferred.on = previous
+
+def retries_deferred():
+    return getattr(_deferred, "on", False)
+
+def error_status(exception):
+    """HTTP status code carried by an exception, if any (requests or aiohttp)."""
+    response = getattr(exception, "response", None)
+    status = getattr(response, "status_code", None)
+    if status is None:
+        status = getattr(exception, "status", None)
+    return status
+
+def is_permanent_error(exception, rebuilt=False):
+    """
+    True for errors that retrying cannot fix. With rebuilt=True the retry rebuilds
+    the request from a fresh GET, so a lock_version conflict is not permanent.
+    """
+    status = error_status(exception)
+    if rebuilt and status == CONFLICT_STATUS:
+        return False
+    return status in PERMANENT_STATUSES
+
+def retry_after_seconds(exception):
+    """Seconds requested by a Retry-After header on the exception's response, or None."""
+    response = getattr(exception, "response", None)
+    headers = getattr(response, "headers", None) or getattr(exception, "headers", None)
+    if not headers:
+        return None
+    value = headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def retry_delay(attempt, retry_after=None, base=1.0, cap=MAX_BACKOFF):
+    """Wait before attempt + 1: the server's Retry-After if given, else full jitter."""
+    if retry_after is not None:
+        return min(retry_after, cap)
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+def backoff_delay(attempt, exception=None, base=1.0, cap=MAX_BACKOFF):
+    """Wait before the next attempt: Retry-After if the server sent one, else full jitter."""
+    retry_after = retry_after_seconds(exception) if exception is not None else None
+    return retry_delay(attempt, retry_after, base, cap)
+
+class CircuitBreaker:
+    """
+    Shared breaker that pauses every worker when too many recent calls failed.
+
+    Outcomes of the last `window` calls are kept; once at least `min_calls` are
+    recorded and the failure rate exceeds `failure_threshold` the breaker opens
+    for `cooldown` seconds. While open, wait_if_open() blocks callers so a struggling
+    server gets breathing room instead of a retry storm. After the cooldown the
+    window is cleared and traffic resumes; continued failures open it again.
+    """
+
+    def __init__(self, failure_threshold=0.5, window=20, min_calls=10, cooldown=30):
+        self.failure_threshold = failure_threshold
+        self.min_calls = min_calls
+        self.cooldown = cooldown
+        self._outcomes = deque(maxlen=window)
+        self._open_until = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return time.time() < self._open_until
+
+    def wait_if_open(self):
+        """Block while the breaker is open."""
+        while True:
+            remaining = self._open_until - time.time()
+            if remaining <= 0:
+                return
+            time.sleep(remaining)
+
+    def record_success(self):
+        with self._lock:
+            self._outcomes.append(True)
+
+    def record_failure(self):
+        with self._lock:
+            self._outcomes.append(False)
+            if self.is_open or len(self._outcomes) < self.min_calls:
+                return
+            failure_rate = self._outcomes.count(False) / len(self._outcomes)
+            if failure_rate > self.failure_threshold:
+                self._open_until = time.time() + self.cooldown
+                self._outcomes.clear()
+                logging.warning(f"Circuit breaker open: {failure_rate:.0%} of recent requests failed, "
+                                f"pausing all workers for {self.cooldown}s")
+
+# I've created a decorator to centralize our retry logic
+# This replaces the repetitive try/except/retry patterns throughout the code
+# with a single, configurable implementation that's easier to maintain
+def retry_with_backoff(max_retries=3, allowed_exceptions=(Exception,),
+                       on_retry_callback=None, breaker=None):
+    """
+    Decorator that retries a function with jittered exponential backoff on exception.
+
+    Permanent errors (see PERMANENT_STATUSES) are raised immediately, a Retry-After
+    header overrides the computed wait, and transient failures are reported to the
+    optional shared CircuitBreaker, which is also consulted before every attempt.
+    Inside a record_deadline() block, a wait that would overrun the deadline raises
+    DeadlineExceeded instead; inside a deferred_retries() block there is no wait at
+    all and the first transient failure is raised.
+
+    Args:
+        max_retries: Maximum number of attempts
+        allowed_exceptions: Tuple of exceptions that trigger retry
+        on_retry_callback: Optional callback function(exception, attempt, wait_time)
+                          called before each retry
+        breaker: Optional CircuitBreaker shared by all workers
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            for attempt in range(max_retries):
+                if breaker:
+                    breaker.wait_if_open()
+                try:
+                    result = func(*args, **kwargs)
+                    if breaker:
+                        breaker.record_success()
+                    return result
+                except allowed_exceptions as e:
+                    # Retrying a 404 or a validation error only wastes time
+                    if is_permanent_error(e):
+                        raise
+
+                    if breaker:
+                        breaker.record_failure()
+
+                    # Don't retry on last attempt, or when the caller retries the record later
+                    if attempt >= max_retries - 1 or retries_deferred():
+                        raise
+
+                    wait_time = backoff_delay(attempt, e)
+
+                    # Call the retry callback if provided
+                    if on_retry_callback:
+                        on_retry_callback(e, attempt, wait_time)
+                    else:
+                        # Default logging behavior
+                        func_name = getattr(func, '__name__', 'unknown_function')
+                        logging.warning(f"{func_name} failed with {type(e).__name__}: {str(e)}, "
+                                       f"retrying in {wait_time:.1f}s... (attempt {attempt+1}/{max_retries})")
+
+                    sleep_within_deadline(wait_time, e)
+
+            # This should never be reached due to the raise in the exception handler
+            return None
+        return wrapper
+    return decorator
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+#author = will nyarko
+#file name = sharding.py
+#description = Deterministic --shard i/N partitioning of source rows, and merging of per-shard outputs
+"""
+
+import argparse
+import hashlib
+import logging
+import sys
+from pathlib import Path
+
+import pandas as pd
+
+# Add project root to sys.path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from src.api.agent_bulk import canonical_agent_uri
+
+# Column sharded runs add to the rows and results they write, so merge can restore the source order
+SOURCE_INDEX_COLUMN = "source_index"
+
+def parse_shard(spec):
+    """
+    Parse "i/N" (0 <= i < N) into (i, N). Meant as an argparse type.
+
+    N shards of the same source cover every row exactly once, whether they run as
+    processes on one machine or on several.
+    """
+    try:
+        index, count = (int(part) for part in str(spec).split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Shard must look like i/N, got {spec!r}")
+    if count < 1 or not 0 <= index < count:
+        raise argparse.ArgumentTypeError(f"Shard index must be between 0 and N-1, got {spec!r}")
+    return index, count
+
+def shard_label(shard):
+    """(1, 4) -> "shard1of4", for per-shard file names."""
+    return f"shard{shard[0]}of{shard[1]}"
+
+def shard_of(key, count):
+    """
+    Shard number for a key: a stable hash (not Python's per-process hash()) so
+    every process and machine agrees. Agent URIs are canonicalized first, so a full
+    URL and a bare path land in the same shard. Rows without a key go to shard 0.
+    """
+    if count <= 1 or key is None or (not isinstance(key, str) and pd.isna(key)) or key == "":
+        return 0
+    key = str(key).strip()
+    key = canonical_agent_uri(key) or key
+    digest = hashlib.sha1(key.encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % count
+
+def row_key(row, columns):
+    """First non-empty value among columns in a row, or None."""
+    for column in columns:
+        if column in row and pd.notna(row[column]) and row[column]:
+            return row[column]
+    return None
+
+def select_shard(df, shard, columns):
+    """
+    Rows of df that belong to shard (i, N), keyed by the first non-empty of columns.
+
+    The returned frame keeps df's index, and a SOURCE_INDEX_COLUMN holding the
+    original position is added so shard outputs can be merged back in order;
+    scripts that write result dicts copy it over with with_source_index().
+    """
+    index, count = shard
+    df = df.copy()
+    df[SOURCE_INDEX_COLUMN] = range(len(df))
+    mask = [shard_of(row_key(row, columns), count) == index for _, row in df.iterrows()]
+    selected = df[mask]
+    logging.info(f"Shard {index}/{count}: {len(selected)} of {len(df)} rows")
+    return selected
+
+def with_source_index(result, row):
+    """Copy row's SOURCE_INDEX_COLUMN (if it has one) into a result dict; returns the result."""
+    if row is not None and SOURCE_INDEX_COLUMN in row and pd.notna(row[SOURCE_INDEX_COLUMN]):
+        result[SOURCE_INDEX_COLUMN] = int(row[SOURCE_INDEX_COLUMN])
+    return result
+
+def sharded_path(path, shard):
+    """src/data/results.csv -> src/data/results_shard1of4.csv (unchanged when not sharded)."""
+    if shard is None:
+        return path
+    path = Path(path)
+    return path.with_name(f"{path.stem}_{shard_label(shard)}{path.suffix}")
+
+def read_output(path, encoding="utf-8"):
+    """Load one shard output, CSV or JSONL results stream."""
+    path = Path(path)
+    if path.suffix == ".jsonl":
+        return pd.read_json(path, lines=True)
+    return pd.read_csv(path, encoding=encoding)
+
+def merge_outputs(paths, output_path, encoding="utf-8"):
+    """
+    Combine shard outputs into one CSV. Rows carrying SOURCE_INDEX_COLUMN are put
+    back in source order and the column is dropped. Returns the merged frame.
+    """
+    frames = [read_output(path, encoding) for path in paths]
+    merged = pd.concat(frames, ignore_index=True, sort=False)
+    if SOURCE_INDEX_COLUMN in merged.columns:
+        duplicates = merged[SOURCE_INDEX_COLUMN].duplicated().sum()
+        if duplicates:
+            logging.warning(f"{duplicates} rows appear in more than one shard output")
+        merged = merged.sort_values(SOURCE_INDEX_COLUMN, kind="stable").drop(columns=[SOURCE_INDEX_COLUMN])
+    merged.to_csv(output_path, index=False, encoding=encoding)
+    return merged
+
+def write_merge_summary(merged, paths, summary_path, status_column="status"):
+    """Markdown summary of a merged run: rows per shard output and per status, plus the first errors."""
+    lines = ["# Merged Shard Summary\n", f"Merged {len(paths)} shard outputs, {len(merged)} rows\n"]
+    lines.append("## Shard Outputs\n")
+    for path in paths:
+        lines.append(f"- {path}")
+    lines.append("")
+
+    if status_column in merged.columns:
+        lines.append("## Results Summary\n")
+        for status, count in merged[status_column].value_counts(dropna=False).items():
+            lines.append(f"- **{status}:** {count} ({count / len(merged) * 100:.1f}%)")
+        lines.append("")
+
+        errors = merged[merged[status_column].isin(["error", "failure"])]
+        if len(errors) > 0 and "message" in merged.columns:
+            lines.append("## Error Details\n")
+            lines.append("| Agent URI | Agent Name | Error Message |")
+            lines.append("|-----------|------------|---------------|")
+            for _, row in errors.head(20).iterrows():
+                agent_uri = row.get('agent_uri', row.get('aspace_uri', 'N/A'))
+                agent_name = str(row.get('agent_name', 'Unknown')).replace('|', '\\|')
+                message = str(row.get('message', 'Unknown error')).replace('|', '\\|')
+                lines.append(f"| {agent_uri} | {agent_name} | {message} |")
+            if len(errors) > 20:
+                lines.append(f"\n... and {len(errors) - 20} more errors (see merged CSV for details)")
+
+    with open(summary_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+
+def main():
+    """Merge the per-shard outputs of a sharded run into one CSV and Markdown summary."""
+    parser = argparse.ArgumentParser(description="Merge per-shard outputs into one results CSV and summary")
+    parser.add_argument("inputs", nargs="+", help="Shard output files (CSV or JSONL results streams)")
+    parser.add_argument("--output", required=True, help="Merged CSV to write")
+    parser.add_argument("--summary", help="Markdown summary to write (default: next to --output)")
+    parser.add_argument("--status-column", default="status",
+                        help="Column summarized per value (update_status for update_aspace.py outputs)")
+    parser.add_argument("--encoding", default="utf-8", help="Encoding of CSV inputs and output")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    paths = sorted(args.inputs)
+    merged = merge_outputs(paths, args.output, args.encoding)
+    summary_path = args.summary or str(Path(args.output).with_suffix(".md"))
+    write_merge_summary(merged, paths, summary_path, args.status_column)
+    logging.info(f"Merged {len(paths)} shard outputs ({len(merged)} rows) into {args.output}; summary in {summary_path}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -7,7 +7,6 @@
 
 import json
 import time
-import requests
 import logging
 import pandas as pd
 import os
@@ -19,6 +18,12 @@ from concurrent.futures import ThreadPoolExecutor, as_completed
 # Add project root to sys.path
 sys.path.insert(0, str(Path(__file__).parent.parent.parent))
 
+from src.api.ark_resolver import ArkResolutionTable
+from src.api.aspace_client import ArchivesSpaceClient
+from src.api.cache_store import snac_ark_of
+from src.api.enrichment_ledger import EnrichmentLedger, stale_ledger_entries
+from src.api.rate_limit import aspace_rate_limits
+
 # Configuration paths
 CONFIG_PATH = "config.json"
 MASTER_CSV_PATH = "src/data/master_spreadsheet.csv"
@@ -48,6 +53,10 @@ def parse_args():
     parser.add_argument("--batch-size", type=int, default=50, help="Number of records to process per batch")
     parser.add_argument("--workers", type=int, default=4, help="Number of concurrent worker threads")
     parser.add_argument("--error-only", action="store_true", help="Only process records that had errors previously")
+    parser.add_argument("--ignore-ledger", action="store_true",
+                        help="Process agents the enrichment ledger already lists as having a SNAC ARK")
+    parser.add_argument("--verify-ledger", action="store_true",
+                        help="Before skipping ledger entries, check their lock_version with id_set[] listings")
     return parser.parse_args()
 
 def load_config(config_path):
@@ -55,39 +64,16 @@ def load_config(config_path):
     with open(config_path, "r", encoding="utf-8") as f:
         return json.load(f)
 
-def authenticate(api_url, username, password):
-    """Authenticate with the ArchivesSpace API and return session token."""
-    login_endpoint = f"{api_url}/users/{username}/login"
-    
-    try:
-        response = requests.post(login_endpoint, data={"password": password})
-        response.raise_for_status()
-        token = response.json().get("session")
-        if token:
-            return token
-        raise ValueError("Authentication failed: no session token returned.")
-    except Exception as e:
-        logging.error(f"Authentication failed: {str(e)}")
-        raise
-
-def get_agent_record(api_url, agent_uri, session_token):
+def get_agent_record(client, agent_uri):
     """Retrieve the agent record from ArchivesSpace."""
-    headers = {
-        "X-ArchivesSpace-Session": session_token,
-        "Accept": "application/json"
-    }
-    url = f"{api_url}{agent_uri}"
-    
     try:
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-        return response.json()
+        return client.get_json(agent_uri)
     except Exception as e:
         error_msg = f"Error retrieving {agent_uri}: {str(e)}"
         logging.error(error_msg)
         raise Exception(error_msg)
 
-def update_agent_record(api_url, agent_uri, agent_data, snac_ark, session_token):
+def update_agent_record(client, agent_uri, agent_data, snac_ark):
     """Update the agent record with SNAC ARK and save to ArchivesSpace."""
     # Check if the SNAC ARK already exists
     snac_identifier_exists = False
@@ -116,18 +102,14 @@ def update_agent_record(api_url, agent_uri, agent_data, snac_ark, session_token)
         return "skipped", "SNAC ARK already exists"
     
     # Submit updated record
-    headers = {
-        "X-ArchivesSpace-Session": session_token,
-        "Content-Type": "application/json"
-    }
-    url = f"{api_url}{agent_uri}"
+    headers = {"Content-Type": "application/json"}
     
     try:
-        response = requests.post(url, headers=headers, json=agent_data)
+        response = client.post(agent_uri, headers=headers, json=agent_data)
         response.raise_for_status()
         
         # Return success status
-        return "success", response.json().get('lock_version', 'unknown')
+        return "success", response.json().get('lock_version')
     except Exception as e:
         error_msg = f"Error updating {agent_uri}: {str(e)}"
         logging.error(error_msg)
@@ -135,7 +117,7 @@ def update_agent_record(api_url, agent_uri, agent_data, snac_ark, session_token)
 
 def process_record(args):
     """Process a single record (for use with ThreadPoolExecutor)."""
-    row, api_url, session_token = args
+    row, client, ledger, ark_table = args
     agent_uri = row['aspace_uri']
     agent_name = row['agent_name']
     
@@ -154,17 +136,30 @@ def process_record(args):
             'message': 'No SNAC ARK found'
         }
     
+    # A merged ARK is replaced by the one that survived the merge, without asking SNAC
+    if ark_table is not None:
+        current_ark = ark_table.current_ark(snac_ark)
+        if current_ark != snac_ark:
+            logging.info(f"{agent_name}: {snac_ark} was merged into {current_ark}")
+            snac_ark = current_ark
+    
     try:
         # Get the current agent record
-        agent_data = get_agent_record(api_url, agent_uri, session_token)
+        agent_data = get_agent_record(client, agent_uri)
+        lock_version = agent_data.get('lock_version')
         
         # Update the agent record with SNAC ARK
-        status, message = update_agent_record(api_url, agent_uri, agent_data, snac_ark, session_token)
+        status, message = update_agent_record(client, agent_uri, agent_data, snac_ark)
         
         if status == 'success':
             logging.info(f"Successfully updated {agent_name} ({agent_uri}) with SNAC ARK {snac_ark}")
+            if ledger is not None:
+                # message carries the lock_version the server returned
+                ledger.record(client.api_url, agent_uri, snac_ark, message, "added")
         elif status == 'skipped':
             logging.info(f"Skipped {agent_name} ({agent_uri}): {message}")
+            if ledger is not None:
+                ledger.record(client.api_url, agent_uri, snac_ark_of(agent_data) or snac_ark, lock_version, "present")
         else:
             logging.error(f"Failed to update {agent_name} ({agent_uri}): {message}")
         
@@ -184,8 +179,15 @@ def process_record(args):
             'message': str(e)
         }
 
-def update_aspace_records(api_url, session_token, df, batch_size=50, num_workers=4, test_mode=False):
-    """Update ArchivesSpace agent records with SNAC ARKs."""
+def update_aspace_records(client, df, batch_size=50, num_workers=4, test_mode=False,
+                          ledger=None, skip_enriched=True, verify_ledger=False, ark_table=None):
+    """Update ArchivesSpace agent records with SNAC ARKs.
+    
+    Agents found with or given an ARK are recorded in the enrichment ledger, and
+    agents already in it are marked skipped without a request (after a lock_version
+    check through id_set[] listings if verify_ledger is set). With an
+    ArkResolutionTable, merged ARKs are swapped for their terminal ARK first.
+    """
     # Add update_status column if it doesn't exist
     if 'update_status' not in df.columns:
         df['update_status'] = None
@@ -206,6 +208,17 @@ def update_aspace_records(api_url, session_token, df, batch_size=50, num_workers
         total_records = len(update_df)
         logging.info(f"TEST MODE: Limited to {total_records} records")
     
+    # Agents the ledger knows already carry an ARK need no GET at all
+    if ledger is not None and skip_enriched and total_records > 0:
+        enriched = {uri for uri in update_df['aspace_uri'].dropna() if ledger.is_enriched(client.api_url, uri)}
+        if verify_ledger and enriched:
+            enriched -= stale_ledger_entries(client, ledger, enriched)
+        if enriched:
+            df.loc[df['aspace_uri'].isin(enriched), 'update_status'] = 'skipped'
+            update_df = update_df[~update_df['aspace_uri'].isin(enriched)]
+            total_records = len(update_df)
+            logging.info(f"Skipped {len(enriched)} agents the enrichment ledger lists as already having a SNAC ARK")
+    
     if total_records == 0:
         logging.info("No records need updating")
         return df
@@ -226,7 +239,7 @@ def update_aspace_records(api_url, session_token, df, batch_size=50, num_workers
         # Use ThreadPoolExecutor for concurrent processing
         with ThreadPoolExecutor(max_workers=num_workers) as executor:
             futures = {
-                executor.submit(process_record, (row, api_url, session_token)): idx 
+                executor.submit(process_record, (row, client, ledger, ark_table)): idx 
                 for idx, row in batch_df.iterrows()
             }
             
@@ -239,9 +252,6 @@ def update_aspace_records(api_url, session_token, df, batch_size=50, num_workers
                 print(f"Processed {processed}/{len(batch_df)} records in current batch", end='\r')
         
         results.extend(batch_results)
-        
-        # Refresh session token every batch to prevent timeouts
-        session_token = authenticate(api_url, username, password)
     
     print("\n")  # Clear the progress line
     
@@ -272,10 +282,6 @@ def main():
     
     # Load configuration
     config = load_config(CONFIG_PATH)
-    aspace_creds = config["credentials"]["archivesspace_api"]
-    api_url = aspace_creds["api_url"]
-    username = aspace_creds["username"]
-    password = aspace_creds["password"]
     csv_encoding = config["settings"].get("csv_encoding", "utf-8")
     
     # Load master spreadsheet
@@ -297,21 +303,30 @@ def main():
     # Authenticate with ArchivesSpace API
     try:
         logging.info("Authenticating with ArchivesSpace API")
-        session_token = authenticate(api_url, username, password)
+        # Size the connection pool to the worker count so every thread keeps its own connection
+        client = ArchivesSpaceClient.from_config(config, pool_size=args.workers,
+                                                 rate_limits=aspace_rate_limits(config))
+        client.ensure_authenticated()
         logging.info("Authentication successful")
     except Exception as e:
         logging.error(f"Authentication failed: {str(e)}")
         return 1
     
     # Update ArchivesSpace records
+    ledger = EnrichmentLedger()
+    ark_table = ArkResolutionTable()
     try:
+        ark_table.load_id_change_log()
         updated_df = update_aspace_records(
-            api_url, 
-            session_token, 
+            client, 
             df_to_process, 
             batch_size=args.batch_size,
             num_workers=args.workers,
-            test_mode=args.test
+            test_mode=args.test,
+            ledger=ledger,
+            skip_enriched=not args.ignore_ledger,
+            verify_ledger=args.verify_ledger,
+            ark_table=ark_table
         )
         
         # Save updated dataframe with status information
@@ -324,6 +339,10 @@ def main():
     except Exception as e:
         logging.error(f"Error during ArchivesSpace update process: {str(e)}")
         return 1
+    
+    finally:
+        ledger.close()
+        ark_table.close()
 
 if __name__ == "__main__":
     sys.exit(main())
\ No newline at end of file
@@ -13,17 +13,31 @@ import pandas as pd
 import os
 import sys
 import argparse
-import functools
+import threading
 from datetime import datetime
 from pathlib import Path
-from concurrent.futures import ThreadPoolExecutor, as_completed
-
-# We'll use direct requests for all API interactions
-# This simplifies the code and removes external dependencies
 
 # Add project root to sys.path
 sys.path.insert(0, str(Path(__file__).parent.parent.parent))
 
+# All API interactions go through the shared pooled client
+from src.api.agent_bulk import DEFAULT_CHUNK_SIZE, canonical_agent_uri, fetch_agents_bulk
+from src.api.ark_resolver import ArkResolutionTable
+from src.api.aspace_client import ArchivesSpaceClient
+from src.api.cache_store import WriteBehindCache, open_cache_store, snac_ark_of
+from src.api.checkpoint_journal import CheckpointJournal
+from src.api.enrichment_ledger import EnrichmentLedger, stale_ledger_entries
+from src.api.concurrency import AIMDController
+from src.api.dead_letters import DeadLetterStore
+from src.api.job_queue import DEFAULT_LEASE_SECONDS, DEFAULT_MAX_ATTEMPTS, JobTable, default_worker_id, leased_jobs
+from src.api.rate_limit import aspace_rate_limits
+from src.api.record_patch import apply_patch, make_patch, patch_key
+from src.api.results_stream import ResultsWriter, iter_results, results_to_csv
+from src.api.retry import (CircuitBreaker, DeadlineExceeded, deferred_retries, is_permanent_error,
+                           record_deadline, retry_after_seconds, retry_with_backoff)
+from src.api.sharding import parse_shard, select_shard, shard_label, sharded_path, with_source_index
+from src.api.work_queue import RetryQueue, Stage, pipeline
+
 # Configuration paths
 CONFIG_PATH = "config.json"
 SOURCE_CSV_PATH = "src/data/snac_cached_records_20250316_153932.csv"
@@ -64,59 +78,30 @@ summary_handler.setFormatter(summary_formatter)
 summary_logger.addHandler(summary_handler)
 summary_logger.propagate = False  # Don't send summary logs to the main log
 
-# I've created a decorator to centralize our retry logic
-# This replaces the repetitive try/except/retry patterns throughout the code
-# with a single, configurable implementation that's easier to maintain
-def retry_with_backoff(max_retries=3, allowed_exceptions=(Exception,), 
-                       on_retry_callback=None):
-    """
-    Decorator that retries a function with exponential backoff on exception.
-    
-    I designed this to handle network failures and API rate limits gracefully
-    while providing detailed logging and customizable behavior.
-    
-    Args:
-        max_retries: Maximum number of retries
-        allowed_exceptions: Tuple of exceptions that trigger retry
-        on_retry_callback: Optional callback function(exception, attempt, wait_time) 
-                          called before each retry
-    """
-    def decorator(func):
-        @functools.wraps(func)
-        def wrapper(*args, **kwargs):
-            for attempt in range(max_retries):
-                try:
-                    return func(*args, **kwargs)
-                except allowed_exceptions as e:
-                    # Don't retry on last attempt
-                    if attempt >= max_retries - 1:
-                        raise
-                    
-                    # Calculate wait time with exponential backoff
-                    wait_time = 2 ** attempt
-                    
-                    # Call the retry callback if provided
-                    if on_retry_callback:
-                        on_retry_callback(e, attempt, wait_time)
-                    else:
-                        # Default logging behavior
-                        func_name = getattr(func, '__name__', 'unknown_function')
-                        logging.warning(f"{func_name} failed with {type(e).__name__}: {str(e)}, "
-                                       f"retrying in {wait_time}s... (attempt {attempt+1}/{max_retries})")
-                    
-                    time.sleep(wait_time)
-            
-            # This should never be reached due to the raise in the exception handler
-            return None
-        return wrapper
-    return decorator
+# Shared by every worker: when too many recent requests fail, all workers pause together
+ASPACE_BREAKER = CircuitBreaker()
+
+# The watchdog abandons a record this many seconds after its deadline has passed
+WATCHDOG_GRACE = 30
 
 def parse_args():
     """Parse command-line arguments."""
     parser = argparse.ArgumentParser(description="Update ArchivesSpace PROD with SNAC ARKs")
     parser.add_argument("--test", action="store_true", help="Run in test mode (process only 10 records)")
-    parser.add_argument("--batch-size", type=int, default=5, help="Number of records to process per batch")
-    parser.add_argument("--workers", type=int, default=2, help="Number of concurrent worker threads")
+    parser.add_argument("--batch-size", type=int, default=5,
+                       help="Records in the pipeline per HTTP worker (in flight = batch size x fetch+write workers)")
+    parser.add_argument("--workers", type=int, default=2,
+                       help="Default number of threads for the fetch (GET) and write (POST) stages")
+    parser.add_argument("--fetch-workers", type=int, help="Threads fetching records (default: --workers)")
+    parser.add_argument("--write-workers", type=int, help="Threads posting updates (default: --workers)")
+    parser.add_argument("--get-rate", type=float, help="Max GET requests/second (overrides config)")
+    parser.add_argument("--post-rate", type=float, help="Max POST requests/second (overrides config)")
+    parser.add_argument("--bulk", action="store_true",
+                       help="Prefetch agents in bulk through the id_set[] listing endpoints")
+    parser.add_argument("--ignore-ledger", action="store_true",
+                       help="Process agents the enrichment ledger already lists as having a SNAC ARK")
+    parser.add_argument("--verify-ledger", action="store_true",
+                       help="Before skipping ledger entries, check their lock_version with id_set[] listings")
     parser.add_argument("--report-interval", type=int, default=10, help="Report progress every N seconds")
     parser.add_argument("--no-update", action="store_true", help="Don't actually update, just verify and cache")
     parser.add_argument("--start-index", type=int, default=0, help="Start processing from this index in the CSV")
@@ -125,10 +110,45 @@ def parse_args():
     parser.add_argument("--environment", choices=["test", "production"], default="test", 
                        help="Environment to connect to (test or production)")
     parser.add_argument("--auto-resume", action="store_true", 
-                       help="Automatically resume from last checkpoint")
+                       help="Skip records the checkpoint journal already lists as done")
     parser.add_argument("--checkpoint-interval", type=int, default=10, 
-                       help="Save checkpoint every N records")
-    return parser.parse_args()
+                       help="Flush the checkpoint journal every N records")
+    parser.add_argument("--adaptive", action="store_true",
+                       help="Adapt in-flight requests to server latency/errors (AIMD); --workers becomes the ceiling")
+    parser.add_argument("--min-concurrency", type=int, default=1,
+                       help="Floor for the adaptive concurrency limit")
+    parser.add_argument("--latency-target", type=float, default=2.0,
+                       help="Mean request latency (seconds) above which adaptive mode backs off")
+    parser.add_argument("--breaker-threshold", type=float, default=0.5,
+                       help="Failure rate over recent requests that pauses all workers")
+    parser.add_argument("--breaker-cooldown", type=int, default=30,
+                       help="Seconds all workers pause when the circuit breaker opens")
+    parser.add_argument("--connect-timeout", type=float, default=10,
+                       help="Seconds to wait for a connection to ArchivesSpace")
+    parser.add_argument("--read-timeout", type=float, default=60,
+                       help="Seconds to wait for ArchivesSpace to send a response")
+    parser.add_argument("--record-deadline", type=float, default=300,
+                       help="Overall seconds allowed per record, retries included; "
+                            "stuck records are abandoned by the watchdog")
+    parser.add_argument("--shard", type=parse_shard,
+                       help="Process only shard i of N (e.g. 0/4), partitioned by a stable hash of the agent URI, "
+                            "with its own checkpoint journal and results; combine results with sharding.py")
+    parser.add_argument("--jobs", type=Path,
+                       help="Pull records from this shared SQLite job table instead of the CSV order; start more "
+                            "processes with the same --jobs to add workers mid-run (e.g. cache/jobs_production.sqlite)")
+    parser.add_argument("--lease-seconds", type=int, default=DEFAULT_LEASE_SECONDS,
+                       help="With --jobs, how long a claimed record stays with this worker before others may take it")
+    parser.add_argument("--worker-id", help="With --jobs, name of this worker (default: host:pid)")
+    parser.add_argument("--max-attempts", type=int, default=DEFAULT_MAX_ATTEMPTS,
+                       help="Attempts per record; transient failures wait in a delayed-retry queue between "
+                            "attempts, and records still failing go to the dead-letter store")
+    parser.add_argument("--replay-dead-letters", action="store_true",
+                       help="Retry only the records in the dead-letter store for this environment, not the CSV")
+    args = parser.parse_args()
+    if args.replay_dead_letters and args.jobs:
+        # A job table never hands out a record it has already failed, so a replay would find nothing to do
+        parser.error("--replay-dead-letters cannot be combined with --jobs")
+    return args
 
 def load_config(config_path):
     """Load configuration from JSON file."""
@@ -174,35 +194,23 @@ def determine_api_url(config, environment):
     max_retries=3, 
     allowed_exceptions=(requests.exceptions.RequestException, ValueError)
 )
-def get_aspace_session(config, environment="test"):
-    """Get an authenticated ArchivesSpace session."""
-    # Get credentials from config
-    aspace_config = config["credentials"]["archivesspace_api"]
-    username = aspace_config["username"]
-    password = aspace_config["password"]
-    
+def get_aspace_session(config, environment="test", pool_size=2, controller=None, timeout=(10, 60),
+                       rate_limits=None):
+    """Get an authenticated ArchivesSpace client with a pooled session."""
     # Determine API URL based on environment
     api_url = determine_api_url(config, environment)
     
     logging.info(f"Authenticating with ArchivesSpace {environment.upper()} API at {api_url}")
     
-    # Create session
-    session = requests.Session()
-    auth_url = f"{api_url}/users/{username}/login"
-    response = session.post(auth_url, params={"password": password})
-    response.raise_for_status()
-    session_token = response.json().get("session")
-    
-    if not session_token:
-        raise ValueError(f"No session token returned by ArchivesSpace {environment.upper()}")
-    
-    session.headers.update({
-        "X-ArchivesSpace-Session": session_token,
-        "Accept": "application/json"
-    })
+    client = ArchivesSpaceClient.from_config(config, api_url=api_url, pool_size=pool_size,
+                                             controller=controller,
+                                             rate_limits=rate_limits if rate_limits is not None
+                                             else aspace_rate_limits(config, api_url=api_url),
+                                             timeout=timeout)
+    client.ensure_authenticated()
     
     logging.info(f"Authentication successful to {environment.upper()}")
-    return session, api_url
+    return client
 
 def log_agent_retry(e, attempt, wait_time, agent_uri=None):
     """Custom retry logging function for agent operations."""
@@ -224,29 +232,23 @@ def log_agent_retry(e, attempt, wait_time, agent_uri=None):
     max_retries=3,
     allowed_exceptions=(
         requests.exceptions.RequestException,
-        json.JSONDecodeError,
-        Exception
-    )
+        json.JSONDecodeError
+    ),
+    breaker=ASPACE_BREAKER
 )
-def get_agent_record(session, api_url, agent_uri):
+def get_agent_record(client, agent_uri):
     """Retrieve agent record from ArchivesSpace."""
-    
-    # Clean trailing slash from API URL if present
-    api_url = api_url.rstrip('/')
-    
-    # Use the agent URI as-is since it's already in correct format with leading slash
-    url = f"{api_url}{agent_uri}"
-    logging.debug(f"Fetching: {url}")
+    logging.debug(f"Fetching: {client.url_for(agent_uri)}")
     
     # Make the request
-    response = session.get(url)
+    response = client.get(agent_uri)
     
     # Check response
     if response.status_code == 200:
         return response.json()
     elif response.status_code == 404:
         logging.error(f"Agent not found: {agent_uri}")
-        raise requests.exceptions.HTTPError(f"404 Not Found: {agent_uri}")
+        raise requests.exceptions.HTTPError(f"404 Not Found: {agent_uri}", response=response)
     else:
         logging.error(f"Error retrieving {agent_uri}: {response.status_code}")
         response.raise_for_status()
@@ -292,82 +294,63 @@ def add_snac_ark(agent_data, snac_ark):
     allowed_exceptions=(
         requests.exceptions.RequestException,
         json.JSONDecodeError
-    )
+    ),
+    breaker=ASPACE_BREAKER
 )
-def update_agent_record(session, api_url, agent_uri, updated_data):
-    """Update agent record in ArchivesSpace."""
-    try:
-        
-        # Clean trailing slash from API URL if present 
-        api_url = api_url.rstrip('/')
-        
-        # Use the agent URI as-is since it's already in correct format
-        url = f"{api_url}{agent_uri}"
-        logging.debug(f"Updating: {url}")
+def post_agent_record(client, agent_uri, updated_data):
+    """POST an agent record, raising on any non-200 response so the retry policy can act."""
+    logging.debug(f"Updating: {client.url_for(agent_uri)}")
+    
+    # Make the update request
+    headers = {"Content-Type": "application/json"}
+    response = client.post(agent_uri, json=updated_data, headers=headers)
+    response.raise_for_status()
+    return response.json()
 
-        # Make the update request
-        headers = {"Content-Type": "application/json"}
-        response = session.post(url, json=updated_data, headers=headers)
-        
-        # Check response
-        if response.status_code == 200:
-            return response.json(), "success", "Update successful"
-        else:
-            response.raise_for_status()
+def update_agent_record(client, agent_uri, updated_data):
+    """Update agent record in ArchivesSpace; returns (response, status, message, exception or None)."""
+    try:
+        return post_agent_record(client, agent_uri, updated_data), "success", "Update successful", None
     
     except requests.exceptions.HTTPError as e:
-        # Handle HTTP errors
+        # Handle HTTP errors (permanent, or transient ones that will be retried later)
         try:
             error_msg = e.response.json() if hasattr(e, 'response') else str(e)
-            return None, "error", f"HTTP {e.response.status_code}: {error_msg}"
+            return None, "error", f"HTTP {e.response.status_code}: {error_msg}", e
         except:
-            return None, "error", f"HTTP Error: {str(e)}"
+            return None, "error", f"HTTP Error: {str(e)}", e
     
     except Exception as e:
         # Handle all other exceptions
         logging.error(f"Unexpected error updating {agent_uri}: {str(e)}")
-        return None, "error", str(e)
+        return None, "error", str(e), e
 
-def save_to_cache(agent_data, cache_dir, agent_uri):
-    """Save agent record to cache with a consistent filename format."""
-    # Create filename from agent URI, replacing slashes with underscores
-    filename = agent_uri.replace("/", "_") + ".json"
-    filepath = cache_dir / filename
-    
-    cache_dir.mkdir(parents=True, exist_ok=True)
-    
-    with open(filepath, "w", encoding="utf-8") as f:
-        json.dump(agent_data, f, indent=2)
-    
-    return filepath
-
-def save_checkpoint(environment, last_processed_index, processed_uris=None):
-    """Save checkpoint for auto-resuming."""
-    checkpoint_file = CHECKPOINT_DIR / f"checkpoint_{environment}.json"
-    
-    checkpoint_data = {
-        "last_processed_index": last_processed_index,
-        "timestamp": datetime.now().strftime('%Y%m%d_%H%M%S'),
-        "processed_records": last_processed_index + 1,  # 0-indexed
+def failure_fields(e):
+    """
+    Result fields describing a failed request: its error class, whether a later
+    attempt could succeed, and the server's Retry-After (if any) for the retry queue.
+    A deferred retry starts over from the GET, so a 409 lock_version conflict is
+    retryable here rather than going straight to the dead-letter store.
+    """
+    transient = isinstance(e, (requests.exceptions.RequestException, json.JSONDecodeError, DeadlineExceeded))
+    return {
+        'error_class': type(e).__name__,
+        'retryable': transient and not is_permanent_error(e, rebuilt=True),
+        'retry_after': retry_after_seconds(e)
     }
-    
-    if processed_uris:
-        checkpoint_data["processed_uris"] = processed_uris
-    
-    with open(checkpoint_file, "w", encoding="utf-8") as f:
-        json.dump(checkpoint_data, f, indent=2)
-    
-    # Also save a human-readable version
-    human_readable = CHECKPOINT_DIR / f"checkpoint_{environment}.txt"
-    with open(human_readable, "w", encoding="utf-8") as f:
-        f.write(f"Last processed index: {last_processed_index}\n")
-        f.write(f"Processed records: {last_processed_index + 1}\n")
-        f.write(f"Timestamp: {checkpoint_data['timestamp']}\n")
-    
-    return checkpoint_file
+
+def save_to_cache(agent_data, cache, agent_uri):
+    """Save agent record to the cache store under its URI; returns where it was stored."""
+    return cache.put(agent_uri, agent_data)
+
+def journal_path(environment, shard=None):
+    """Checkpoint journal for an environment (and shard): one line per completed record."""
+    if shard:
+        return CHECKPOINT_DIR / f"journal_{environment}_{shard_label(shard)}.jsonl"
+    return CHECKPOINT_DIR / f"journal_{environment}.jsonl"
 
 def load_checkpoint(environment):
-    """Load checkpoint for auto-resuming."""
+    """Load a JSON checkpoint written before the checkpoint journal existed."""
     checkpoint_file = CHECKPOINT_DIR / f"checkpoint_{environment}.json"
     
     if not checkpoint_file.exists():
@@ -382,17 +365,13 @@ def load_checkpoint(environment):
         logging.warning(f"Failed to load checkpoint: {str(e)}")
         return None
 
-def compare_with_test_cache(agent_uri, prod_data, test_cache_dir):
+def compare_with_test_cache(agent_uri, prod_data, test_cache):
     """Compare production data with test cache if available."""
-    test_filename = agent_uri.replace("/", "_") + ".json"
-    test_filepath = test_cache_dir / test_filename
-    
-    if not test_filepath.exists():
-        return "no_test_data", "Test cache not available for comparison"
-    
     try:
-        with open(test_filepath, "r", encoding="utf-8") as f:
-            test_data = json.load(f)
+        # The test cache manifest already knows each record's SNAC ARK, so no record is opened
+        test_entry = test_cache.manifest.get(agent_uri)
+        if test_entry is None:
+            return "no_test_data", "Test cache not available for comparison"
         
         # Compare crucial fields
         # Check if both have SNAC ARKs
@@ -409,11 +388,9 @@ def compare_with_test_cache(agent_uri, prod_data, test_cache_dir):
                 break
         
         # Check test data
-        for identifier in test_data.get('agent_record_identifiers', []):
-            if identifier.get('source') == 'snac':
-                test_has_snac = True
-                test_snac_ark = identifier.get('record_identifier')
-                break
+        if test_entry['has_snac']:
+            test_has_snac = True
+            test_snac_ark = test_entry['snac_ark']
         
         # Compare results
         if prod_has_snac and test_has_snac:
@@ -431,164 +408,304 @@ def compare_with_test_cache(agent_uri, prod_data, test_cache_dir):
     except Exception as e:
         return "error", f"Error comparing with test cache: {str(e)}"
 
-def process_agent(params):
-    """Process a single agent record for ThreadPoolExecutor."""
-    session, api_url, row, prod_cache_dir, test_cache_dir, no_update = params
-    
-    # Extract data from row
-    try:
-        # Try the primary URI first, then fallback
-        agent_uri = row['original_agent_uri_old_spreadsheet']
+# Records flow through four stages, each on its own thread pool:
+#   fetch (GET) -> transform (add ARK, compare with test) -> write (POST) -> persist (cache)
+# A record carries a dict between stages; once its 'result' is set the
+# remaining stages pass it straight through.
+
+def resolve_agent_uri(client, row):
+    """Pick and normalize the agent URI for a source row, or None if it has none."""
+    # Try the primary URI first, then fallback
+    agent_uri = row['original_agent_uri_old_spreadsheet']
+    if pd.isna(agent_uri) or not agent_uri:
+        agent_uri = row['aspace_agent_uri_final']
         if pd.isna(agent_uri) or not agent_uri:
-            agent_uri = row['aspace_agent_uri_final']
-            if pd.isna(agent_uri) or not agent_uri:
-                return {
-                    'agent_uri': None,
-                    'agent_name': row['agent_name'],
-                    'status': 'error',
-                    'message': 'No valid agent URI found'
-                }
-        
-        # Basic URI validation and cleaning
-        agent_uri = agent_uri.strip()
-        if api_url in agent_uri:
-            agent_uri = agent_uri.replace(api_url, '')
-            
-        # Ensure consistent format with leading slash
-        if not agent_uri.startswith('/'):
-            agent_uri = f"/{agent_uri}"
-        
-        snac_ark = row['snac_ark_final']
-        if pd.isna(snac_ark) or not snac_ark:
-            return {
-                'agent_uri': agent_uri,
-                'agent_name': row['agent_name'],
-                'status': 'error',
-                'message': 'No SNAC ARK found'
-            }
-        
-        # Get the agent record from ArchivesSpace
-        try:
-            agent_data = get_agent_record(session, api_url, agent_uri)
-        except Exception as e:
-            return {
-                'agent_uri': agent_uri,
-                'agent_name': row['agent_name'],
-                'status': 'error',
-                'message': f"Failed to retrieve agent: {str(e)}"
-            }
-        
-        # Check if SNAC ARK exists and add if needed
-        original_data = json.loads(json.dumps(agent_data))  # Deep copy
-        updated_data, ark_status, ark_message = add_snac_ark(agent_data, snac_ark)
-        
-        # Save original data to cache before modification
-        original_cache_path = save_to_cache(original_data, prod_cache_dir, agent_uri)
-        
-        # Compare with test cache
-        compare_status, compare_message = compare_with_test_cache(agent_uri, original_data, test_cache_dir)
-        
-        # If SNAC ARK already exists or no update requested, just return status
-        if ark_status == "skipped" or no_update:
-            return {
-                'agent_uri': agent_uri,
-                'agent_name': row['agent_name'],
-                'snac_ark': snac_ark,
-                'status': 'success' if ark_status == "skipped" else 'no_update',
-                'ark_status': ark_status,
-                'message': ark_message,
-                'cache_path': str(original_cache_path),
-                'compare_status': compare_status,
-                'compare_message': compare_message
-            }
-        
-        # Use the URI from the actual agent record if available
-        uri_from_record = original_data.get('uri', '')
-        if uri_from_record:
-            agent_uri = uri_from_record
-        
-        # Update the record in ArchivesSpace
-        updated_data_response, update_status, update_message = update_agent_record(session, api_url, agent_uri, updated_data)
+            return None
+    
+    # Basic URI validation and cleaning
+    agent_uri = agent_uri.strip()
+    if client.api_url in agent_uri:
+        agent_uri = agent_uri.replace(client.api_url, '')
         
-        if update_status == "success":
-            # Save updated data to cache after successful update
-            updated_cache_path = save_to_cache(updated_data_response, prod_cache_dir, f"{agent_uri}_updated")
-            
-            return {
-                'agent_uri': agent_uri,
-                'agent_name': row['agent_name'],
-                'snac_ark': snac_ark,
-                'status': 'success',
-                'ark_status': 'added',
-                'message': 'SNAC ARK added and record updated',
-                'cache_path': str(updated_cache_path),
-                'compare_status': compare_status,
-                'compare_message': compare_message
-            }
-        else:
-            return {
-                'agent_uri': agent_uri,
-                'agent_name': row['agent_name'],
-                'snac_ark': snac_ark,
-                'status': 'error',
-                'ark_status': 'failed',
-                'message': f"Failed to update record: {update_message}",
-                'cache_path': str(original_cache_path),
-                'compare_status': compare_status,
-                'compare_message': compare_message
-            }
+    # Ensure consistent format with leading slash
+    if not agent_uri.startswith('/'):
+        agent_uri = f"/{agent_uri}"
+    return agent_uri
+
+def job_entry(client, row):
+    """(key, payload) for a job table: keyed by canonical agent URI, or by the row itself when it has none."""
+    payload = json.loads(row.to_json())
+    return record_key(client, row, payload), payload
+
+def record_key(client, row, payload=None):
+    """Key of a source row in the job table and dead-letter store."""
+    agent_uri = resolve_agent_uri(client, row)
+    if agent_uri:
+        return canonical_agent_uri(agent_uri) or agent_uri
+    payload = payload if payload is not None else json.loads(row.to_json())
+    return f"row:{json.dumps(payload, sort_keys=True)}"
+
+def prefetch_rows(client, rows, prefetched, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Fetch the agents of rows with id_set[] requests into prefetched (agent URI -> record)."""
+    agent_uris = [resolve_agent_uri(client, row) for row in rows]
+    records, _ = fetch_agents_bulk(client, [uri for uri in agent_uris if uri], chunk_size=chunk_size)
+    prefetched.update(records)
+
+def prefetch_in_bulk(client, work_items, prefetched, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Pass work items through unchanged, first fetching each chunk's agents with id_set[] requests.
     
+    Records land in the shared prefetched dict (agent URI -> record) where fetch_stage
+    picks them up; agents the listings did not return are left for its single GET.
+    """
+    chunk = []
+    for item in work_items:
+        chunk.append(item)
+        if len(chunk) >= chunk_size:
+            prefetch_rows(client, [row for _, row in chunk], prefetched, chunk_size)
+            yield from chunk
+            chunk = []
+    if chunk:
+        prefetch_rows(client, [row for _, row in chunk], prefetched, chunk_size)
+        yield from chunk
+
+def fetch_stage(client, prefetched, ark_table, item):
+    """Stage 1: resolve the row and GET the current agent record (unless it was prefetched).
+    
+    With an ArkResolutionTable, a merged SNAC ARK is replaced by its terminal ARK.
+    """
+    position, row = item
+    record = {'position': position, 'row': row, 'agent_uri': None}
+    
+    agent_uri = resolve_agent_uri(client, row)
+    if agent_uri is None:
+        record['result'] = {
+            'agent_uri': None,
+            'agent_name': row['agent_name'],
+            'status': 'error',
+            'message': 'No valid agent URI found',
+            'error_class': 'MissingAgentURI'
+        }
+        return record
+    record['agent_uri'] = agent_uri
+    
+    snac_ark = row['snac_ark_final']
+    if pd.isna(snac_ark) or not snac_ark:
+        record['result'] = {
+            'agent_uri': agent_uri,
+            'agent_name': row['agent_name'],
+            'status': 'error',
+            'message': 'No SNAC ARK found',
+            'error_class': 'MissingSnacArk'
+        }
+        return record
+    if ark_table is not None:
+        current_ark = ark_table.current_ark(snac_ark)
+        if current_ark != snac_ark:
+            logging.info(f"{agent_uri}: {snac_ark} was merged into {current_ark}")
+            snac_ark = current_ark
+    record['snac_ark'] = snac_ark
+    
+    # Get the agent record from ArchivesSpace
+    agent_data = prefetched.pop(agent_uri, None) if prefetched is not None else None
+    if agent_data is not None:
+        record['original_data'] = agent_data
+        return record
+    try:
+        record['original_data'] = get_agent_record(client, agent_uri)
     except Exception as e:
-        agent_name = row.get('agent_name', 'Unknown')
-        return {
-            'agent_uri': agent_uri if 'agent_uri' in locals() else None,
-            'agent_name': agent_name,
+        record['result'] = {
+            'agent_uri': agent_uri,
+            'agent_name': row['agent_name'],
             'status': 'error',
-            'message': f"Unexpected error: {str(e)}"
+            'message': f"Failed to retrieve agent: {str(e)}",
+            **failure_fields(e)
         }
+    return record
 
-def process_batch(session, api_url, df_batch, prod_cache_dir, test_cache_dir, num_workers=2, no_update=False):
-    """Process a batch of agent records concurrently."""
-    results = []
+def transform_stage(test_cache, no_update, record):
+    """Stage 2: add the SNAC ARK to a copy of the record and compare with the test cache."""
+    if 'result' in record:
+        return record
     
-    with ThreadPoolExecutor(max_workers=num_workers) as executor:
-        futures = [
-            executor.submit(process_agent, (session, api_url, row, prod_cache_dir, test_cache_dir, no_update))
-            for _, row in df_batch.iterrows()
-        ]
-        
-        for future in as_completed(futures):
-            try:
-                result = future.result()
-                results.append(result)
-            except Exception as e:
-                logging.error(f"Unhandled exception in worker thread: {str(e)}")
-                results.append({
-                    'agent_uri': None,
-                    'agent_name': 'Unknown',
-                    'status': 'error',
-                    'message': f"Thread exception: {str(e)}"
-                })
+    original_data = record['original_data']
+    agent_data = json.loads(json.dumps(original_data))  # Deep copy
+    record['updated_data'], record['ark_status'], record['ark_message'] = add_snac_ark(agent_data, record['snac_ark'])
+    record['compare_status'], record['compare_message'] = compare_with_test_cache(
+        record['agent_uri'], original_data, test_cache)
     
-    return results
+    # Nothing to POST if the ARK is already there or no update was requested
+    record['needs_update'] = record['ark_status'] != "skipped" and not no_update
+    return record
+
+def write_stage(client, record):
+    """Stage 3: POST the updated record to ArchivesSpace."""
+    if 'result' in record or not record['needs_update']:
+        return record
+    
+    # Use the URI from the actual agent record if available
+    uri_from_record = record['original_data'].get('uri', '')
+    if uri_from_record:
+        record['agent_uri'] = uri_from_record
+    
+    (record['update_response'], record['update_status'], record['update_message'],
+     record['update_error']) = update_agent_record(client, record['agent_uri'], record['updated_data'])
+    return record
 
-def update_aspace_prod(config, source_df, prod_cache_dir, test_cache_dir, 
+def persist_stage(cache_writer, record):
+    """Stage 4: queue the record's cache writes and build the final result.
+    
+    Unchanged records are cached as fetched. An updated record is cached as the
+    payload we POSTed plus the lock_version the server returned, with the applied
+    patch next to it, so the cache matches the server without another GET and
+    record_patch.original_record() can still recover the pre-update record.
+    Writes go through a WriteBehindCache, so this stage never waits on disk.
+    """
+    if 'result' in record:
+        return record
+    
+    row = record['row']
+    agent_uri = record['agent_uri']
+    result = {
+        'agent_uri': agent_uri,
+        'agent_name': row['agent_name'],
+        'snac_ark': record['snac_ark'],
+        'compare_status': record['compare_status'],
+        'compare_message': record['compare_message']
+    }
+    
+    # If SNAC ARK already exists or no update requested, just return status
+    if not record['needs_update']:
+        original_cache_path = save_to_cache(record['original_data'], cache_writer, agent_uri)
+        result.update({
+            'status': 'success' if record['ark_status'] == "skipped" else 'no_update',
+            'ark_status': record['ark_status'],
+            'message': record['ark_message'],
+            'cache_path': str(original_cache_path),
+            'lock_version': record['original_data'].get('lock_version')
+        })
+        if record['ark_status'] == "skipped":
+            # The ledger should hold the ARK the record actually carries
+            result['snac_ark'] = snac_ark_of(record['original_data']) or record['snac_ark']
+    elif record['update_status'] == "success":
+        # The POST response is only a status envelope, so record what changed instead
+        patch = make_patch(record['original_data'], record['updated_data'], record['update_response'])
+        patch_cache_path = save_to_cache(patch, cache_writer, patch_key(agent_uri))
+        updated_cache_path = save_to_cache(apply_patch(record['updated_data'], patch), cache_writer, agent_uri)
+        result.update({
+            'status': 'success',
+            'ark_status': 'added',
+            'message': 'SNAC ARK added and record updated',
+            'cache_path': str(updated_cache_path),
+            'patch_path': str(patch_cache_path),
+            'lock_version': patch['lock_version']
+        })
+    else:
+        original_cache_path = save_to_cache(record['original_data'], cache_writer, agent_uri)
+        result.update({
+            'status': 'error',
+            'ark_status': 'failed',
+            'message': f"Failed to update record: {record['update_message']}",
+            'cache_path': str(original_cache_path)
+        })
+        if record.get('update_error') is not None:
+            result.update(failure_fields(record['update_error']))
+    record['result'] = result
+    return record
+
+def watchdog_timeout_result(item):
+    """Build an error record for a record the watchdog abandoned in any stage."""
+    _, row = item
+    agent_uri = row.get('original_agent_uri_old_spreadsheet')
+    if pd.isna(agent_uri) or not agent_uri:
+        agent_uri = row.get('aspace_agent_uri_final')
+    agent_uri = None if pd.isna(agent_uri) else agent_uri
+    logging.error(f"Watchdog abandoned stuck record {agent_uri} ({row.get('agent_name', 'Unknown')})")
+    return {'result': {
+        'agent_uri': agent_uri,
+        'agent_name': row.get('agent_name', 'Unknown'),
+        'status': 'error',
+        'message': 'Record stalled past its deadline and was abandoned by the watchdog',
+        'error_class': 'WatchdogTimeout'
+    }}
+
+def worker_error_result(item, e):
+    """Build an error record for a record whose stage raised."""
+    logging.error(f"Unhandled exception in worker thread: {str(e)}")
+    _, row = item
+    return {'result': {
+        'agent_uri': None,
+        'agent_name': row.get('agent_name', 'Unknown'),
+        'status': 'error',
+        'message': f"Thread exception: {str(e)}",
+        'error_class': type(e).__name__
+    }}
+
+def record_result(results, result, writer):
+    """Append a single agent result to the results stream and fold it into the running counters."""
+    writer.write(result)
+    
+    # Update status counts
+    if result['status'] == 'success':
+        results['success'] += 1
+        if result.get('ark_status') == 'added':
+            results['arks']['added'] += 1
+        elif result.get('ark_status') == 'skipped':
+            results['arks']['skipped'] += 1
+    elif result['status'] == 'no_update':
+        results['no_update'] += 1
+    else:
+        results['error'] += 1
+    
+    # Update comparison counts
+    compare_status = result.get('compare_status')
+    if compare_status:
+        if compare_status in results['comparison']:
+            results['comparison'][compare_status] += 1
+
+def update_aspace_prod(config, source_df, prod_cache, test_cache, 
                       batch_size=5, num_workers=2, test_mode=False, 
                       report_interval=10, no_update=False, environment="production",
-                      auto_resume=False, checkpoint_interval=10):
+                      auto_resume=False, checkpoint_interval=10, adaptive=False,
+                      min_concurrency=1, latency_target=2.0, breaker_threshold=0.5,
+                      breaker_cooldown=30, timeout=(10, 60), record_deadline_seconds=300,
+                      fetch_workers=None, write_workers=None, get_rate=None, post_rate=None,
+                      bulk=False, results_path=None, ledger=None, skip_enriched=True, verify_ledger=False,
+                      shard=None, jobs=None, worker_id=None, lease_seconds=DEFAULT_LEASE_SECONDS,
+                      dead_letters=None, max_attempts=DEFAULT_MAX_ATTEMPTS, ark_table=None):
     """Update ArchivesSpace PROD with SNAC ARKs.
     
     I've redesigned this function to be more configurable and safer for production use.
-    It uses smaller batch sizes (5) by default to reduce API load and be more
-    respectful of the ArchivesSpace server. The environment parameter allows
-    explicitly targeting test or production environments.
+    Records stream through fetch, transform, write and persist stages (see Stage and
+    pipeline), at most batch_size per HTTP worker at a time. The environment parameter
+    allows explicitly targeting test or production environments.
     
-    Added checkpoint support for auto-resuming interrupted runs.
+    Finished records are checkpointed for auto-resuming interrupted runs, in the
+    checkpoint journal or, with a JobTable, in the shared job table.
     """
-    session, api_url = get_aspace_session(config, environment)
+    ASPACE_BREAKER.failure_threshold = breaker_threshold
+    ASPACE_BREAKER.cooldown = breaker_cooldown
+    
+    fetch_workers = fetch_workers or num_workers
+    write_workers = write_workers or num_workers
+    http_workers = fetch_workers + write_workers
+    
+    controller = None
+    if adaptive:
+        controller = AIMDController(floor=min_concurrency, ceiling=http_workers, latency_target=latency_target)
+        logging.info(f"ADAPTIVE CONCURRENCY: {controller.floor}-{controller.ceiling} requests in flight, "
+                     f"latency target {latency_target}s")
+    
+    # GETs and POSTs draw from separate budgets so prefetching never eats into write capacity;
+    # buckets are per instance, so test and production runs never share one
+    rate_limits = aspace_rate_limits(config, api_url=determine_api_url(config, environment),
+                                     get_rate=get_rate, post_rate=post_rate)
+    
+    # Size the connection pool to the HTTP stages so every thread keeps its own connection
+    client = get_aspace_session(config, environment, pool_size=http_workers, controller=controller,
+                                timeout=timeout, rate_limits=rate_limits)
     
     # Add detailed logging about the API URL
-    logging.info(f"Using API base URL: {api_url}")
+    logging.info(f"Using API base URL: {client.api_url}")
     logging.info("IMPORTANT: Agent URIs will be combined with the base URL")
     
     # Initialize results data structure
@@ -610,24 +727,30 @@ def update_aspace_prod(config, source_df, prod_cache_dir, test_cache_dir,
             'no_test_data': 0,
             'error': 0
         },
-        'details': [],
-        'start_index': 0,
-        'processed_uris': set()
+        'results_file': str(results_path or f"src/data/update_aspace_prod_results_{timestamp}.jsonl"),
+        'resumed': 0,
+        'ledger_skipped': 0,
+        'retried': 0,
+        'dead_lettered': 0,
+        'cache_failed': 0
     }
     
-    # Check for existing checkpoint if auto-resume is enabled
-    start_index = 0
-    if auto_resume:
-        checkpoint = load_checkpoint(environment)
-        if checkpoint:
-            start_index = checkpoint.get('last_processed_index', 0) + 1
-            logging.info(f"Auto-resuming from checkpoint: starting at index {start_index}")
-            summary_logger.info(f"Auto-resuming from checkpoint: starting at index {start_index}")
-            
-            # Pre-populate processed URIs to avoid duplicates
-            if 'processed_uris' in checkpoint:
-                results['processed_uris'] = set(checkpoint['processed_uris'])
-                logging.info(f"Loaded {len(results['processed_uris'])} processed URIs from checkpoint")
+    # Shards of one run keep separate journals so they never resume each other's work;
+    # workers of a job table share the table's record of what is done instead
+    journal = None if jobs is not None else CheckpointJournal(journal_path(environment, shard))
+    done_uris = set()
+    if journal is not None and auto_resume:
+        done_uris = journal.done_uris()
+        if not done_uris:
+            # Runs from before the journal left every processed URI in a JSON checkpoint
+            checkpoint = load_checkpoint(environment)
+            if checkpoint and 'processed_uris' in checkpoint:
+                done_uris = set(checkpoint['processed_uris'])
+        logging.info(f"Auto-resuming: {len(done_uris)} records already done according to the checkpoint journal")
+    elif journal is not None:
+        rotated = journal.rotate()
+        if rotated:
+            logging.info(f"Previous checkpoint journal moved to {rotated}")
     
     # If test mode, limit to 10 records
     if test_mode:
@@ -636,129 +759,273 @@ def update_aspace_prod(config, source_df, prod_cache_dir, test_cache_dir,
     else:
         df = source_df.copy()
     
-    # Apply start index (from arguments or checkpoint)
-    if start_index > 0:
-        if start_index < len(df):
-            df = df.iloc[start_index:].reset_index(drop=True)
-            logging.info(f"Starting from index {start_index} (skipping {start_index} records)")
-        else:
-            logging.error(f"Start index {start_index} exceeds total records {len(df)}")
-            return results
+    # Pending work is the source minus what the journal says is done
+    if done_uris and len(df) > 0:
+        done = {canonical_agent_uri(uri) or uri for uri in done_uris}
+        
+        def is_pending(row):
+            agent_uri = resolve_agent_uri(client, row)
+            return agent_uri is None or (canonical_agent_uri(agent_uri) or agent_uri) not in done
+        
+        pending = [is_pending(row) for _, row in df.iterrows()]
+        results['resumed'] = len(df) - sum(pending)
+        df = df[pending].reset_index(drop=True)
+        logging.info(f"Skipping {results['resumed']} records finished in earlier runs")
+        summary_logger.info(f"Auto-resuming: skipping {results['resumed']} records finished in earlier runs")
+    
+    # Agents the ledger knows already carry an ARK need no GET at all
+    if ledger is not None and skip_enriched and len(df) > 0:
+        def enriched_uri(row):
+            agent_uri = resolve_agent_uri(client, row)
+            return agent_uri if agent_uri and ledger.is_enriched(client.api_url, agent_uri) else None
+        
+        enriched = [enriched_uri(row) for _, row in df.iterrows()]
+        if verify_ledger and any(enriched):
+            stale = stale_ledger_entries(client, ledger, {uri for uri in enriched if uri})
+            enriched = [None if uri in stale else uri for uri in enriched]
+        
+        keep = [uri is None for uri in enriched]
+        results['ledger_skipped'] = len(df) - sum(keep)
+        df = df[keep].reset_index(drop=True)
+        logging.info(f"Skipping {results['ledger_skipped']} agents the enrichment ledger lists as done")
+        summary_logger.info(f"Enrichment ledger: skipping {results['ledger_skipped']} agents that already have a SNAC ARK")
     
-    total_records = len(df)
+    if jobs is not None:
+        worker_id = worker_id or default_worker_id()
+        added = jobs.add(job_entry(client, row) for _, row in df.iterrows())
+        counts = jobs.counts()
+        logging.info(f"Job table {jobs.path}: {added} records added; {counts} (worker {worker_id})")
+        summary_logger.info(f"Job table {jobs.path}, worker {worker_id}: {added} records added")
+        total_records = counts['pending'] + counts['leased']
+        results['resumed'] = counts['done'] + counts['failed']
+    else:
+        total_records = len(df)
     results['total'] = total_records
-    results['start_index'] = start_index
+    resumed = results['resumed'] + results['ledger_skipped']
+    if total_records == 0:
+        if jobs is not None:
+            logging.info("No records left in the job table")
+        else:
+            # The journal and the enrichment ledger can leave nothing to do
+            logging.info(f"No records left to process ({resumed} already done)")
+            summary_logger.info(f"# ArchivesSpace {environment.upper()} Update - {timestamp}")
+            summary_logger.info(f"\nNo records left to process ({resumed} already done)\n")
+        return results
     
     logging.info(f"Starting ArchivesSpace {environment.upper()} update for {total_records} agent records")
     summary_logger.info(f"# ArchivesSpace {environment.upper()} Update - {timestamp}")
-    summary_logger.info(f"\nProcessing {total_records} agent records starting from index {start_index}\n")
+    if shard:
+        summary_logger.info(f"\nShard {shard[0]} of {shard[1]}")
+    summary_logger.info(f"\nProcessing {total_records} agent records ({resumed} already done)\n")
     
     if no_update:
         logging.info("NO-UPDATE MODE: Records will not be modified in ArchivesSpace")
-        logging.info("Session refreshing disabled in no-update mode to reduce API load")
         summary_logger.info("## ⚠️ NO-UPDATE MODE\nRecords will not be modified in ArchivesSpace. This is a verification run only.\n")
-        summary_logger.info("Session refreshing disabled to reduce API load on ArchivesSpace server.\n")
     else:
         logging.info("UPDATE MODE: Records will be modified in ArchivesSpace")
-        logging.info("Session refreshing occurs every 100 batches (500 records)")
         summary_logger.info("## ⚠️ UPDATE MODE\nRecords will be modified in ArchivesSpace. This is a production update run.\n")
-        summary_logger.info("Session management: Refreshing every 500 records to maintain valid sessions while minimizing API load.\n")
+    
+    logging.info("Session management: one token, re-authenticated only when ArchivesSpace reports it expired")
+    summary_logger.info("Session management: one session token per run, re-authenticated only on expiry.\n")
     
     # Create progress tracking variables
     start_time = time.time()
     last_report_time = start_time
-    last_checkpoint_time = start_time
     processed_records = 0
     
-    # Process in batches
-    for batch_num, start_idx in enumerate(range(0, total_records, batch_size)):
-        end_idx = min(start_idx + batch_size, total_records)
-        batch_df = df.iloc[start_idx:end_idx]
-        
-        logging.info(f"Processing batch {start_idx//batch_size + 1}: records {start_idx+1}-{end_idx} of {total_records}")
-        
-        # Process the batch
-        batch_results = process_batch(
-            session, api_url, batch_df, prod_cache_dir, test_cache_dir, num_workers, no_update
-        )
-        
-        # Update results and collect process URIs for checkpointing
-        processed_uris_in_batch = []
-        for result in batch_results:
-            results['details'].append(result)
-            
-            # Track processed URIs for checkpointing
-            if result.get('agent_uri'):
-                processed_uris_in_batch.append(result['agent_uri'])
-                results['processed_uris'].add(result['agent_uri'])
-            
-            # Update status counts
-            if result['status'] == 'success':
-                results['success'] += 1
-                if result.get('ark_status') == 'added':
-                    results['arks']['added'] += 1
-                elif result.get('ark_status') == 'skipped':
-                    results['arks']['skipped'] += 1
-            elif result['status'] == 'no_update':
-                results['no_update'] += 1
-            else:
-                results['error'] += 1
+    # persist_stage hands cache writes to this thread instead of writing them itself
+    cache_writer = WriteBehindCache(prod_cache)
+    results_writer = ResultsWriter(results['results_file'])
+    
+    # (position, agent URI, status) of finished records, journaled (or completed in the
+    # job table) only once their cache writes are flushed
+    finished = []
+    
+    def checkpoint():
+        try:
+            # Cached copies must be on disk before a resume can skip their records,
+            # so a record whose cache write failed is not counted as done
+            cache_writer.flush()
+            finished_jobs = []
+            for position, agent_uri, status in finished:
+                if agent_uri and (cache_writer.write_failed(agent_uri)
+                                  or cache_writer.write_failed(patch_key(agent_uri))):
+                    logging.error(f"Cache write for {agent_uri} failed; not marking it done")
+                    results['cache_failed'] += 1
+                    status = 'cache_error'
+                if jobs is not None:
+                    # A failed cache write goes back to the table rather than counting as done
+                    if status != 'cache_error' or jobs.retry(worker_id, position) is None:
+                        finished_jobs.append((position, status, status in ('error', 'cache_error')))
+                elif agent_uri:
+                    journal.record(agent_uri, status)
+            finished.clear()
+            if journal is not None:
+                journal.flush()
+            if finished_jobs:
+                lost = jobs.complete(worker_id, finished_jobs)
+                if lost:
+                    logging.warning(f"Leases on {len(lost)} records expired before they finished; "
+                                    f"another worker now holds them")
+            if ledger is not None:
+                ledger.flush()
+            if dead_letters is not None:
+                dead_letters.flush()
+            logging.debug(f"Checkpoint journal flushed ({processed_records} records)")
+        except Exception as e:
+            logging.error(f"Failed to flush checkpoint journal: {str(e)}")
+    
+    # This worker's claimed jobs that have not come out of the pipeline yet
+    jobs_in_flight = [0]
+    jobs_in_flight_lock = threading.Lock()
+    
+    prefetched = {} if bulk else None
+    
+    def prefetch_claimed(payloads):
+        prefetch_rows(client, [pd.Series(payload) for payload in payloads], prefetched)
+    
+    def claimed_jobs():
+        busy = lambda: jobs_in_flight[0] > 0
+        # With --bulk each claimed batch is prefetched as a unit, never held back waiting for
+        # a full chunk: a held job would count as in flight and keep leased_jobs polling forever
+        for job_id, payload in leased_jobs(jobs, worker_id, batch_size, lease_seconds, busy=busy,
+                                           on_claim=prefetch_claimed if bulk else None):
+            with jobs_in_flight_lock:
+                jobs_in_flight[0] += 1
+            yield job_id, pd.Series(payload)
+    
+    if jobs is not None:
+        # Positions are job ids; claims happen only as the pipeline has room for more records
+        work_items = claimed_jobs()
+        logging.info(f"JOB TABLE: claiming {batch_size} records at a time with {lease_seconds}s leases")
+        if bulk:
+            logging.info(f"BULK FETCH: each claimed batch of up to {batch_size} agents prefetched with id_set[] requests")
+    else:
+        work_items = enumerate(row for _, row in df.iterrows())
+        if bulk:
+            work_items = prefetch_in_bulk(client, work_items, prefetched)
+            logging.info(f"BULK FETCH: agents prefetched {DEFAULT_CHUNK_SIZE} per id_set[] request")
+    
+    # Job tables hold their own delayed retries; otherwise due retries are fed back in ahead of new rows
+    retry_queue = None
+    if jobs is None:
+        retry_queue = RetryQueue(max_attempts, key=lambda item: item[0])
+        work_items = retry_queue.feed(work_items)
+    
+    def within_deadline(stage_fn, *stage_args):
+        # Requests for a record in one stage share one overall deadline, and failures
+        # go back to the retry queue instead of sleeping on this thread
+        def run(value):
+            with record_deadline(record_deadline_seconds), deferred_retries():
+                return stage_fn(*stage_args, value)
+        return run
+    
+    item_timeout = record_deadline_seconds + WATCHDOG_GRACE if record_deadline_seconds else None
+    stages = [
+        Stage("fetch", within_deadline(fetch_stage, client, prefetched, ark_table), num_workers=fetch_workers,
+              item_timeout=item_timeout, on_timeout=watchdog_timeout_result),
+        Stage("transform", within_deadline(transform_stage, test_cache, no_update), num_workers=1,
+              item_timeout=item_timeout, on_timeout=watchdog_timeout_result),
+        Stage("write", within_deadline(write_stage, client), num_workers=write_workers,
+              item_timeout=item_timeout, on_timeout=watchdog_timeout_result),
+        Stage("persist", within_deadline(persist_stage, cache_writer), num_workers=2,
+              item_timeout=item_timeout, on_timeout=watchdog_timeout_result),
+    ]
+    logging.info(f"Pipeline: {fetch_workers} fetch, {write_workers} write workers, "
+                 f"up to {batch_size * http_workers} records in flight")
+    
+    try:
+        for item, record in pipeline(work_items, stages, max_in_flight=batch_size * http_workers,
+                                     on_error=worker_error_result):
+            position, row = item
+            # Sharded runs carry the source position so merged results keep the source order
+            result = with_source_index(record['result'], row)
             
-            # Update comparison counts
-            compare_status = result.get('compare_status')
-            if compare_status:
-                if compare_status in results['comparison']:
-                    results['comparison'][compare_status] += 1
-        
-        # Update progress
-        batch_size_actual = len(batch_df)
-        processed_records += batch_size_actual
-        current_time = time.time()
-        elapsed = current_time - start_time
-        
-        # Calculate real batch index accounting for start_index
-        absolute_index = start_index + start_idx + batch_size_actual - 1
-        
-        # Save checkpoint periodically
-        if batch_num % checkpoint_interval == 0 or batch_num == total_records // batch_size:
-            try:
-                checkpoint_file = save_checkpoint(
-                    environment, 
-                    absolute_index,
-                    list(results['processed_uris'])
-                )
-                logging.info(f"Checkpoint saved at index {absolute_index} ({processed_records} records)")
-                last_checkpoint_time = current_time
-            except Exception as e:
-                logging.error(f"Failed to save checkpoint: {str(e)}")
-        
-        # Report progress at regular intervals
-        if current_time - last_report_time >= report_interval:
-            records_per_second = processed_records / elapsed if elapsed > 0 else 0
-            percent_complete = processed_records / total_records * 100
+            attempts = None
+            delay = None
+            if result['status'] == 'error':
+                attempts = jobs.attempts(position) if jobs is not None else retry_queue.attempts(item)
+                if result.get('retryable'):
+                    if jobs is not None:
+                        delay = jobs.retry(worker_id, position, result.get('retry_after'))
+                    else:
+                        delay = retry_queue.schedule(item, result.get('retry_after'))
+            if jobs is not None:
+                # Only once a retry is in the table, so leased_jobs can't stop in between
+                with jobs_in_flight_lock:
+                    jobs_in_flight[0] -= 1
+            if delay is not None:
+                results['retried'] += 1
+                logging.info(f"Retrying {result.get('agent_uri')} in {delay:.1f}s after "
+                             f"{result.get('error_class')} (attempt {attempts}/{max_attempts}): "
+                             f"{result['message']}")
+                continue
+            if retry_queue is not None:
+                retry_queue.done(item)
             
-            # Estimate time remaining
-            if records_per_second > 0:
-                remaining_records = total_records - processed_records
-                time_remaining = remaining_records / records_per_second
-                eta = time.strftime("%H:%M:%S", time.gmtime(time_remaining))
-            else:
-                eta = "unknown"
+            if dead_letters is not None:
+                if result['status'] == 'error':
+                    key, payload = job_entry(client, row)
+                    dead_letters.add(client.api_url, key, payload, result.get('error_class'),
+                                     result['message'], attempts)
+                    results['dead_lettered'] += 1
+                else:
+                    dead_letters.resolve(client.api_url, record_key(client, row))
             
-            # Calculate absolute progress including skipped records from checkpoint
-            absolute_progress = start_index + processed_records
+            record_result(results, result, results_writer)
+            processed_records += 1
+            finished.append((position, result.get('agent_uri'), result['status']))
+            if ledger is not None and result['status'] == 'success' and result.get('ark_status') in ('added', 'skipped'):
+                ledger.record(client.api_url, result['agent_uri'], result['snac_ark'], result.get('lock_version'),
+                              'added' if result['ark_status'] == 'added' else 'present')
             
-            logging.info(f"Progress: {processed_records}/{total_records} records ({percent_complete:.1f}%) | "
-                        f"Absolute: {absolute_progress}/{start_index + total_records} | "
-                        f"Speed: {records_per_second:.2f} records/sec | ETA: {eta}")
+            # Save checkpoint periodically
+            if processed_records % checkpoint_interval == 0:
+                checkpoint()
             
-            last_report_time = current_time
-        
-        # Refresh session every 100 batches (500 records) to prevent timeouts, but only if actually updating
-        # This greatly reduces authentication load while still maintaining valid sessions
-        if not no_update and (batch_num + 1) % 100 == 0:
-            logging.info(f"Refreshing session after {batch_num + 1} batches (preventative maintenance)")
-            session, api_url = get_aspace_session(config, environment)
+            # Report progress at regular intervals
+            current_time = time.time()
+            if current_time - last_report_time >= report_interval:
+                elapsed = current_time - start_time
+                records_per_second = processed_records / elapsed if elapsed > 0 else 0
+                percent_complete = processed_records / total_records * 100
+                
+                # Estimate time remaining
+                if records_per_second > 0:
+                    remaining_records = total_records - processed_records
+                    time_remaining = remaining_records / records_per_second
+                    eta = time.strftime("%H:%M:%S", time.gmtime(time_remaining))
+                else:
+                    eta = "unknown"
+                
+                # Calculate absolute progress including records done in earlier runs
+                absolute_progress = resumed + processed_records
+                
+                concurrency = f" | Concurrency: {controller.limit}" if controller else ""
+                logging.info(f"Progress: {processed_records}/{total_records} records ({percent_complete:.1f}%) | "
+                            f"Absolute: {absolute_progress}/{resumed + total_records} | "
+                            f"Speed: {records_per_second:.2f} records/sec | ETA: {eta}{concurrency}")
+                
+                last_report_time = current_time
+    finally:
+        # Drain queued cache writes, then journal everything that finished, even if the run stops early
+        if retry_queue is not None:
+            retry_queue.close()
+        cache_writer.close()
+        checkpoint()
+        results_writer.close()
+        if jobs is not None:
+            # Claimed records this worker never started go straight back to the others
+            released = jobs.release(worker_id)
+            if released:
+                logging.info(f"Returned {released} unstarted records to the job table")
+    
+    if jobs is not None:
+        # Other workers share the table, so this worker's total is what it actually processed
+        total_records = results['total'] = processed_records
+        if total_records == 0:
+            logging.info("Other workers finished the remaining records")
+            return results
     
     # Calculate final statistics
     total_time = time.time() - start_time
@@ -775,7 +1042,17 @@ def update_aspace_prod(config, source_df, prod_cache_dir, test_cache_dir,
         summary_logger.info(f"- **SNAC ARKs added:** {results['arks']['added']}")
     
     summary_logger.info(f"- **SNAC ARKs already present:** {results['arks']['skipped']}")
+    if results['ledger_skipped']:
+        summary_logger.info(f"- **Skipped via enrichment ledger (no request made):** {results['ledger_skipped']}")
     summary_logger.info(f"- **Errors:** {results['error']} ({results['error']/total_records*100:.1f}%)")
+    if results['retried']:
+        summary_logger.info(f"- **Delayed retries:** {results['retried']}")
+    if dead_letters is not None and results['dead_lettered']:
+        summary_logger.info(f"- **Sent to dead-letter store:** {results['dead_lettered']} "
+                            f"(retry with --replay-dead-letters)")
+    if results['cache_failed']:
+        summary_logger.info(f"- **Cache writes failed:** {results['cache_failed']} "
+                            f"(not marked done; processed again on the next run)")
     summary_logger.info(f"- **Processing time:** {time.strftime('%H:%M:%S', time.gmtime(total_time))}")
     summary_logger.info(f"- **Processing speed:** {records_per_second:.2f} records/sec\n")
     
@@ -796,19 +1073,18 @@ def update_aspace_prod(config, source_df, prod_cache_dir, test_cache_dir,
         summary_logger.info("|-----------|------------|---------------|")
         
         error_count = 0
-        for result in results['details']:
-            if result['status'] == 'error':
-                error_count += 1
-                agent_uri = result.get('agent_uri', 'N/A')
-                agent_name = result.get('agent_name', 'Unknown').replace('|', '\\|')  # Escape pipe characters
-                message = result.get('message', 'Unknown error').replace('|', '\\|')
-                
-                summary_logger.info(f"| {agent_uri} | {agent_name} | {message} |")
-                
-                # Limit to first 20 errors in the summary
-                if error_count >= 20 and results['error'] > 20:
-                    summary_logger.info(f"\n... and {results['error'] - 20} more errors (see log file for details)")
-                    break
+        for result in iter_results(results['results_file'], status='error'):
+            error_count += 1
+            agent_uri = result.get('agent_uri', 'N/A')
+            agent_name = result.get('agent_name', 'Unknown').replace('|', '\\|')  # Escape pipe characters
+            message = result.get('message', 'Unknown error').replace('|', '\\|')
+            
+            summary_logger.info(f"| {agent_uri} | {agent_name} | {message} |")
+            
+            # Limit to first 20 errors in the summary
+            if error_count >= 20 and results['error'] > 20:
+                summary_logger.info(f"\n... and {results['error'] - 20} more errors (see log file for details)")
+                break
     
     if results['comparison']['mismatch'] > 0:
         summary_logger.info("## SNAC ARK Mismatches\n")
@@ -816,7 +1092,7 @@ def update_aspace_prod(config, source_df, prod_cache_dir, test_cache_dir,
         summary_logger.info("|-----------|------------|----------------|----------|")
         
         mismatch_count = 0
-        for result in results['details']:
+        for result in iter_results(results['results_file']):
             if result.get('compare_status') == 'mismatch':
                 mismatch_count += 1
                 agent_uri = result.get('agent_uri', 'N/A')
@@ -855,31 +1131,56 @@ def main():
     limiting the scope of updates for testing or splitting large jobs into manageable chunks.
     """
     args = parse_args()
+    prod_cache = test_cache = ledger = jobs = dead_letters = ark_table = None
     
     try:
         # Log start time
         start_time = time.time()
         logging.info(f"Starting ArchivesSpace PROD update at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
         
-        # Create cache directories
-        PROD_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        # Load configuration
+        config = load_config(CONFIG_PATH)
+        
+        # Open cache stores (JSON directories or SQLite files, per config["settings"]["cache_backend"])
+        prod_cache = open_cache_store(PROD_CACHE_DIR, config=config)
+        test_cache = open_cache_store(TEST_CACHE_DIR, config=config)
+        ledger = EnrichmentLedger()
+        dead_letters = DeadLetterStore()
+        ark_table = ArkResolutionTable()
+        ark_table.load_id_change_log()
+        
+        # Workers sharing a job table each write their own results files
+        worker_id = args.worker_id or default_worker_id()
+        results_stem = f"src/data/update_aspace_prod_results_{timestamp}"
+        if args.jobs:
+            jobs = JobTable(args.jobs, max_attempts=args.max_attempts)
+            results_stem += "_" + "".join(c if c.isalnum() else "_" for c in worker_id)
         
         # Check if test cache exists
-        if not TEST_CACHE_DIR.exists():
-            logging.warning(f"Test cache directory not found: {TEST_CACHE_DIR}")
-            logging.warning(f"Comparisons with test data will not be available")
-        elif len(list(TEST_CACHE_DIR.glob("*.json"))) == 0:
-            logging.warning(f"Test cache directory is empty: {TEST_CACHE_DIR}")
+        if test_cache.count() == 0:
+            logging.warning(f"Test cache is missing or empty: {test_cache.path}")
             logging.warning(f"Comparisons with test data will not be available")
         
-        # Load configuration
-        config = load_config(CONFIG_PATH)
+        if args.replay_dead_letters:
+            # The source rows of records that failed for good in earlier runs, instead of the CSV
+            environment_url = determine_api_url(config, args.environment).rstrip('/')
+            entries = dead_letters.entries(environment_url)
+            df = pd.DataFrame([entry['payload'] for entry in entries])
+            total_records = len(df)
+            logging.info(f"Replaying {total_records} dead-lettered records for {environment_url}")
+            if total_records == 0:
+                return 0
+        else:
+            # Load source CSV
+            logging.info(f"Loading source data from {SOURCE_CSV_PATH}")
+            df = pd.read_csv(SOURCE_CSV_PATH)
+            total_records = len(df)
+            logging.info(f"Loaded {total_records} records from source CSV")
         
-        # Load source CSV
-        logging.info(f"Loading source data from {SOURCE_CSV_PATH}")
-        df = pd.read_csv(SOURCE_CSV_PATH)
-        total_records = len(df)
-        logging.info(f"Loaded {total_records} records from source CSV")
+        # Keep only this shard's rows; every shard sees the same partition of the source
+        if args.shard:
+            df = select_shard(df, args.shard, ['original_agent_uri_old_spreadsheet', 'aspace_agent_uri_final'])
+            total_records = len(df)
         
         # Apply start index if specified
         if args.start_index > 0:
@@ -899,22 +1200,45 @@ def main():
         results = update_aspace_prod(
             config=config,
             source_df=df,
-            prod_cache_dir=PROD_CACHE_DIR,
-            test_cache_dir=TEST_CACHE_DIR,
+            prod_cache=prod_cache,
+            test_cache=test_cache,
             batch_size=args.batch_size,
             num_workers=args.workers,
             test_mode=args.test,
             report_interval=args.report_interval,
             no_update=args.no_update,
             environment=args.environment,
-            auto_resume=args.auto_resume,
-            checkpoint_interval=args.checkpoint_interval
+            # A replay must not set aside the journal of the run it is cleaning up after
+            auto_resume=args.auto_resume or args.replay_dead_letters,
+            checkpoint_interval=args.checkpoint_interval,
+            adaptive=args.adaptive,
+            min_concurrency=args.min_concurrency,
+            latency_target=args.latency_target,
+            breaker_threshold=args.breaker_threshold,
+            breaker_cooldown=args.breaker_cooldown,
+            timeout=(args.connect_timeout, args.read_timeout),
+            record_deadline_seconds=args.record_deadline,
+            fetch_workers=args.fetch_workers,
+            write_workers=args.write_workers,
+            get_rate=args.get_rate,
+            post_rate=args.post_rate,
+            bulk=args.bulk,
+            ledger=ledger,
+            skip_enriched=not args.ignore_ledger,
+            verify_ledger=args.verify_ledger,
+            results_path=sharded_path(f"{results_stem}.jsonl", args.shard),
+            shard=args.shard,
+            jobs=jobs,
+            worker_id=worker_id,
+            lease_seconds=args.lease_seconds,
+            dead_letters=dead_letters,
+            max_attempts=args.max_attempts,
+            ark_table=ark_table
         )
         
         # Save results to a CSV for further analysis
-        results_df = pd.DataFrame(results['details'])
-        results_file = f"src/data/update_aspace_prod_results_{timestamp}.csv"
-        results_df.to_csv(results_file, index=False)
+        results_file = sharded_path(f"{results_stem}.csv", args.shard)
+        results_to_csv(results['results_file'], results_file)
         logging.info(f"Results saved to {results_file}")
         
         # Calculate total runtime
@@ -927,6 +1251,12 @@ def main():
     except Exception as e:
         logging.error(f"Unhandled exception in main: {str(e)}", exc_info=True)
         return 1
+    
+    finally:
+        # Flushes any records still buffered by the SQLite backend, the ledger and the dead-letter store
+        for store in (prod_cache, test_cache, ledger, jobs, dead_letters, ark_table):
+            if store is not None:
+                store.close()
 
 if __name__ == "__main__":
     args = parse_args()
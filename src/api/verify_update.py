@@ -7,12 +7,13 @@
 
 import json
 import sys
-import requests
 from pathlib import Path
 
 # Add project root to sys.path to fix module import
 sys.path.insert(0, str(Path(__file__).parent.parent.parent))
 
+from src.api.aspace_client import ArchivesSpaceClient
+
 CONFIG_PATH = "config.json"
 
 def load_config(config_path):
@@ -20,27 +21,6 @@ def load_config(config_path):
     with open(config_path, "r", encoding="utf-8") as f:
         return json.load(f)
 
-def authenticate(api_url, username, password):
-    """Authenticate with the ArchivesSpace API and return session token."""
-    login_endpoint = f"{api_url}/users/{username}/login"
-    response = requests.post(login_endpoint, data={"password": password})
-    response.raise_for_status()
-    token = response.json().get("session")
-    if not token:
-        raise ValueError("Authentication failed: no session token returned.")
-    return token
-
-def get_agent_record(api_url, agent_uri, session_token):
-    """Retrieve the agent record from ArchivesSpace."""
-    headers = {
-        "X-ArchivesSpace-Session": session_token,
-        "Accept": "application/json"
-    }
-    url = f"{api_url}{agent_uri}"
-    response = requests.get(url, headers=headers)
-    response.raise_for_status()
-    return response.json()
-
 def main():
     """Main function to verify agent record updates."""
     # Check command line arguments
@@ -53,19 +33,16 @@ def main():
     
     # Load configuration
     config = load_config(CONFIG_PATH)
-    aspace_creds = config["credentials"]["archivesspace_api"]
-    api_url = aspace_creds["api_url"]
-    username = aspace_creds["username"]
-    password = aspace_creds["password"]
+    client = ArchivesSpaceClient.from_config(config, pool_size=1)
     
     # Authenticate with ArchivesSpace API
     print("Authenticating with ArchivesSpace API...")
-    session_token = authenticate(api_url, username, password)
+    client.ensure_authenticated()
     print("Authentication successful.")
     
     # Retrieve agent record
     print(f"Retrieving agent record for {agent_uri}...")
-    agent_data = get_agent_record(api_url, agent_uri, session_token)
+    agent_data = client.get_json(agent_uri)
     
     # Display agent identifiers
     print("\nAgent Record Identifiers:")
@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+"""
+#author = will nyarko
+#file name = work_queue.py
+#description = Long-lived worker pools fed from bounded queues, with a stuck-item watchdog and chained pipeline stages
+"""
+
+import heapq
+import itertools
+import logging
+import queue
+import threading
+import time
+
+from src.api.retry import retry_delay
+
+# Sentinel placed on the work queue to tell a worker to exit
+_STOP = object()
+
+# Pipeline value standing in for an item whose stage raised with no on_error handler
+_FAILED = object()
+
+def stream_process(items, worker_fn, num_workers=2, queue_size=None, on_error=None,
+                   item_timeout=None, on_timeout=None):
+    """
+    Run worker_fn over items on num_workers long-lived threads and yield
+    (item, result) pairs in completion order.
+
+    Items are fed through a bounded queue (queue_size, default 2 per worker) so the
+    producer never races far ahead of the workers, and a slow item only occupies its
+    own worker instead of holding back a whole batch. If worker_fn raises,
+    on_error(item, exception) supplies the result; without on_error the exception
+    is re-raised in the consuming thread.
+
+    With item_timeout set, a watchdog checks for items running longer than that.
+    A stuck item is logged and yielded with on_timeout(item) as its result, its
+    thread is abandoned (Python threads cannot be killed; whatever it eventually
+    returns is discarded) and a replacement worker is started so the queue keeps
+    moving at full width.
+
+    Closing the generator early (break, exception in the consumer) stops the
+    producer and lets workers drain and exit.
+    """
+    num_workers = max(1, int(num_workers))
+    queue_size = queue_size or num_workers * 2
+    work_queue = queue.Queue(maxsize=queue_size)
+    result_queue = queue.Queue()
+    stop_event = threading.Event()
+
+    # Watchdog bookkeeping: worker id -> (item, start time) for items in progress
+    active = {}
+    abandoned = set()
+    state_lock = threading.Lock()
+    worker_ids = itertools.count()
+
+    def put_work(item):
+        # Poll so a stopped consumer never leaves the producer blocked on a full queue
+        while not stop_event.is_set():
+            try:
+                work_queue.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def producer():
+        try:
+            for item in items:
+                if not put_work(item):
+                    break
+        finally:
+            # Let an upstream pipeline stage shut down too
+            close = getattr(items, "close", None)
+            if close:
+                close()
+            # Workers keep draining (and skipping) items after a stop, so these puts always complete
+            for _ in range(num_workers):
+                work_queue.put(_STOP)
+
+    def worker(worker_id):
+        while True:
+            item = work_queue.get()
+            if item is _STOP:
+                result_queue.put((_STOP, None, None))
+                return
+            if stop_event.is_set():
+                continue
+
+            with state_lock:
+                active[worker_id] = (item, time.monotonic())
+            try:
+                outcome = (item, worker_fn(item), None)
+            except Exception as e:
+                outcome = (item, None, e)
+
+            with state_lock:
+                if worker_id in abandoned:
+                    # The watchdog already reported this item and replaced this thread
+                    return
+                del active[worker_id]
+            result_queue.put(outcome)
+
+    def start_worker():
+        worker_id = next(worker_ids)
+        thread = threading.Thread(target=worker, args=(worker_id,),
+                                  name=f"work-queue-worker-{worker_id}", daemon=True)
+        thread.start()
+        return thread
+
+    def watchdog():
+        while not stop_event.wait(min(1.0, item_timeout / 4)):
+            now = time.monotonic()
+            with state_lock:
+                stuck = [
+                    (worker_id, item) for worker_id, (item, started) in active.items()
+                    if now - started > item_timeout
+                ]
+                for worker_id, _ in stuck:
+                    abandoned.add(worker_id)
+                    del active[worker_id]
+            for _, item in stuck:
+                logging.error(f"Watchdog: item exceeded {item_timeout}s, abandoning it and starting a replacement worker")
+                result = on_timeout(item) if on_timeout else None
+                result_queue.put((item, result, None))
+                start_worker()
+
+    threading.Thread(target=producer, name="work-queue-producer", daemon=True).start()
+    for _ in range(num_workers):
+        start_worker()
+    if item_timeout:
+        threading.Thread(target=watchdog, name="work-queue-watchdog", daemon=True).start()
+
+    try:
+        finished_workers = 0
+        while finished_workers < num_workers:
+            item, result, error = result_queue.get()
+            if item is _STOP:
+                finished_workers += 1
+                continue
+            if error is not None:
+                if on_error is None:
+                    raise error
+                result = on_error(item, error)
+            yield item, result
+    finally:
+        stop_event.set()
+
+class Stage:
+    """
+    One step of a pipeline(): worker_fn run on its own pool of num_workers threads.
+
+    worker_fn receives the previous stage's output (the first stage receives the
+    item itself). item_timeout/on_timeout work as in stream_process, with
+    on_timeout(item) called with the original pipeline item.
+    """
+
+    def __init__(self, name, worker_fn, num_workers=1, queue_size=None, item_timeout=None, on_timeout=None):
+        self.name = name
+        self.worker_fn = worker_fn
+        self.num_workers = max(1, int(num_workers))
+        self.queue_size = queue_size
+        self.item_timeout = item_timeout
+        self.on_timeout = on_timeout
+
+def pipeline(items, stages, max_in_flight=None, on_error=None):
+    """
+    Push items through a chain of Stages and yield (item, result) pairs in
+    completion order, where result is the output of the last stage.
+
+    Every stage is a stream_process pool with its own width and bounded queue, so
+    a cheap, fast stage (e.g. GETs) keeps working while a slower one (e.g. POSTs)
+    drains at its own pace. max_in_flight caps how many items may be anywhere in
+    the pipeline at once, which bounds the hand-offs between stages as well.
+
+    If a stage raises, on_error(item, exception) supplies the value handed to the
+    next stage (without on_error the exception is re-raised in the consumer), and
+    a watchdog timeout hands on stage.on_timeout(item). Later stages therefore see
+    those values too and should pass them through untouched.
+    """
+    slots = threading.Semaphore(max_in_flight) if max_in_flight else None
+    stop_event = threading.Event()
+    errors = []
+
+    def admitted():
+        for item in items:
+            if slots:
+                while not slots.acquire(timeout=0.5):
+                    if stop_event.is_set():
+                        return
+            yield item, item
+
+    def stage_worker(stage):
+        return lambda pair: pair[1] if pair[1] is _FAILED else stage.worker_fn(pair[1])
+
+    def stage_error(pair, e):
+        if on_error is None:
+            # Stage hand-offs run on producer threads; carry the error to the consumer
+            errors.append(e)
+            return _FAILED
+        return on_error(pair[0], e)
+
+    def stage_timeout(stage):
+        return lambda pair: stage.on_timeout(pair[0]) if stage.on_timeout else None
+
+    def rewrap(stream):
+        # stream_process yields ((item, input), output); the next stage wants (item, output)
+        try:
+            for (item, _), value in stream:
+                yield item, value
+        finally:
+            stream.close()
+
+    stream = admitted()
+    for stage in stages:
+        stream = rewrap(stream_process(
+            stream, stage_worker(stage), num_workers=stage.num_workers,
+            queue_size=stage.queue_size, on_error=stage_error,
+            item_timeout=stage.item_timeout, on_timeout=stage_timeout(stage)
+        ))
+
+    try:
+        for item, result in stream:
+            if result is _FAILED:
+                raise errors[0]
+            if slots:
+                slots.release()
+            yield item, result
+    finally:
+        stop_event.set()
+        stream.close()
+
+class RetryQueue:
+    """
+    Delayed retries for a pipeline, so no worker thread ever sleeps through a backoff.
+
+    feed(items) wraps the pipeline's input: it yields new items, but any retry
+    whose next-attempt time has come goes first. The consumer reports every
+    result with schedule() (try again after a backoff; None once max_attempts are
+    used up) or done(). When the input runs out, feed() waits for the pending
+    retries, and it finishes once nothing is pending or in flight.
+    """
+
+    def __init__(self, max_attempts=3, key=None):
+        self.max_attempts = max(1, int(max_attempts))
+        self.key = key or (lambda item: item)
+        self._attempts = {}
+        self._heap = []
+        self._sequence = itertools.count()
+        self._in_flight = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def attempts(self, item):
+        """Attempts made for item so far."""
+        with self._cond:
+            return self._attempts.get(self.key(item), 1)
+
+    def schedule(self, item, retry_after=None):
+        """
+        Retry item after a backoff (retry_after from the server if given). Returns
+        the delay, or None if the item has no attempts left; report it with done() then.
+        """
+        key = self.key(item)
+        with self._cond:
+            attempts = self._attempts.get(key, 1)
+            if attempts >= self.max_attempts:
+                return None
+            self._in_flight -= 1
+            delay = retry_delay(attempts - 1, retry_after)
+            self._attempts[key] = attempts + 1
+            heapq.heappush(self._heap, (time.monotonic() + delay, next(self._sequence), item))
+            self._cond.notify_all()
+            return delay
+
+    def done(self, item):
+        """item finished for good (success, or a failure that is not retried)."""
+        with self._cond:
+            self._in_flight -= 1
+            self._attempts.pop(self.key(item), None)
+            self._cond.notify_all()
+
+    def pending(self):
+        with self._cond:
+            return len(self._heap)
+
+    def close(self):
+        """Stop feed() even though retries are pending (the consumer stopped early)."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def _next_due(self):
+        with self._cond:
+            if self._heap and self._heap[0][0] <= time.monotonic():
+                self._in_flight += 1
+                return heapq.heappop(self._heap)[2]
+        return None
+
+    def feed(self, items):
+        source = iter(items)
+        exhausted = False
+        while True:
+            item = self._next_due()
+            if item is not None:
+                yield item
+                continue
+
+            if not exhausted:
+                try:
+                    item = next(source)
+                except StopIteration:
+                    exhausted = True
+                    continue
+                with self._cond:
+                    self._in_flight += 1
+                yield item
+                continue
+
+            with self._cond:
+                if self._closed or (not self._heap and self._in_flight <= 0):
+                    return
+                timeout = self._heap[0][0] - time.monotonic() if self._heap else None
+                self._cond.wait(timeout if timeout is None else max(0.0, timeout))
@@ -1,6 +1,14 @@
 # finalize_snac_arks.py
+import sys
+from pathlib import Path
+
 import pandas as pd
 
+# Add project root to sys.path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from src.api.ark_resolver import ArkResolutionTable
+
 df_master = pd.read_csv("logs/master_authorities_expanded.csv", encoding="utf-8-sig")
 
 # Create a final SNAC ARK column that points to the new ARK if merged, else the old ARK
@@ -10,6 +18,15 @@ def get_final_ark(row):
     else:
         return row["snac_ark_old"].strip() if pd.notna(row.get("snac_ark_old")) else None
 
-df_master["snac_ark_final"] = df_master.apply(get_final_ark, axis=1)
+# The ID-change log plus every redirect seen by query_snac.py; following whole merge
+# chains (A -> B -> C) through the table means no ARK is left pointing at a merged one
+with ArkResolutionTable() as ark_table:
+    ark_table.load_id_change_log()
+
+    def get_terminal_ark(row):
+        ark = get_final_ark(row)
+        return ark_table.current_ark(ark) if ark else None
+
+    df_master["snac_ark_final"] = df_master.apply(get_terminal_ark, axis=1)
 
 df_master.to_csv("logs/master_final_snac_arks.csv", index=False, encoding="utf-8-sig")
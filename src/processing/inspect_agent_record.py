@@ -6,12 +6,16 @@ Pulls a complete JSON representation of a specific agent record from ArchivesSpa
 to examine its structure and locate where external identifiers should appear.
 """
 
-import requests
 import json
 import logging
 import sys
 from pathlib import Path
 
+# Add project root to sys.path so the shared API client can be imported
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from src.api.aspace_client import ArchivesSpaceClient
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -31,32 +35,11 @@ def load_config():
         logging.error(f"Failed to load config: {e}")
         raise
 
-def authenticate(config):
-    """Authenticate with ArchivesSpace API and return session token."""
-    aspace_config = config['credentials']['archivesspace_api']
-    url = f"{aspace_config['api_url']}/users/{aspace_config['username']}/login"
-    
-    try:
-        response = requests.post(url, data={"password": aspace_config['password']})
-        response.raise_for_status()
-        return response.json()["session"]
-    except Exception as e:
-        logging.error(f"Authentication failed: {e}")
-        raise
-
-def get_agent(api_url, session_token, agent_uri):
+def get_agent(client, agent_uri):
     """Get agent record from ArchivesSpace API."""
-    headers = {'X-ArchivesSpace-Session': session_token}
-    
     try:
-        # Strip the leading slash if present
-        uri_path = agent_uri.lstrip('/')
-        url = f"{api_url}/{uri_path}"
-        
-        logging.info(f"Requesting agent record from {url}")
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-        return response.json()
+        logging.info(f"Requesting agent record from {client.url_for(agent_uri)}")
+        return client.get_json(agent_uri)
     except Exception as e:
         logging.error(f"Failed to get agent {agent_uri}: {e}")
         return None
@@ -82,12 +65,12 @@ def main():
     # Authenticate with ArchivesSpace
     aspace_config = config['credentials']['archivesspace_api']
     logging.info(f"Authenticating with ArchivesSpace API at {aspace_config['api_url']}")
-    session_token = authenticate(config)
+    client = ArchivesSpaceClient.from_config(config, pool_size=1)
+    client.ensure_authenticated()
     logging.info("Authentication successful")
     
     # Get agent data
-    api_url = aspace_config['api_url']
-    agent_data = get_agent(api_url, session_token, agent_uri)
+    agent_data = get_agent(client, agent_uri)
     
     if not agent_data:
         logging.error(f"Could not retrieve agent data for {agent_uri}")
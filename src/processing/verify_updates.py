@@ -8,15 +8,20 @@ checking through the ArchivesSpace API.
 """
 
 import pandas as pd
-import requests
 import json
 import logging
 import random
-import time
 import os
+import sys
 from pathlib import Path
 from datetime import datetime
 
+# Add project root to sys.path so the shared API client can be imported
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from src.api.aspace_client import ArchivesSpaceClient
+from src.api.rate_limit import aspace_rate_limits
+
 # Configure logging
 log_file = f"logs/verification_results_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log"
 logging.basicConfig(
@@ -37,30 +42,10 @@ def load_config():
         logging.error(f"Failed to load config: {e}")
         raise
 
-# Authenticate with ArchivesSpace API
-def authenticate(config):
-    aspace_config = config['credentials']['archivesspace_api']
-    url = f"{aspace_config['api_url']}/users/{aspace_config['username']}/login"
-    try:
-        response = requests.post(url, data={"password": aspace_config['password']})
-        response.raise_for_status()
-        return response.json()["session"]
-    except Exception as e:
-        logging.error(f"Authentication failed: {e}")
-        raise
-
 # Get agent record from ArchivesSpace
-def get_agent(api_url, session_token, agent_uri):
-    headers = {'X-ArchivesSpace-Session': session_token}
-    
+def get_agent(client, agent_uri):
     try:
-        # Strip the leading slash if present
-        uri_path = agent_uri.lstrip('/')
-        url = f"{api_url}/{uri_path}"
-        
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-        return response.json()
+        return client.get_json(agent_uri)
     except Exception as e:
         logging.error(f"Failed to get agent {agent_uri}: {e}")
         return None
@@ -117,7 +102,11 @@ def main():
     # Authenticate with ArchivesSpace
     aspace_config = config['credentials']['archivesspace_api']
     logging.info(f"Authenticating with ArchivesSpace API at {aspace_config['api_url']}")
-    session_token = authenticate(config)
+    # GETs share the ArchivesSpace budget of every running script (rate_limit.DEFAULT_RATES unless configured)
+    client = ArchivesSpaceClient.from_config(
+        config, pool_size=1, rate_limits=aspace_rate_limits(config)
+    )
+    client.ensure_authenticated()
     logging.info("Authentication successful")
     
     # Verify each record
@@ -135,7 +124,7 @@ def main():
         logging.info(f"Checking {agent_uri} (status: {update_status})")
         
         # Get agent data
-        agent_data = get_agent(config['credentials']['archivesspace_api']['api_url'], session_token, agent_uri)
+        agent_data = get_agent(client, agent_uri)
         
         # Check if SNAC ARK exists
         if has_snac_ark(agent_data, expected_ark):
@@ -148,9 +137,6 @@ def main():
         else:
             logging.error(f"❌ NOT VERIFIED: {agent_uri} does not have expected SNAC ARK: {expected_ark}")
             results['not_verified'] += 1
-        
-        # Add a small delay to avoid overloading the API
-        time.sleep(0.5)
     
     # Print summary
     logging.info("\n===== VERIFICATION SUMMARY =====")